@@ -0,0 +1,163 @@
+"""
+Structured, non-blocking application logging.
+
+Records are handed to a bounded in-memory queue on the calling thread and
+formatted and written to stdout by a ``QueueListener`` thread, so a slow log
+driver can never stall the event loop; when the queue is full, records are
+dropped and counted instead of blocking.
+
+Loggers are grouped into categories (``app.graph``, ``app.obo``, ...) whose
+levels can be set individually, chatty success lines logged with
+``extra={"sampled": True}`` are kept only at ``LOG_SAMPLE_RATE``, and bearer
+tokens, JWTs and secrets are redacted from every line before it is written.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+from typing import Optional
+
+from metrics import metric_family, register_collector
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Per-category overrides, e.g. "graph=WARNING,obo=DEBUG"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+_REDACTIONS = [
+    (re.compile(r"(?i)(bearer\s+)[A-Za-z0-9\-._~+/]+=*"), r"\1[REDACTED]"),
+    (re.compile(r"eyJ[A-Za-z0-9_-]*\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]*"), "[REDACTED_JWT]"),
+    (re.compile(r"(?i)((?:access_token|refresh_token|id_token|client_secret|assertion)[\"']?\s*[:=]\s*[\"']?)[^\"'\s,&}]+"),
+     r"\1[REDACTED]"),
+]
+
+# Attributes every LogRecord has; anything else was passed through ``extra`` and is emitted as a field
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sampled"}
+
+_queue: Optional[queue.Queue] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_dropped_records = 0
+
+
+def get_logger(category: str) -> logging.Logger:
+    """Return the logger for an application category such as "graph" or "obo" """
+    return logging.getLogger(f"app.{category}")
+
+
+def redact(text: str) -> str:
+    """Mask token material in a log line"""
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records flagged as sampled; everything else passes"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sampled", False) and record.levelno < logging.WARNING:
+            return self.rate >= 1 or random.random() < self.rate
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records rather than blocking when the queue is full"""
+
+    def enqueue(self, record: logging.LogRecord):
+        global _dropped_records
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped_records += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, level, category and any extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return redact(json.dumps(entry, default=str))
+
+
+class RedactingFormatter(logging.Formatter):
+    """Plain-text formatter that masks token material"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+def _apply_levels():
+    logging.getLogger("app").setLevel(LOG_LEVEL)
+    for override in filter(None, (part.strip() for part in LOG_LEVELS.split(","))):
+        category, _, level = override.partition("=")
+        if level:
+            get_logger(category.strip()).setLevel(level.strip().upper())
+
+
+def configure_logging():
+    """Route application logs through the queue and start the writer thread (idempotent)"""
+    global _queue, _listener
+    if _listener is not None:
+        return
+
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = RedactingFormatter("%(asctime)s %(levelname)s %(name)s %(message)s")
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    _queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(_queue)
+    # Sample before enqueueing so dropped lines cost nothing to format or write
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+
+    app_logger = logging.getLogger("app")
+    app_logger.handlers = [queue_handler]
+    app_logger.propagate = False
+    _apply_levels()
+
+    _listener = logging.handlers.QueueListener(_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+@register_collector
+def collect_logging_metrics() -> list:
+    """Export the number of log records dropped because the queue was full"""
+    return metric_family(
+        "log_records_dropped_total", "counter", "Log records dropped because the log queue was full",
+        [({}, _dropped_records)]
+    )
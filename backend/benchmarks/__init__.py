@@ -0,0 +1 @@
+"""Load and latency benchmarks run against local fake Entra ID and Microsoft Graph services."""
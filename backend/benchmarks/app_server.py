@@ -0,0 +1,54 @@
+"""
+Run the API against the fake Entra ID and Graph services.
+
+Graph, the JWKS endpoint and the token issuer are plain settings and are
+pointed at the fake services through environment variables by the runner.
+MSAL only accepts an https authority on a known host, so its HTTP client is
+replaced with a session that sends requests for login.microsoftonline.com to
+the fake Entra ID instead; everything else in MSAL runs unchanged.
+
+Started as a subprocess by ``benchmarks.run`` so its memory and CPU can be
+measured separately from the load generator.
+"""
+import argparse
+from functools import partial
+
+import msal
+import requests
+
+ENTRA_HOST_URL = "https://login.microsoftonline.com"
+
+
+class EntraRedirectSession(requests.Session):
+    """requests session that routes Entra ID calls to the fake identity provider"""
+
+    def __init__(self, target_url: str):
+        super().__init__()
+        self.target_url = target_url.rstrip("/")
+
+    def request(self, method, url, *args, **kwargs):
+        if url.startswith(ENTRA_HOST_URL):
+            url = self.target_url + url[len(ENTRA_HOST_URL):]
+        return super().request(method, url, *args, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API against fake Entra ID and Graph services")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--entra-url", required=True, help="base URL of the fake Entra ID")
+    args = parser.parse_args()
+
+    # Must happen before main is imported, since it builds its MSAL client at import time
+    msal.ConfidentialClientApplication = partial(
+        msal.ConfidentialClientApplication, http_client=EntraRedirectSession(args.entra_url)
+    )
+
+    import uvicorn
+    import main as api
+
+    uvicorn.run(api.app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,669 @@
+"""
+Local stand-ins for Microsoft Entra ID and Microsoft Graph.
+
+A single ASGI app serves the endpoints the API calls: OpenID discovery, the
+token endpoint used for OBO exchanges and the JWKS of the signing key on the
+Entra ID side, and the sites, drives, lists, pages, delta, search, download
+and ``$batch`` endpoints on the Graph side, all under ``/v1.0``. The tenant is
+synthetic and deterministic, so runs are comparable between commits.
+
+Graph latency, token endpoint latency, the fraction of requests answered with
+429 and the size of drives and downloads are configurable. Responses honour
+``$select`` and ``$expand=fields($select=...)``, carry ETags and honour
+``If-None-Match`` like Graph does.
+
+``/benchmark/tokens`` mints signed user access tokens for the load generator
+and ``/benchmark/stats`` reports how many calls each side received.
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import random
+import re
+import time
+import zipfile
+from collections import Counter
+from urllib.parse import parse_qs, unquote
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+TENANT_ID = "bench-tenant"
+CLIENT_ID = "bench-client"
+SIGNING_KEY_ID = "bench-key"
+PUBLIC_ENTRA_URL = "https://login.microsoftonline.com"
+SHAREPOINT_HOST = "contoso.sharepoint.com"
+
+_FILE_TYPES = (
+    ("txt", "text/plain"),
+    ("docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    ("pdf", "application/pdf"),
+)
+_NAME_WORDS = ("Report", "Budget", "Roadmap", "Minutes", "Proposal", "Invoice", "Design", "Summary")
+
+
+class FakeServiceConfig:
+    """Shape of the synthetic tenant and behaviour of the fake endpoints"""
+
+    def __init__(self, graph_latency_ms: float = 50, graph_jitter_ms: float = 10, token_latency_ms: float = 100,
+                 throttle_rate: float = 0.0, retry_after: float = 1.0, sites: int = 5, drives_per_site: int = 3,
+                 items_per_drive: int = 200, lists_per_site: int = 5, items_per_list: int = 50,
+                 pages_per_site: int = 10, file_kb: int = 256, seed: int = 42):
+        self.graph_latency = graph_latency_ms / 1000
+        self.graph_jitter = graph_jitter_ms / 1000
+        self.token_latency = token_latency_ms / 1000
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.sites = sites
+        self.drives_per_site = drives_per_site
+        self.items_per_drive = items_per_drive
+        self.lists_per_site = lists_per_site
+        self.items_per_list = items_per_list
+        self.pages_per_site = pages_per_site
+        self.file_kb = file_kb
+        self.seed = seed
+
+    def to_dict(self) -> dict:
+        return {
+            "graph_latency_ms": self.graph_latency * 1000,
+            "graph_jitter_ms": self.graph_jitter * 1000,
+            "token_latency_ms": self.token_latency * 1000,
+            "throttle_rate": self.throttle_rate,
+            "retry_after": self.retry_after,
+            "sites": self.sites,
+            "drives_per_site": self.drives_per_site,
+            "items_per_drive": self.items_per_drive,
+            "lists_per_site": self.lists_per_site,
+            "items_per_list": self.items_per_list,
+            "pages_per_site": self.pages_per_site,
+            "file_kb": self.file_kb,
+            "seed": self.seed
+        }
+
+
+def _timestamp(offset: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1700000000 + offset * 3600))
+
+
+def _docx_bytes(size: int) -> bytes:
+    """Build a Word document whose document.xml is roughly size bytes"""
+    paragraph = "<w:p><w:r><w:t>Benchmark paragraph with some representative body text.</w:t></w:r></w:p>"
+    body = paragraph * max(size // len(paragraph), 1)
+    document = ('<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f"<w:body>{body}</w:body></w:document>")
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("word/document.xml", document)
+    return buffer.getvalue()
+
+
+def _xlsx_bytes(size: int) -> bytes:
+    """Build a workbook whose shared strings table is roughly size bytes"""
+    strings = "".join(f"<si><t>Cell value {i}</t></si>" for i in range(max(size // 30, 1)))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(
+            "xl/sharedStrings.xml",
+            f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">{strings}</sst>'
+        )
+    return buffer.getvalue()
+
+
+class FakeTenant:
+    """Deterministic sites, drives, lists and pages served by the fake Graph"""
+
+    def __init__(self, config: FakeServiceConfig):
+        self.config = config
+        self.sites = {}
+        self.drive_items = {}
+        self.items = {}
+        self.list_items = {}
+        self.pages = {}
+
+        rng = random.Random(config.seed)
+        for s in range(config.sites):
+            site_id = f"{SHAREPOINT_HOST},site-{s},web-{s}"
+            self.sites[site_id] = {
+                "id": site_id,
+                "name": f"site{s}",
+                "displayName": "Communication site" if s == 0 else f"Team Site {s}",
+                "description": f"Synthetic site {s}",
+                "webUrl": f"https://{SHAREPOINT_HOST}" + ("" if s == 0 else f"/sites/site{s}"),
+                "createdDateTime": _timestamp(s),
+                "lastModifiedDateTime": _timestamp(s + 100)
+            }
+            self._build_drives(site_id, s, rng)
+            self._build_lists(site_id, s)
+            self._build_pages(site_id, s)
+        self.root_site_id = next(iter(self.sites))
+
+        size = config.file_kb * 1024
+        self.content = {
+            "txt": (b"Benchmark text content line.\n" * (size // 29 + 1))[:size],
+            "docx": _docx_bytes(size),
+            "xlsx": _xlsx_bytes(size),
+            "pdf": b"%PDF-1.4\n" + b"0" * size
+        }
+
+    def _build_drives(self, site_id: str, s: int, rng: random.Random):
+        drives = []
+        for d in range(self.config.drives_per_site):
+            drive_id = f"b!drive-{s}-{d}"
+            drive_name = "Documents" if d == 0 else f"Library {d}"
+            drives.append({
+                "id": drive_id,
+                "name": drive_name,
+                "driveType": "documentLibrary",
+                "webUrl": f"{self.sites[site_id]['webUrl']}/{drive_name.replace(' ', '')}",
+                "createdDateTime": _timestamp(d)
+            })
+            items = []
+            for i in range(self.config.items_per_drive):
+                extension, mime_type = _FILE_TYPES[i % len(_FILE_TYPES)]
+                item_id = f"item-{s}-{d}-{i}"
+                item = {
+                    "id": item_id,
+                    "name": f"{rng.choice(_NAME_WORDS)} {i:05d}.{extension}",
+                    "size": self.config.file_kb * 1024,
+                    "cTag": f'"c:{{{item_id}}},1"',
+                    "eTag": f'"{{{item_id}}},1"',
+                    "file": {"mimeType": mime_type},
+                    "lastModifiedDateTime": _timestamp(rng.randrange(10000)),
+                    "webUrl": f"https://{SHAREPOINT_HOST}/{drive_name.replace(' ', '')}/{item_id}.{extension}",
+                    "parentReference": {"driveId": drive_id, "id": f"root-{s}-{d}"}
+                }
+                items.append(item)
+                self.items[item_id] = (site_id, extension, item)
+            self.drive_items[drive_id] = items
+        self.sites[site_id]["_drives"] = drives
+
+    def _build_lists(self, site_id: str, s: int):
+        lists = []
+        for l in range(self.config.lists_per_site):
+            list_id = f"list-{s}-{l}"
+            lists.append({
+                "id": list_id,
+                "name": f"List{l}",
+                "displayName": f"List {l}",
+                "list": {"template": "genericList", "hidden": False},
+                "createdDateTime": _timestamp(l)
+            })
+            self.list_items[list_id] = [
+                {
+                    "id": str(i + 1),
+                    "createdDateTime": _timestamp(i),
+                    "lastModifiedDateTime": _timestamp(i + 1),
+                    "fields": {"Title": f"Item {i + 1}", "Status": "Active", "Owner": f"user{i % 7}"}
+                }
+                for i in range(self.config.items_per_list)
+            ]
+        self.sites[site_id]["_lists"] = lists
+
+    def _build_pages(self, site_id: str, s: int):
+        pages = []
+        for p in range(self.config.pages_per_site):
+            page_id = f"page-{s}-{p}"
+            pages.append({
+                "id": page_id,
+                "name": f"Page{p}.aspx",
+                "title": f"Page {p}",
+                "webUrl": f"{self.sites[site_id]['webUrl']}/SitePages/Page{p}.aspx",
+                "lastModifiedDateTime": _timestamp(p),
+                "fields": {"Title": f"Page {p}", "FileLeafRef": f"Page{p}.aspx",
+                           "Created": _timestamp(p), "Modified": _timestamp(p + 1)}
+            })
+            self.pages[page_id] = {"value": [
+                {"id": f"wp-{p}-{w}", "@odata.type": "#microsoft.graph.textWebPart",
+                 "innerHtml": f"<p>Web part {w} of page {p}. " + "Lorem ipsum dolor sit amet. " * 20 + "</p>"}
+                for w in range(5)
+            ]}
+        self.sites[site_id]["_pages"] = pages
+
+    def public_site(self, site_id: str) -> dict:
+        return {key: value for key, value in self.sites[site_id].items() if not key.startswith("_")}
+
+
+def _json_body(data) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def _etag(body: bytes) -> str:
+    return 'W/"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+
+
+def _graph_error(status: int, code: str, message: str) -> tuple:
+    return status, {"error": {"code": code, "message": message}}
+
+
+def _with_download_url(item: dict, url: str) -> dict:
+    """Add a pre-authenticated download URL to a file, pointing back at this server outside /v1.0"""
+    if "file" not in item:
+        return item
+    return {**item, "@microsoft.graph.downloadUrl": f"{url.split('/v1.0', 1)[0]}/benchmark/download/{item['id']}"}
+
+
+def _page(items: list, query: dict, url: str, default_top: int = 200) -> dict:
+    """Slice a collection with $top/$skiptoken and add an @odata.nextLink like Graph"""
+    top = min(int(query.get("$top", default_top)), 999)
+    skip = int(query.get("$skiptoken", 0))
+    page = {"value": items[skip:skip + top]}
+    if skip + top < len(items):
+        params = {**query, "$top": top, "$skiptoken": skip + top}
+        page["@odata.nextLink"] = url.split("?", 1)[0] + "?" + "&".join(f"{key}={value}" for key, value in params.items())
+    return page
+
+
+_EXPAND_COLUMNS = re.compile(r"fields\(\$select=([^)]*)\)")
+
+
+def _project(data: dict, query: dict) -> dict:
+    """Apply $select and $expand=fields($select=...) to a resource or collection like Graph"""
+    select = set(query["$select"].split(",")) if "$select" in query else None
+    match = _EXPAND_COLUMNS.search(query.get("$expand", ""))
+    columns = set(match.group(1).split(",")) if match else None
+    if select is None and columns is None:
+        return data
+
+    def trim(resource: dict) -> dict:
+        if select is not None:
+            resource = {key: value for key, value in resource.items() if key in select or key == "fields"}
+        if columns is not None and "fields" in resource:
+            resource = {**resource, "fields": {key: value for key, value in resource["fields"].items() if key in columns}}
+        return resource
+
+    if "value" in data:
+        return {**data, "value": [trim(resource) for resource in data["value"]]}
+    return trim(data)
+
+
+class FakeServices:
+    """ASGI app serving the fake Entra ID and Graph endpoints"""
+
+    def __init__(self, config: FakeServiceConfig):
+        self.config = config
+        self.tenant = FakeTenant(config)
+        self.calls = Counter()
+        self._rng = random.Random(config.seed)
+        self._body_cache = {}
+        self._signing_keys = {}
+        self.add_signing_key(SIGNING_KEY_ID)
+        self._graph_routes = [
+            (re.compile(r"^/me$"), self._me),
+            (re.compile(r"^/me/followedSites$"), self._followed_sites),
+            (re.compile(r"^/me/drive/recent$"), self._recent),
+            (re.compile(r"^/me/insights/used$"), self._recent),
+            (re.compile(r"^/sites/root$"), lambda m, q, u: (200, self.tenant.public_site(self.tenant.root_site_id))),
+            (re.compile(r"^/sites/([^/]+)$"), self._site),
+            (re.compile(r"^/sites/([^/]+)/sites$"), lambda m, q, u: (200, {"value": []})),
+            (re.compile(r"^/sites/([^/]+)/drives$"), self._site_drives),
+            (re.compile(r"^/sites/([^/]+)/drives/([^/]+)/root/children$"), self._site_drive_children),
+            (re.compile(r"^/sites/([^/]+)/drives/([^/]+)/root/search\(q='(.*)'\)$"), self._site_drive_search),
+            (re.compile(r"^/drives/([^/]+)/root/children$"), self._drive_children),
+            (re.compile(r"^/drives/([^/]+)/root/search\(q='(.*)'\)$"), self._drive_search),
+            (re.compile(r"^/drives/([^/]+)/root/delta$"), self._delta),
+            (re.compile(r"^/drives/([^/]+)/items/([^/]+)$"), self._item),
+            (re.compile(r"^/sites/([^/]+)/drive/items/([^/]+)$"), self._item),
+            (re.compile(r"^/sites/([^/]+)/lists$"), self._lists),
+            (re.compile(r"^/sites/([^/]+)/lists/SitePages/items$"), self._site_pages_items),
+            (re.compile(r"^/sites/([^/]+)/lists/([^/]+)/items$"), self._list_items),
+            (re.compile(r"^/sites/([^/]+)/pages$"), self._pages),
+            (re.compile(r"^/sites/([^/]+)/pages/([^/]+)/webParts$"), self._web_parts),
+        ]
+
+    # Entra ID
+
+    def add_signing_key(self, key_id: str):
+        """Publish a new RSA signing key in the JWKS (e.g. to simulate key rotation) and return it"""
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._signing_keys[key_id] = private_key
+        jwks = []
+        for kid, key in self._signing_keys.items():
+            jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+            jwk.update(kid=kid, use="sig", alg="RS256")
+            jwks.append(jwk)
+        self._jwks = _json_body({"keys": jwks})
+        return private_key
+
+    def sign_token(self, claims: dict, key_id: str = SIGNING_KEY_ID) -> str:
+        """Sign arbitrary claims with a published key, as Entra ID would"""
+        return jwt.encode(claims, self._signing_keys[key_id], algorithm="RS256", headers={"kid": key_id})
+
+    def user_claims(self, user: int, lifetime: int = 86400) -> dict:
+        """Claims of a v2.0 access token for the API issued to a benchmark user"""
+        now = int(time.time())
+        return {
+            "aud": f"api://{CLIENT_ID}",
+            "iss": f"{PUBLIC_ENTRA_URL}/{TENANT_ID}/v2.0",
+            "tid": TENANT_ID,
+            "oid": f"00000000-0000-0000-0000-{user:012d}",
+            "sub": f"bench-user-{user}",
+            "upn": f"user{user}@contoso.example",
+            "name": f"Benchmark User {user}",
+            "scp": "access_as_user",
+            "ver": "2.0",
+            "iat": now,
+            "nbf": now,
+            "exp": now + lifetime
+        }
+
+    def mint_user_token(self, user: int, lifetime: int = 86400) -> str:
+        return self.sign_token(self.user_claims(user, lifetime))
+
+    def _openid_configuration(self, tenant: str) -> dict:
+        base = f"{PUBLIC_ENTRA_URL}/{tenant}"
+        return {
+            "issuer": f"{base}/v2.0",
+            "authorization_endpoint": f"{base}/oauth2/v2.0/authorize",
+            "token_endpoint": f"{base}/oauth2/v2.0/token",
+            "jwks_uri": f"{base}/discovery/v2.0/keys"
+        }
+
+    async def _token(self, body: bytes) -> tuple:
+        form = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        await asyncio.sleep(self.config.token_latency)
+        if not form.get("assertion"):
+            return 400, {"error": "invalid_request", "error_description": "AADSTS900144: assertion is missing"}
+        digest = hashlib.sha256((form["assertion"] + form.get("scope", "")).encode()).hexdigest()
+        return 200, {
+            "token_type": "Bearer",
+            "scope": form.get("scope", ""),
+            "expires_in": 3599,
+            "ext_expires_in": 3599,
+            "access_token": f"graph.{digest}"
+        }
+
+    # Graph
+
+    def _me(self, match, query, url):
+        return 200, {"id": "bench-user", "displayName": "Benchmark User", "mail": "user@contoso.example",
+                     "userPrincipalName": "user@contoso.example", "jobTitle": "Tester", "officeLocation": "Lab"}
+
+    def _followed_sites(self, match, query, url):
+        return 200, {"value": [self.tenant.public_site(site_id) for site_id in list(self.tenant.sites)[1:]]}
+
+    def _recent(self, match, query, url):
+        recent = sorted((item for _, _, item in self.tenant.items.values()),
+                        key=lambda item: item["lastModifiedDateTime"], reverse=True)[:50]
+        return 200, {"value": recent}
+
+    def _site(self, match, query, url):
+        site_id = match.group(1)
+        if site_id not in self.tenant.sites:
+            return _graph_error(404, "itemNotFound", "Requested site could not be found")
+        return 200, self.tenant.public_site(site_id)
+
+    def _site_drives(self, match, query, url):
+        site = self.tenant.sites.get(match.group(1))
+        if site is None:
+            return _graph_error(404, "itemNotFound", "Requested site could not be found")
+        return 200, {"value": site["_drives"]}
+
+    def _children(self, drive_id, query, url):
+        items = self.tenant.drive_items.get(drive_id)
+        if items is None:
+            return _graph_error(404, "itemNotFound", "The resource could not be found.")
+        return 200, _page(items, query, url)
+
+    def _site_drive_children(self, match, query, url):
+        return self._children(match.group(2), query, url)
+
+    def _drive_children(self, match, query, url):
+        return self._children(match.group(1), query, url)
+
+    def _search(self, drive_id, term, url):
+        items = self.tenant.drive_items.get(drive_id)
+        if items is None:
+            return _graph_error(404, "itemNotFound", "The resource could not be found.")
+        term = term.casefold()
+        matches = [item for item in items if term in item["name"].casefold()][:200]
+        return 200, {"value": [_with_download_url(item, url) for item in matches]}
+
+    def _site_drive_search(self, match, query, url):
+        return self._search(match.group(2), match.group(3), url)
+
+    def _drive_search(self, match, query, url):
+        return self._search(match.group(1), match.group(2), url)
+
+    def _delta(self, match, query, url):
+        drive_id = match.group(1)
+        items = self.tenant.drive_items.get(drive_id)
+        if items is None:
+            return _graph_error(404, "itemNotFound", "The resource could not be found.")
+        base = url.split("?", 1)[0]
+        if "token" in query:
+            # Nothing changes in the synthetic tenant, so incremental rounds are empty
+            return 200, {"value": [], "@odata.deltaLink": f"{base}?token=latest"}
+
+        root = {"id": items[0]["parentReference"]["id"] if items else f"root-{drive_id}", "name": "root",
+                "root": {}, "folder": {"childCount": len(items)}}
+        page = _page([root] + items, query, url, default_top=500)
+        if "@odata.nextLink" not in page:
+            page["@odata.deltaLink"] = f"{base}?token=latest"
+        return 200, page
+
+    def _item(self, match, query, url):
+        entry = self.tenant.items.get(match.group(2))
+        if entry is None:
+            return _graph_error(404, "itemNotFound", "The resource could not be found.")
+        _, _, item = entry
+        return 200, _with_download_url(item, url)
+
+    def _lists(self, match, query, url):
+        site = self.tenant.sites.get(match.group(1))
+        if site is None:
+            return _graph_error(404, "itemNotFound", "Requested site could not be found")
+        return 200, {"value": site["_lists"]}
+
+    def _list_items(self, match, query, url):
+        items = self.tenant.list_items.get(match.group(2))
+        if items is None:
+            return _graph_error(404, "itemNotFound", "The list could not be found.")
+        return 200, _page(items, query, url)
+
+    def _pages(self, match, query, url):
+        site = self.tenant.sites.get(match.group(1))
+        if site is None:
+            return _graph_error(404, "itemNotFound", "Requested site could not be found")
+        return 200, {"value": [{k: v for k, v in page.items() if k != "fields"} for page in site["_pages"]]}
+
+    def _site_pages_items(self, match, query, url):
+        site = self.tenant.sites.get(match.group(1))
+        if site is None:
+            return _graph_error(404, "itemNotFound", "Requested site could not be found")
+        items = [{"id": page["id"], "fields": page["fields"]} for page in site["_pages"]]
+        return 200, _page(items, query, url)
+
+    def _web_parts(self, match, query, url):
+        web_parts = self.tenant.pages.get(match.group(2))
+        if web_parts is None:
+            return _graph_error(404, "itemNotFound", "The page could not be found.")
+        return 200, web_parts
+
+    def _throttled(self) -> bool:
+        return self.config.throttle_rate > 0 and self._rng.random() < self.config.throttle_rate
+
+    def graph_response(self, path_and_query: str, base_url: str, if_none_match: str = None) -> tuple:
+        """Answer one Graph GET (directly or inside $batch) as (status, headers, body bytes)"""
+        if self._throttled():
+            self.calls["graph_throttled"] += 1
+            status, data = _graph_error(429, "TooManyRequests", "Too many requests")
+            return status, {"Retry-After": f"{self.config.retry_after:g}"}, _json_body(data)
+
+        path, _, query_string = unquote(path_and_query).partition("?")
+        query = {key: values[0] for key, values in parse_qs(query_string).items()}
+        url = f"{base_url}/v1.0{path_and_query}"
+
+        cache_key = (path_and_query, base_url)
+        cached = self._body_cache.get(cache_key)
+        if cached is None:
+            status, data = _graph_error(400, "invalidRequest", f"Unsupported benchmark route {path}")
+            for pattern, handler in self._graph_routes:
+                match = pattern.match(path)
+                if match:
+                    status, data = handler(match, query, url)
+                    if status == 200:
+                        data = _project(data, query)
+                    break
+            body = _json_body(data)
+            cached = self._body_cache[cache_key] = (status, body, _etag(body))
+
+        status, body, etag = cached
+        if status == 200 and if_none_match == etag:
+            return 304, {"ETag": etag}, b""
+        return status, ({"ETag": etag} if status == 200 else {}), body
+
+    async def _batch(self, body: bytes, base_url: str) -> tuple:
+        responses = []
+        for sub_request in json.loads(body).get("requests", []):
+            status, headers, sub_body = self.graph_response(
+                sub_request["url"], base_url, (sub_request.get("headers") or {}).get("If-None-Match")
+            )
+            response = {"id": sub_request["id"], "status": status, "headers": headers}
+            if sub_body:
+                response["body"] = json.loads(sub_body)
+            responses.append(response)
+        # Graph does not return batch responses in request order
+        self._rng.shuffle(responses)
+        return 200, {"responses": responses}
+
+    # ASGI plumbing
+
+    async def __call__(self, scope, receive, send):
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        body = b""
+        more = True
+        while more:
+            message = await receive()
+            body += message.get("body", b"")
+            more = message.get("more_body", False)
+
+        base_url = f"{scope['scheme']}://{headers.get('host', 'localhost')}"
+        path = scope["path"]
+        query_string = scope["query_string"].decode("latin-1")
+        status, response_headers, response_body = await self._dispatch(
+            scope["method"], path, query_string, headers, body, base_url
+        )
+
+        raw_headers = [(b"content-length", str(len(response_body)).encode())]
+        if response_body and "content-type" not in response_headers:
+            raw_headers.append((b"content-type", b"application/json"))
+        raw_headers.extend((key.lower().encode(), str(value).encode()) for key, value in response_headers.items())
+        await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": response_body})
+
+    async def _dispatch(self, method: str, path: str, query_string: str, headers: dict, body: bytes,
+                        base_url: str) -> tuple:
+        if path.startswith("/v1.0/"):
+            self.calls["graph"] += 1
+            if "authorization" not in headers:
+                return 401, {}, _json_body(_graph_error(401, "InvalidAuthenticationToken", "Access token is empty.")[1])
+            await asyncio.sleep(self.config.graph_latency + self._rng.uniform(0, self.config.graph_jitter))
+            graph_path = path[len("/v1.0"):]
+            if method == "POST" and graph_path == "/$batch":
+                self.calls["graph_batch"] += 1
+                status, data = await self._batch(body, base_url)
+                return status, {}, _json_body(data)
+            return self.graph_response(
+                graph_path + (f"?{query_string}" if query_string else ""), base_url, headers.get("if-none-match")
+            )
+
+        if path.startswith("/benchmark/download/"):
+            self.calls["download"] += 1
+            entry = self.tenant.items.get(path.rsplit("/", 1)[1])
+            if entry is None:
+                return 404, {}, b""
+            await asyncio.sleep(self.config.graph_latency)
+            return 200, {"content-type": "application/octet-stream"}, self.tenant.content[entry[1]]
+
+        if path.endswith("/oauth2/v2.0/token") and method == "POST":
+            self.calls["token"] += 1
+            status, data = await self._token(body)
+            return status, {}, _json_body(data)
+
+        if path.endswith("/discovery/v2.0/keys"):
+            self.calls["jwks"] += 1
+            return 200, {}, self._jwks
+
+        if path.endswith("/v2.0/.well-known/openid-configuration"):
+            self.calls["openid_configuration"] += 1
+            return 200, {}, _json_body(self._openid_configuration(path.strip("/").split("/")[0]))
+
+        if path == "/benchmark/tokens":
+            query = parse_qs(query_string)
+            count = int(query.get("count", ["1"])[0])
+            return 200, {}, _json_body({"tokens": [self.mint_user_token(user) for user in range(count)]})
+
+        if path == "/benchmark/stats":
+            return 200, {}, _json_body({"calls": dict(self.calls), "config": self.config.to_dict()})
+
+        if path == "/benchmark/health":
+            return 200, {}, _json_body({"status": "ok"})
+
+        return 404, {}, _json_body({"error": "not_found", "path": path})
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """Options shaping the fake tenant, shared with the benchmark runner"""
+    defaults = FakeServiceConfig()
+    group = parser.add_argument_group("fake Entra ID / Graph")
+    group.add_argument("--graph-latency-ms", type=float, default=defaults.graph_latency * 1000)
+    group.add_argument("--graph-jitter-ms", type=float, default=defaults.graph_jitter * 1000)
+    group.add_argument("--token-latency-ms", type=float, default=defaults.token_latency * 1000)
+    group.add_argument("--throttle-rate", type=float, default=defaults.throttle_rate,
+                       help="fraction of Graph requests answered with 429")
+    group.add_argument("--retry-after", type=float, default=defaults.retry_after,
+                       help="Retry-After seconds sent with 429 responses")
+    group.add_argument("--sites", type=int, default=defaults.sites)
+    group.add_argument("--drives-per-site", type=int, default=defaults.drives_per_site)
+    group.add_argument("--items-per-drive", type=int, default=defaults.items_per_drive)
+    group.add_argument("--lists-per-site", type=int, default=defaults.lists_per_site)
+    group.add_argument("--items-per-list", type=int, default=defaults.items_per_list)
+    group.add_argument("--pages-per-site", type=int, default=defaults.pages_per_site)
+    group.add_argument("--file-kb", type=int, default=defaults.file_kb, help="size of downloadable files")
+    group.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def config_from_arguments(args: argparse.Namespace) -> FakeServiceConfig:
+    return FakeServiceConfig(
+        graph_latency_ms=args.graph_latency_ms,
+        graph_jitter_ms=args.graph_jitter_ms,
+        token_latency_ms=args.token_latency_ms,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        sites=args.sites,
+        drives_per_site=args.drives_per_site,
+        items_per_drive=args.items_per_drive,
+        lists_per_site=args.lists_per_site,
+        items_per_list=args.items_per_list,
+        pages_per_site=args.pages_per_site,
+        file_kb=args.file_kb,
+        seed=args.seed
+    )
+
+
+def config_to_arguments(config: FakeServiceConfig) -> list:
+    """Command-line form of a config, for starting the fake services in a subprocess"""
+    arguments = []
+    for key, value in config.to_dict().items():
+        arguments += [f"--{key.replace('_', '-')}", str(value)]
+    return arguments
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Entra ID and Microsoft Graph for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    uvicorn.run(FakeServices(config_from_arguments(args)), host=args.host, port=args.port,
+                log_level="warning", access_log=False, lifespan="off")
+
+
+if __name__ == "__main__":
+    main()
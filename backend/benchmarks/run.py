@@ -0,0 +1,432 @@
+"""
+Load and latency benchmark for the API.
+
+Starts the fake Entra ID / Graph services and the API as separate processes,
+then drives the selected ``/api/*`` scenarios with a closed-loop load
+generator at each requested concurrency. For every scenario it records
+throughput, latency percentiles, error counts, the number of Graph calls made
+per request and the API process's peak and final RSS, and writes the results
+as JSON together with the commit they were measured on.
+
+Usage (from the backend directory)::
+
+    python -m benchmarks.run --concurrency 1,16,64 --duration 10
+    python -m benchmarks.run --scenarios libraries,file_docx --graph-latency-ms 120 --throttle-rate 0.05
+    python -m benchmarks.run --compare benchmarks/results/baseline.json --max-regression 10
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+from benchmarks.fake_services import (
+    CLIENT_ID,
+    SHAREPOINT_HOST,
+    TENANT_ID,
+    add_config_arguments,
+    config_from_arguments,
+    config_to_arguments
+)
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+ROOT_SITE_ID = f"{SHAREPOINT_HOST},site-0,web-0"
+
+# Scenario name -> (path, query parameters); file and page IDs refer to the fake tenant
+SCENARIOS = {
+    "user": ("/api/user", {}),
+    "debug_token": ("/api/debug/token", {}),
+    "graph_user": ("/api/graph/user", {}),
+    "sites": ("/api/sharepoint/sites", {}),
+    "libraries": ("/api/sharepoint/libraries", {}),
+    "libraries_search": ("/api/sharepoint/libraries", {"search_name": "report"}),
+    "libraries_stream": ("/api/sharepoint/libraries", {"stream": "ndjson"}),
+    "lists": ("/api/sharepoint/lists", {}),
+    "lists_stream": ("/api/sharepoint/lists", {"stream": "ndjson"}),
+    "pages": ("/api/sharepoint/pages", {}),
+    "navigation": ("/api/sharepoint/navigation", {}),
+    "recent": ("/api/sharepoint/recent", {}),
+    "recent_site": ("/api/sharepoint/recent", {"site_id": ROOT_SITE_ID}),
+    "file_list": ("/api/sharepoint/file-content", {}),
+    "file_search": ("/api/sharepoint/file-content", {"search_name": "budget"}),
+    "file_list_stream": ("/api/sharepoint/file-content", {"stream": "ndjson"}),
+    "file_text": ("/api/sharepoint/file-content", {"file_id": "item-0-0-0"}),
+    "file_docx": ("/api/sharepoint/file-content", {"file_id": "item-0-0-1"}),
+    "file_xlsx": ("/api/sharepoint/file-content", {"file_id": "item-0-0-2"}),
+    "page_list": ("/api/sharepoint/page-content", {}),
+    "page_content": ("/api/sharepoint/page-content", {"page_id": "page-0-0"}),
+    "dashboard": ("/api/dashboard", {}),
+    "debug_cache": ("/api/debug/cache", {}),
+    "debug_graph": ("/api/debug/graph", {}),
+}
+
+# Settings applied to the API under test unless overridden with --app-env
+DEFAULT_APP_ENV = {
+    "LOG_LEVEL": "WARNING",
+    "TRACE_EXPORTER": "none",
+    # Client-side Graph pacing would cap throughput at the configured tenant rate
+    "GRAPH_TENANT_RATE": "0",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: list, pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def read_memory(pid: int) -> dict:
+    """Current and peak resident set size of a process in MB (Linux only)"""
+    memory = {"rss_mb": None, "peak_rss_mb": None}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    memory["rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+                elif line.startswith("VmHWM:"):
+                    memory["peak_rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return memory
+
+
+def reset_peak_memory(pid: int):
+    """Reset the peak RSS counter so each scenario reports its own peak (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def read_cpu_seconds(pid: int) -> Optional[float]:
+    """User plus system CPU time consumed by a process (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def git_revision() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=30).stdout.strip()
+
+    try:
+        return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--", "."))}
+    except (OSError, subprocess.SubprocessError):
+        return {"commit": None, "dirty": None}
+
+
+class ManagedProcess:
+    """A benchmark service subprocess that is waited on until healthy and always terminated"""
+
+    def __init__(self, name: str, args: list, env: dict, health_url: str, log_path: Path):
+        self.name = name
+        self.args = args
+        self.env = env
+        self.health_url = health_url
+        self.log_path = log_path
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    async def start(self, timeout: float = 30):
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.log_path, "wb") as log:
+            self.process = subprocess.Popen(
+                [sys.executable, "-m", *self.args], cwd=BACKEND_DIR, env=self.env,
+                stdout=log, stderr=subprocess.STDOUT
+            )
+
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient(timeout=2) as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    break
+                try:
+                    if (await client.get(self.health_url)).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"{self.name} did not become healthy, see {self.log_path}")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+async def run_load(client: httpx.AsyncClient, base_url: str, scenario: str, tokens: list,
+                   concurrency: int, duration: float) -> dict:
+    """Closed-loop load: each worker sends its next request as soon as the previous one completes"""
+    path, params = SCENARIOS[scenario]
+    url = base_url + path
+    latencies = []
+    statuses = Counter()
+    transport_errors = Counter()
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id: int):
+        sent = 0
+        while time.perf_counter() < deadline:
+            token = tokens[(worker_id + sent * concurrency) % len(tokens)]
+            sent += 1
+            start = time.perf_counter()
+            try:
+                response = await client.get(url, params=params, headers={"Authorization": f"Bearer {token}"})
+            except httpx.TransportError as e:
+                transport_errors[type(e).__name__] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(worker_id) for worker_id in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    completed = len(latencies)
+    errors = sum(count for status, count in statuses.items() if status >= 400) + sum(transport_errors.values())
+    return {
+        "requests": completed,
+        "errors": errors,
+        "status_codes": {str(status): count for status, count in sorted(statuses.items())},
+        "transport_errors": dict(transport_errors),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / completed * 1000, 2) if completed else None,
+            "p50": _ms(percentile(latencies, 50)),
+            "p95": _ms(percentile(latencies, 95)),
+            "p99": _ms(percentile(latencies, 99)),
+            "max": _ms(latencies[-1] if latencies else None)
+        }
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+async def fake_service_calls(client: httpx.AsyncClient, fake_url: str) -> Counter:
+    return Counter((await client.get(f"{fake_url}/benchmark/stats")).json()["calls"])
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    config = config_from_arguments(args)
+    fake_port, app_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    log_dir = Path(args.log_dir)
+
+    app_env = {
+        **os.environ,
+        **DEFAULT_APP_ENV,
+        "AZURE_TENANT_ID": TENANT_ID,
+        "AZURE_CLIENT_ID": CLIENT_ID,
+        "AZURE_CLIENT_SECRET": "benchmark-secret",
+        "AUTHORITY": f"https://login.microsoftonline.com/{TENANT_ID}",
+        "GRAPH_BASE_URL": f"{fake_url}/v1.0",
+        "JWKS_URL": f"{fake_url}/{TENANT_ID}/discovery/v2.0/keys",
+    }
+    for setting in args.app_env:
+        key, _, value = setting.partition("=")
+        app_env[key] = value
+
+    fake_services = ManagedProcess(
+        "fake services",
+        ["benchmarks.fake_services", "--port", str(fake_port), *config_to_arguments(config)],
+        dict(os.environ), f"{fake_url}/benchmark/health", log_dir / "fake_services.log"
+    )
+    api = ManagedProcess(
+        "API",
+        ["benchmarks.app_server", "--port", str(app_port), "--entra-url", fake_url],
+        app_env, f"{app_url}/", log_dir / "app_server.log"
+    )
+
+    results = []
+    await fake_services.start()
+    try:
+        await api.start()
+        max_concurrency = max(args.concurrency)
+        limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            tokens = (await client.get(f"{fake_url}/benchmark/tokens", params={"count": args.users})).json()["tokens"]
+            idle_memory = read_memory(api.pid)
+
+            for concurrency in args.concurrency:
+                for scenario in args.scenarios:
+                    if args.warmup > 0:
+                        await run_load(client, app_url, scenario, tokens, concurrency, args.warmup)
+
+                    reset_peak_memory(api.pid)
+                    calls_before = await fake_service_calls(client, fake_url)
+                    cpu_before = read_cpu_seconds(api.pid)
+                    result = await run_load(client, app_url, scenario, tokens, concurrency, args.duration)
+                    cpu_after = read_cpu_seconds(api.pid)
+                    calls = await fake_service_calls(client, fake_url) - calls_before
+
+                    completed = result["requests"] or 1
+                    result.update(
+                        scenario=scenario,
+                        concurrency=concurrency,
+                        graph_calls_per_request=round(calls["graph"] / completed, 2),
+                        graph_throttled_per_request=round(calls["graph_throttled"] / completed, 3),
+                        token_requests=calls["token"],
+                        cpu_ms_per_request=(
+                            round((cpu_after - cpu_before) * 1000 / completed, 3)
+                            if cpu_before is not None and cpu_after is not None else None
+                        ),
+                        memory=read_memory(api.pid)
+                    )
+                    results.append(result)
+                    print_result(result)
+    finally:
+        api.stop()
+        fake_services.stop()
+
+    return {
+        "benchmark": "api-load",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git": git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "settings": {
+            "concurrency": args.concurrency,
+            "duration_seconds": args.duration,
+            "warmup_seconds": args.warmup,
+            "users": args.users,
+            "app_env": {key: app_env[key] for key in sorted(set(DEFAULT_APP_ENV) | {s.partition("=")[0] for s in args.app_env})},
+            "fake_services": config.to_dict()
+        },
+        "idle_memory": idle_memory,
+        "results": results
+    }
+
+
+def print_result(result: dict):
+    latency = result["latency_ms"]
+    print(
+        f"{result['scenario']:<18} c={result['concurrency']:<4} "
+        f"{result['throughput_rps']:>9.1f} req/s  "
+        f"p50 {latency['p50'] or 0:>8.1f} ms  p95 {latency['p95'] or 0:>8.1f} ms  p99 {latency['p99'] or 0:>8.1f} ms  "
+        f"errors {result['errors']:<5} graph/req {result['graph_calls_per_request']:<5} "
+        f"peak RSS {result['memory']['peak_rss_mb']} MB",
+        flush=True
+    )
+
+
+def compare_results(current: dict, baseline: dict, max_regression: Optional[float]) -> bool:
+    """Print throughput and p95 changes against a baseline; return False if a regression exceeds the limit"""
+    baseline_rows = {(row["scenario"], row["concurrency"]): row for row in baseline.get("results", [])}
+    print(f"\nCompared with {baseline.get('git', {}).get('commit') or 'baseline'} ({baseline.get('created_at')}):")
+
+    within_limit = True
+    for row in current["results"]:
+        base = baseline_rows.get((row["scenario"], row["concurrency"]))
+        if base is None:
+            continue
+        throughput_change = _change(row["throughput_rps"], base["throughput_rps"])
+        p95_change = _change(row["latency_ms"]["p95"], base["latency_ms"]["p95"])
+        regressed = max_regression is not None and (
+            (throughput_change is not None and throughput_change < -max_regression)
+            or (p95_change is not None and p95_change > max_regression)
+        )
+        within_limit = within_limit and not regressed
+        print(
+            f"{row['scenario']:<18} c={row['concurrency']:<4} "
+            f"throughput {_format_change(throughput_change):>8}  p95 {_format_change(p95_change):>8}"
+            + ("  REGRESSION" if regressed else "")
+        )
+    return within_limit
+
+
+def _change(current: Optional[float], baseline: Optional[float]) -> Optional[float]:
+    if current is None or not baseline:
+        return None
+    return (current - baseline) / baseline * 100
+
+
+def _format_change(change: Optional[float]) -> str:
+    return "n/a" if change is None else f"{change:+.1f}%"
+
+
+def parse_arguments(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load and latency benchmark against fake Entra ID and Graph services")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma-separated scenarios (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--concurrency", default="1,16", help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds per scenario and concurrency")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each measurement")
+    parser.add_argument("--users", type=int, default=10, help="distinct user tokens to rotate through")
+    parser.add_argument("--timeout", type=float, default=60, help="per-request timeout in seconds")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the API under test (repeatable)")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--log-dir", default=str(RESULTS_DIR / "logs"), help="where service logs are written")
+    parser.add_argument("--compare", help="baseline result file to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="with --compare, exit non-zero if throughput drops or p95 grows by more than this percent")
+    add_config_arguments(parser)
+
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+    return args
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = parse_arguments(argv)
+    report = asyncio.run(run_benchmark(args))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / "{}-{}.json".format(
+        time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()), (report["git"]["commit"] or "unknown")[:10]
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if not compare_results(report, baseline, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
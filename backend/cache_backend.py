@@ -0,0 +1,334 @@
+"""
+Shared far-tier storage for the OBO token, site and Graph response caches.
+
+Each cache keeps its entries in process memory (the near tier). When a shared
+backend is configured, a near-tier miss reads through to the backend (the far
+tier) and every write goes to both, so uvicorn workers on one host, or pods
+behind one Redis, start warm and share tokens and responses instead of each
+going to Entra ID and Graph cold after a deploy.
+
+Backends, selected with ``CACHE_BACKEND``:
+
+- ``none`` (default): near tier only
+- ``memory``: an in-process store, for tests and single-worker setups
+- ``sqlite``: a local SQLite file in WAL mode, shared by workers on one host
+- ``redis``: any Redis-protocol server (requires the optional ``redis`` package)
+
+Values are stored as JSON. Namespaces holding token material are encrypted
+with Fernet before they leave the process; the key comes from
+``CACHE_ENCRYPTION_KEY`` or is derived from the client secret that every
+worker already shares. Backend failures are logged and treated as misses, so
+an outage of the far tier costs performance, never correctness.
+"""
+import abc
+import asyncio
+import base64
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from app_logging import get_logger
+from metrics import metric_family, register_collector
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+logger = get_logger("cache")
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "none").lower()
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH") or os.path.join(tempfile.gettempdir(), "obo-api-cache.sqlite3")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "obo-api")
+CACHE_SHARED_MAX_ENTRIES = int(os.getenv("CACHE_SHARED_MAX_ENTRIES", "100000"))
+# Comma-separated Fernet keys; the first encrypts, all decrypt (for key rotation)
+CACHE_ENCRYPTION_KEY = os.getenv("CACHE_ENCRYPTION_KEY", "")
+
+
+class CacheBackend(abc.ABC):
+    """Byte-valued key/value store with per-entry TTL"""
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        """Return the value stored under key, or None if it is missing or expired"""
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float):
+        """Store value under key for ttl seconds"""
+
+    @abc.abstractmethod
+    async def delete(self, key: str):
+        """Remove key if present"""
+
+    async def close(self):
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU store; shares nothing between workers"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self._entries[key] = (value, time.time() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+
+class SqliteCacheBackend(CacheBackend):
+    """Store in a local SQLite file, shared by every worker process on the host"""
+
+    name = "sqlite"
+
+    # Expired and excess rows are purged after this many writes
+    PURGE_INTERVAL = 1000
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not cross a fork, so each worker process opens its own
+        if self._connection is None or self._connection_pid != os.getpid():
+            created = not os.path.exists(self.path)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+            if created:
+                os.chmod(self.path, 0o600)
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_INTERVAL == 0:
+                connection.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+                connection.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY expires_at LIMIT max((SELECT count(*) FROM cache) - ?, 0))",
+                    (self.max_entries,)
+                )
+
+    def _delete(self, key: str):
+        with self._lock:
+            self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self._delete, key)
+
+    async def close(self):
+        with self._lock:
+            if self._connection is not None and self._connection_pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+class RedisCacheBackend(CacheBackend):
+    """Store in a Redis-protocol server, shared across hosts"""
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        if redis_asyncio is None:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package (pip install 'redis>=5')")
+        self.url = url
+        self._client = None
+        self._client_pid: Optional[int] = None
+
+    def _get_client(self):
+        # Created lazily so the connection pool belongs to the serving process and its event loop
+        if self._client is None or self._client_pid != os.getpid():
+            self._client = redis_asyncio.from_url(self.url, socket_timeout=1, socket_connect_timeout=1)
+            self._client_pid = os.getpid()
+        return self._client
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._get_client().get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._get_client().set(key, value, px=max(int(ttl * 1000), 1))
+
+    async def delete(self, key: str):
+        await self._get_client().delete(key)
+
+    async def close(self):
+        if self._client is not None and self._client_pid == os.getpid():
+            await self._client.aclose()
+        self._client = None
+
+
+def derive_encryption_key(secret: str) -> bytes:
+    """Derive a Fernet key from a secret shared by all workers"""
+    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"obo-api shared cache").derive(secret.encode())
+    return base64.urlsafe_b64encode(key)
+
+
+def create_cipher(keys: str, fallback_secret: Optional[str]) -> MultiFernet:
+    """Build the cipher for encrypted namespaces from configured keys or the client secret"""
+    configured = [key.strip() for key in keys.split(",") if key.strip()]
+    if configured:
+        return MultiFernet([Fernet(key) for key in configured])
+    if fallback_secret:
+        return MultiFernet([Fernet(derive_encryption_key(fallback_secret))])
+
+    logger.warning("No CACHE_ENCRYPTION_KEY or client secret; encrypted cache entries will not be shared between processes")
+    return MultiFernet([Fernet(Fernet.generate_key())])
+
+
+class CacheNamespace:
+    """One cache's view of the shared backend: key prefixing, JSON, optional encryption and failure isolation"""
+
+    def __init__(self, backend: CacheBackend, namespace: str, cipher: Optional[MultiFernet] = None):
+        self.backend = backend
+        self.namespace = namespace
+        self.cipher = cipher
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Return the stored value, or None if missing, undecryptable or the backend is unavailable"""
+        try:
+            raw = await self.backend.get(self._key(key))
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Shared cache read failed for %s: %s", self.namespace, e)
+            return None
+
+        if raw is None:
+            self.misses += 1
+            return None
+        try:
+            if self.cipher is not None:
+                # Entries written under a retired key simply read as misses
+                raw = self.cipher.decrypt(raw)
+            value = json.loads(raw)
+        except (InvalidToken, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float):
+        """Store a JSON-serializable value for ttl seconds"""
+        if ttl <= 0:
+            return
+        raw = json.dumps(value, separators=(",", ":")).encode()
+        if self.cipher is not None:
+            raw = self.cipher.encrypt(raw)
+        try:
+            await self.backend.set(self._key(key), raw, ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Shared cache write failed for %s: %s", self.namespace, e)
+
+    def stats(self) -> dict:
+        return {"backend": self.backend.name, "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+def create_cache_backend(kind: str, sqlite_path: str = CACHE_SQLITE_PATH, redis_url: str = CACHE_REDIS_URL,
+                         max_entries: int = CACHE_SHARED_MAX_ENTRIES) -> Optional[CacheBackend]:
+    """Create the configured shared backend, or None for near-tier-only caching"""
+    if kind in ("", "none"):
+        return None
+    if kind == "memory":
+        return MemoryCacheBackend(max_entries)
+    if kind == "sqlite":
+        return SqliteCacheBackend(sqlite_path, max_entries)
+    if kind == "redis":
+        return RedisCacheBackend(redis_url)
+    raise ValueError(f"Unknown CACHE_BACKEND {kind!r}; expected none, memory, sqlite or redis")
+
+
+shared_backend = create_cache_backend(CACHE_BACKEND)
+_cipher = create_cipher(CACHE_ENCRYPTION_KEY, os.getenv("AZURE_CLIENT_SECRET")) if shared_backend else None
+_namespaces = []
+
+
+def shared_namespace(name: str, encrypt: bool = False) -> Optional[CacheNamespace]:
+    """Return the far tier for one cache, or None when no shared backend is configured"""
+    if shared_backend is None:
+        return None
+    namespace = CacheNamespace(shared_backend, f"{CACHE_KEY_PREFIX}:{name}", _cipher if encrypt else None)
+    _namespaces.append(namespace)
+    return namespace
+
+
+async def close_shared_backend():
+    if shared_backend is not None:
+        await shared_backend.close()
+
+
+@register_collector
+def collect_shared_cache_metrics() -> list:
+    """Export far-tier lookups and failures per namespace"""
+    return metric_family(
+        "shared_cache_requests_total", "counter", "Shared cache backend lookups by namespace and result",
+        [
+            ({"namespace": namespace.namespace, "result": result}, getattr(namespace, result))
+            for namespace in _namespaces
+            for result in ("hits", "misses", "errors")
+        ]
+    )
@@ -0,0 +1,292 @@
+"""
+Delta-query-backed local index of SharePoint document libraries.
+
+Each index holds the driveItems of one drive as seen by one user, built with
+``/drives/{id}/root/delta`` and advanced incrementally from the stored delta
+link. Because Graph trims delta results to what the caller may access, indexes
+are partitioned per user and every sync runs with that user's own token.
+
+Indexes are built and refreshed in the background: a request that finds no
+ready index falls back to live Graph calls while the build runs, and a request
+that finds a stale index is answered from it while a refresh is scheduled.
+Listing, filename search and "recently modified" queries are then served from
+memory, with an inverted index over name tokens for prefix search. Syncs are
+paced by the tenant's background Graph budget, and the number of indexes and
+the items they hold in total are both capped.
+"""
+import asyncio
+import bisect
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException
+
+from app_logging import get_logger
+from graph_client import GRAPH_BASE_URL, make_graph_request
+from graph_throttle import graph_background
+from tracing import start_span
+
+logger = get_logger("index")
+
+DELTA_SELECT = "id,name,size,file,folder,root,deleted,parentReference,lastModifiedDateTime,webUrl"
+
+_NAME_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def name_tokens(name: str) -> set:
+    """Split a file name into lower-cased word tokens"""
+    return set(_NAME_TOKEN_PATTERN.findall(name.casefold()))
+
+
+def _index_entry(item: dict) -> dict:
+    """Keep only the driveItem fields the index answers queries with"""
+    entry = {
+        "id": item["id"],
+        "name": item.get("name", ""),
+        "size": item.get("size", 0),
+        "lastModifiedDateTime": item.get("lastModifiedDateTime", ""),
+        "webUrl": item.get("webUrl", ""),
+        "parentReference": {
+            "id": item.get("parentReference", {}).get("id"),
+            "driveId": item.get("parentReference", {}).get("driveId")
+        }
+    }
+    if "file" in item:
+        entry["file"] = {"mimeType": item["file"].get("mimeType", "unknown")}
+    if "folder" in item:
+        entry["folder"] = {"childCount": item["folder"].get("childCount", 0)}
+    return entry
+
+
+class DriveIndex:
+    """In-memory view of one drive's items with name and hierarchy indexes"""
+
+    def __init__(self, drive_id: str):
+        self.drive_id = drive_id
+        self.root_id: Optional[str] = None
+        self.delta_link: Optional[str] = None
+        self.synced_at = 0.0
+        self._items = {}
+        self._children = {}
+        self._tokens = {}
+        self._sorted_tokens = []
+        self._tokens_dirty = False
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def apply(self, changes: list):
+        """Apply a page of delta results: upserts, moves, renames and deletions"""
+        for item in changes:
+            item_id = item.get("id")
+            if not item_id:
+                continue
+            if "root" in item:
+                self.root_id = item_id
+                continue
+
+            if "deleted" in item:
+                # Graph may report only the deleted folder, not everything under it
+                self._remove(item_id, recursive=True)
+            else:
+                self._remove(item_id)
+                self._add(_index_entry(item))
+
+    def _add(self, entry: dict):
+        item_id = entry["id"]
+        self._items[item_id] = entry
+        self._children.setdefault(entry["parentReference"]["id"], set()).add(item_id)
+        for token in name_tokens(entry["name"]):
+            ids = self._tokens.get(token)
+            if ids is None:
+                self._tokens[token] = ids = set()
+                self._tokens_dirty = True
+            ids.add(item_id)
+
+    def _remove(self, item_id: str, recursive: bool = False):
+        entry = self._items.pop(item_id, None)
+        if entry is None:
+            return
+
+        if recursive:
+            for child_id in list(self._children.pop(item_id, ())):
+                self._remove(child_id, recursive=True)
+
+        siblings = self._children.get(entry["parentReference"]["id"])
+        if siblings is not None:
+            siblings.discard(item_id)
+        for token in name_tokens(entry["name"]):
+            ids = self._tokens.get(token)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del self._tokens[token]
+                    self._tokens_dirty = True
+
+    def children(self, parent_id: Optional[str] = None) -> list:
+        """Return the items directly under a folder (the drive root by default), sorted by name"""
+        ids = self._children.get(parent_id or self.root_id, ())
+        return sorted((self._items[item_id] for item_id in ids), key=lambda entry: entry["name"].casefold())
+
+    def search(self, query: str, limit: Optional[int] = None) -> list:
+        """Return items whose name has a token starting with each word of the query"""
+        terms = name_tokens(query)
+        if not terms:
+            return []
+
+        if self._tokens_dirty:
+            self._sorted_tokens = sorted(self._tokens)
+            self._tokens_dirty = False
+
+        matches = None
+        for term in terms:
+            term_ids = set()
+            start = bisect.bisect_left(self._sorted_tokens, term)
+            for token in self._sorted_tokens[start:]:
+                if not token.startswith(term):
+                    break
+                term_ids |= self._tokens.get(token, set())
+            matches = term_ids if matches is None else matches & term_ids
+            if not matches:
+                return []
+
+        results = sorted((self._items[item_id] for item_id in matches), key=lambda entry: entry["name"].casefold())
+        return results[:limit] if limit else results
+
+    def recent(self, limit: int = 10) -> list:
+        """Return the most recently modified files"""
+        files = (entry for entry in self._items.values() if "file" in entry)
+        return sorted(files, key=lambda entry: entry["lastModifiedDateTime"], reverse=True)[:limit]
+
+
+class DriveIndexManager:
+    """Bounded, per-user collection of drive indexes kept current with delta queries"""
+
+    def __init__(self, refresh_interval: int = 60, max_indexes: int = 50, max_items: int = 20000,
+                 max_total_items: int = 200000, enabled: bool = True):
+        self.refresh_interval = refresh_interval
+        self.max_indexes = max_indexes
+        self.max_items = max_items
+        self.max_total_items = max_total_items
+        self.enabled = enabled
+        # (user_key, drive_id) -> DriveIndex
+        self._indexes = OrderedDict()
+        # Drives skipped for exceeding max_items, until the given time
+        self._too_large_until = {}
+        self._syncs = {}
+        self.hits = 0
+        self.misses = 0
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.sync_errors = 0
+
+    def get(self, user_key: str, drive_id: str, graph_token: str) -> Optional[DriveIndex]:
+        """
+        Return the user's index for a drive if one is ready, scheduling a build or refresh as needed.
+
+        Returns None while the first build is still running (or the drive is
+        too large to index); callers should then answer from Graph directly.
+        """
+        if not self.enabled:
+            return None
+
+        key = (user_key, drive_id)
+        index = self._indexes.get(key)
+        if index is not None:
+            self._indexes.move_to_end(key)
+            if time.time() - index.synced_at >= self.refresh_interval:
+                self._schedule_sync(key, graph_token)
+            self.hits += 1
+            return index
+
+        self.misses += 1
+        if self._too_large_until.get(key, 0) <= time.time():
+            self._schedule_sync(key, graph_token)
+        return None
+
+    def _schedule_sync(self, key: tuple, graph_token: str):
+        if key in self._syncs:
+            return
+        task = asyncio.create_task(self._sync(key, graph_token))
+        self._syncs[key] = task
+        task.add_done_callback(lambda _: self._syncs.pop(key, None))
+
+    async def _sync(self, key: tuple, graph_token: str):
+        # Syncs outlive the request that scheduled them, so each gets its own trace,
+        # and they draw on the background budget rather than competing with user requests
+        graph_background.set(True)
+        with start_span("drive_index sync", {"drive.id": key[1]}, new_trace=True):
+            await self._sync_drive(key, graph_token)
+
+    async def _sync_drive(self, key: tuple, graph_token: str):
+        index = self._indexes.get(key)
+        try:
+            if index is not None and index.delta_link:
+                try:
+                    await self._run_delta(index, index.delta_link, graph_token)
+                    self.incremental_syncs += 1
+                    return
+                except HTTPException as e:
+                    # 410 Gone means the delta link expired and a full resync is required
+                    if e.status_code != 410:
+                        raise
+                    logger.info("Delta link expired for drive %s, rebuilding index", key[1])
+
+            # Build into a fresh index so queries never see a half-synced drive
+            fresh = DriveIndex(key[1])
+            await self._run_delta(fresh, f"{GRAPH_BASE_URL}/drives/{key[1]}/root/delta?$select={DELTA_SELECT}", graph_token)
+            self.full_syncs += 1
+            self._store(key, fresh)
+        except OverflowError:
+            logger.warning("Drive %s has more than %d items, not indexing it", key[1], self.max_items)
+            self._indexes.pop(key, None)
+            now = time.time()
+            self._too_large_until = {k: until for k, until in self._too_large_until.items() if until > now}
+            self._too_large_until[key] = now + self.refresh_interval * 10
+        except Exception as e:
+            self.sync_errors += 1
+            logger.error("Error syncing drive index for %s: %s", key[1], e)
+
+    async def _run_delta(self, index: DriveIndex, url: str, graph_token: str):
+        """Follow a delta round to its deltaLink, applying each page as it arrives"""
+        while url:
+            page = await make_graph_request(url, graph_token)
+            index.apply(page.get("value", []))
+            if len(index) > self.max_items:
+                raise OverflowError(index.drive_id)
+
+            url = page.get("@odata.nextLink")
+            if not url:
+                index.delta_link = page.get("@odata.deltaLink")
+        index.synced_at = time.time()
+
+    def _store(self, key: tuple, index: DriveIndex):
+        self._indexes[key] = index
+        self._indexes.move_to_end(key)
+        total_items = sum(len(index) for index in self._indexes.values())
+        while len(self._indexes) > 1 and (len(self._indexes) > self.max_indexes or total_items > self.max_total_items):
+            _, evicted = self._indexes.popitem(last=False)
+            total_items -= len(evicted)
+
+    async def close(self):
+        """Cancel background syncs"""
+        for task in list(self._syncs.values()):
+            task.cancel()
+        if self._syncs:
+            await asyncio.gather(*self._syncs.values(), return_exceptions=True)
+
+    def stats(self) -> dict:
+        """Return index and sync counters for monitoring"""
+        return {
+            "enabled": self.enabled,
+            "indexes": len(self._indexes),
+            "indexed_items": sum(len(index) for index in self._indexes.values()),
+            "syncs_in_progress": len(self._syncs),
+            "hits": self.hits,
+            "misses": self.misses,
+            "full_syncs": self.full_syncs,
+            "incremental_syncs": self.incremental_syncs,
+            "sync_errors": self.sync_errors
+        }
@@ -0,0 +1,314 @@
+"""
+Pluggable text extraction for SharePoint files.
+
+Extractors are registered by file extension and MIME type. Office files are
+ZIP archives of XML parts; each part is streamed out of the archive and parsed
+with ``iterparse``, clearing elements as it goes and stopping as soon as the
+requested character budget is filled, so memory use stays flat regardless of
+document size.
+
+Parsing is pure CPU work, so extractors run in a bounded process pool with a
+per-job timeout and an address-space limit per worker instead of on the event
+loop thread.
+"""
+import asyncio
+import io
+import os
+import signal
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Callable, Optional
+from xml.etree import ElementTree as ET
+
+from metrics import EXTRACTION_SECONDS
+from tracing import start_span
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+SPREADSHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+SLIDE_SEPARATOR = "\n\n--- SLIDE ---\n\n"
+
+# Extraction worker configuration
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "30"))
+EXTRACTION_MEMORY_LIMIT_MB = int(os.getenv("EXTRACTION_MEMORY_LIMIT_MB", "1024"))
+# Extra time after which a worker that has not aborted itself is considered stuck
+STUCK_WORKER_GRACE = 5
+
+
+@dataclass(frozen=True)
+class Extractor:
+    """A registered text extractor and how to report its results"""
+    name: str
+    content_type: str
+    func: Optional[Callable]
+    default_max_chars: int = 3000
+    # Streamed extractors decode the download directly instead of running in the process pool
+    streamed: bool = False
+    error_content_type: str = "office_extraction_error"
+    error_message: str = "Office document detected but extraction failed: {error}"
+    extensions: tuple = ()
+    mime_types: tuple = ()
+
+
+_extractors_by_extension = {}
+_extractors_by_mime_type = {}
+
+
+def register_extractor(name: str, content_type: str, extensions: tuple = (), mime_types: tuple = (), **options):
+    """Register a function as the extractor for the given extensions and MIME types"""
+    def decorator(func: Optional[Callable]):
+        extractor = Extractor(
+            name=name,
+            content_type=content_type,
+            func=func,
+            extensions=tuple(ext.lower() for ext in extensions),
+            mime_types=tuple(mime_types),
+            **options
+        )
+        for ext in extractor.extensions:
+            _extractors_by_extension[ext] = extractor
+        for mime_type in extractor.mime_types:
+            _extractors_by_mime_type[mime_type] = extractor
+        return func
+    return decorator
+
+
+def find_extractor(file_name: str, mime_type: Optional[str] = None) -> Optional[Extractor]:
+    """Return the extractor for a file, matching by extension first and then MIME type"""
+    extension = os.path.splitext(file_name.lower())[1]
+    return _extractors_by_extension.get(extension) or _extractors_by_mime_type.get(mime_type)
+
+
+def _open_zip(source) -> zipfile.ZipFile:
+    """Open in-memory bytes or a spooled temp file path as a ZIP archive"""
+    return zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+
+def _iter_texts(xml_stream, strip: bool = False):
+    """Yield element text from an XML stream in document order without building the tree"""
+    for _, elem in ET.iterparse(xml_stream, events=("end",)):
+        text = elem.text
+        elem.clear()
+        if strip:
+            text = text.strip() if text else text
+        if text:
+            yield text
+
+
+# Text files are decoded straight from the download stream by the handler
+register_extractor(
+    "text",
+    content_type="text",
+    extensions=(".txt", ".md", ".csv", ".json", ".xml", ".html", ".htm"),
+    mime_types=("text/plain", "text/markdown", "text/csv", "application/json", "text/xml", "application/xml", "text/html"),
+    default_max_chars=5000,
+    streamed=True,
+    error_content_type="text_decode_error",
+    error_message="Could not decode text content"
+)(None)
+
+
+@register_extractor(
+    "docx",
+    content_type="word_document",
+    extensions=(".docx",),
+    mime_types=("application/vnd.openxmlformats-officedocument.wordprocessingml.document",)
+)
+def extract_docx_text(source, max_chars: int = 3000) -> str:
+    """Extract text from a Word document"""
+    with _open_zip(source) as zip_file:
+        with zip_file.open("word/document.xml") as doc_xml:
+            text_content = []
+            length = 0
+            for text in _iter_texts(doc_xml):
+                text_content.append(text)
+                length += len(text) + 1
+                if length >= max_chars:
+                    break
+
+    return " ".join(text_content)[:max_chars]
+
+
+@register_extractor(
+    "xlsx",
+    content_type="excel_workbook",
+    extensions=(".xlsx",),
+    mime_types=("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",),
+    error_content_type="excel_extraction_error",
+    error_message="Excel file detected but could not extract text content"
+)
+def extract_xlsx_text(source, max_chars: int = 3000, max_strings: int = 100) -> str:
+    """Extract shared strings from an Excel workbook"""
+    with _open_zip(source) as zip_file:
+        with zip_file.open("xl/sharedStrings.xml") as shared_strings:
+            strings = []
+            length = 0
+            for _, elem in ET.iterparse(shared_strings, events=("end",)):
+                if elem.tag == f"{SPREADSHEET_NS}t" and elem.text:
+                    strings.append(elem.text)
+                    length += len(elem.text) + 3
+                if elem.tag in (f"{SPREADSHEET_NS}t", f"{SPREADSHEET_NS}si"):
+                    elem.clear()
+                if len(strings) >= max_strings or length >= max_chars:
+                    break
+
+    return " | ".join(strings)[:max_chars]
+
+
+@register_extractor(
+    "pptx",
+    content_type="powerpoint_presentation",
+    extensions=(".pptx",),
+    mime_types=("application/vnd.openxmlformats-officedocument.presentationml.presentation",)
+)
+def extract_pptx_text(source, max_chars: int = 3000, max_slides: int = 10) -> str:
+    """Extract text from the slides of a PowerPoint presentation"""
+    with _open_zip(source) as zip_file:
+        slide_files = [f for f in zip_file.namelist() if f.startswith("ppt/slides/slide")]
+
+        slides_text = []
+        length = 0
+        for slide_file in slide_files[:max_slides]:
+            try:
+                with zip_file.open(slide_file) as slide_xml:
+                    slide_text = []
+                    for text in _iter_texts(slide_xml, strip=True):
+                        slide_text.append(text)
+                        length += len(text) + 1
+                        if length >= max_chars:
+                            break
+            except Exception:
+                continue
+
+            if slide_text:
+                slides_text.append(" ".join(slide_text))
+                length += len(SLIDE_SEPARATOR)
+            if length >= max_chars:
+                break
+
+    return SLIDE_SEPARATOR.join(slides_text)[:max_chars]
+
+
+_extraction_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _current_address_space() -> int:
+    """Return this process's virtual memory size in bytes (0 if unknown)"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _init_extraction_worker(memory_limit_mb: int):
+    """Cap how much additional memory an extraction worker may allocate"""
+    if resource is not None and memory_limit_mb > 0:
+        limit = _current_address_space() + memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+class ExtractionTimeout(TimeoutError):
+    """Raised inside a worker whose extractor ran past the timeout"""
+
+
+def _raise_timeout(signum, frame):
+    raise ExtractionTimeout("Text extraction timed out")
+
+
+def _run_extraction_job(func: Callable, source, max_chars: int, timeout: float) -> str:
+    """Run an extractor inside a worker, aborting it from within once the timeout passes"""
+    use_alarm = timeout > 0 and hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(source, max_chars)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """Return the process pool used for extraction, creating it on first use"""
+    global _extraction_pool
+    if _extraction_pool is None:
+        _extraction_pool = ProcessPoolExecutor(
+            max_workers=max(EXTRACTION_WORKERS, 1),
+            initializer=_init_extraction_worker,
+            initargs=(EXTRACTION_MEMORY_LIMIT_MB,)
+        )
+    return _extraction_pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """
+    Shut a pool down without waiting and terminate its workers.
+
+    Used for pools with a stuck or dead worker, which ``shutdown`` alone would
+    leave running; jobs still in flight on the pool fail as crashed.
+    """
+    processes = list((pool._processes or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def _drop_pool(pool: ProcessPoolExecutor):
+    """Discard a pool and start a fresh one on next use, unless another job already replaced it"""
+    global _extraction_pool
+    if _extraction_pool is pool:
+        _extraction_pool = None
+    _discard_pool(pool)
+
+
+def shutdown_extraction_pool(wait: bool = False):
+    """Stop the extraction worker processes, optionally waiting for them to exit"""
+    global _extraction_pool
+    if _extraction_pool is not None:
+        _extraction_pool.shutdown(wait=wait, cancel_futures=True)
+        _extraction_pool = None
+
+
+async def run_extractor(extractor: Extractor, source, max_chars: int) -> str:
+    """Run an extractor in the process pool with a per-job timeout"""
+    loop = asyncio.get_running_loop()
+    pool = get_extraction_pool()
+    start = time.perf_counter()
+    result = "error"
+    with start_span(f"extract {extractor.name}", {"extraction.max_chars": max_chars}) as span:
+        try:
+            text = await asyncio.wait_for(
+                loop.run_in_executor(
+                    pool,
+                    _run_extraction_job, extractor.func, source, max_chars, EXTRACTION_TIMEOUT
+                ),
+                # Workers abort themselves at the timeout; this only guards against a stuck worker
+                timeout=EXTRACTION_TIMEOUT + STUCK_WORKER_GRACE if EXTRACTION_TIMEOUT > 0 else None
+            )
+            result = "ok"
+            return text
+        except ExtractionTimeout:
+            result = "timeout"
+            raise
+        except asyncio.TimeoutError:
+            # The worker did not abort itself, so it is stuck (e.g. in C code); kill it with its pool
+            result = "timeout"
+            _drop_pool(pool)
+            raise
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for exceeding its memory limit); start a fresh pool next time
+            _drop_pool(pool)
+            result = "crashed"
+            raise RuntimeError("Text extraction worker crashed")
+        finally:
+            span.set_attribute("extraction.result", result)
+            EXTRACTION_SECONDS.labels(extractor.name, result).observe(time.perf_counter() - start)
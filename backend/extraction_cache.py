@@ -0,0 +1,158 @@
+"""
+Content-addressed cache of extracted file text.
+
+Entries are keyed by drive, item, content tag (``cTag``, falling back to
+``eTag``), extractor and character budget, so any change to the file produces
+a new key and stale text is never served. An in-memory LRU tier is backed by
+an optional on-disk tier; both are bounded by size.
+
+The cache holds no permissions. Callers must still fetch the item metadata
+with the requesting user's token, which both enforces access and supplies the
+current content tag. Disk entries hold document text, so they are created
+readable by the service's own user only.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Optional
+
+
+class ExtractionCache:
+    """Two-tier (memory, then optional disk) cache of extraction results"""
+
+    def __init__(self, max_memory_bytes: int = 64 * 1024 * 1024, disk_dir: Optional[str] = None,
+                 max_disk_bytes: int = 1024 * 1024 * 1024):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, mode=0o700, exist_ok=True)
+            self._disk_bytes = sum(
+                entry.stat().st_size for entry in os.scandir(self.disk_dir) if entry.name.endswith(".json")
+            )
+
+    @staticmethod
+    def make_key(file_metadata: dict, extractor_name: str, max_chars: int) -> Optional[str]:
+        """Build a cache key from driveItem metadata, or None if the item has no content tag"""
+        tag = file_metadata.get("cTag") or file_metadata.get("eTag")
+        item_id = file_metadata.get("id")
+        if not tag or not item_id:
+            return None
+
+        drive_id = file_metadata.get("parentReference", {}).get("driveId", "")
+        raw_key = f"{drive_id}|{item_id}|{tag}|{extractor_name}|{max_chars}"
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Return a cached extraction result, checking memory first and then disk"""
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        if self.disk_dir:
+            value = await asyncio.to_thread(self._read_disk, key)
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._store_memory(key, value)
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: dict):
+        """Store an extraction result in both tiers"""
+        self._store_memory(key, value)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, value)
+
+    def _store_memory(self, key: str, value: dict):
+        size = len(value.get("content") or "") + 256
+        if size > self.max_memory_bytes:
+            return
+
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        self._memory[key] = (value, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[dict]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as cache_file:
+                value = json.load(cache_file)
+            # Touch the file so eviction keeps recently used entries
+            os.utime(path)
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, value: dict):
+        path = self._disk_path(key)
+        data = json.dumps(value).encode("utf-8")
+        if len(data) > self.max_disk_bytes:
+            return
+
+        # Overwriting an entry replaces its bytes rather than adding to them
+        try:
+            previous_size = os.path.getsize(path)
+        except OSError:
+            previous_size = 0
+
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as cache_file:
+            cache_file.write(data)
+        os.replace(temp_path, path)
+        self._disk_bytes += len(data) - previous_size
+
+        if self._disk_bytes > self.max_disk_bytes:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Remove least recently used files until the disk tier is back under its limit"""
+        entries = sorted(
+            (entry for entry in os.scandir(self.disk_dir) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except OSError:
+                continue
+        self._disk_bytes = total
+
+    def stats(self) -> dict:
+        """Return hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_enabled": bool(self.disk_dir),
+            "disk_bytes": self._disk_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,607 @@
+"""
+Shared async HTTP client for Microsoft Graph API calls.
+
+A single pooled, keep-alive ``httpx.AsyncClient`` is reused by every endpoint so
+Graph calls never block the event loop and connections to graph.microsoft.com
+are multiplexed (HTTP/2 when the ``h2`` package is available).
+"""
+import asyncio
+import base64
+import io
+import json
+import os
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
+
+import httpx
+from fastapi import HTTPException
+
+from app_logging import get_logger
+from cache_backend import shared_namespace
+from graph_throttle import RETRYABLE_STATUS_CODES, THROTTLED_STATUS_CODES, GraphThrottle, parse_retry_after
+from metrics import GRAPH_REQUEST_SECONDS, graph_endpoint_template, metric_family, register_collector
+from response_cache import GraphResponseCache, cache_partition
+from tracing import start_span
+
+logger = get_logger("graph")
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 support in httpx)
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+# Graph client configuration
+GRAPH_BASE_URL = os.getenv("GRAPH_BASE_URL", "https://graph.microsoft.com/v1.0").rstrip("/")
+GRAPH_TIMEOUT = float(os.getenv("GRAPH_TIMEOUT", "30"))
+GRAPH_MAX_CONNECTIONS = int(os.getenv("GRAPH_MAX_CONNECTIONS", "100"))
+GRAPH_MAX_KEEPALIVE = int(os.getenv("GRAPH_MAX_KEEPALIVE", "20"))
+GRAPH_HTTP2 = os.getenv("GRAPH_HTTP2", "true").lower() == "true" and _HTTP2_AVAILABLE
+# Maximum concurrent Graph calls a single request may fan out to
+GRAPH_FANOUT_CONCURRENCY = int(os.getenv("GRAPH_FANOUT_CONCURRENCY", "8"))
+
+# Streaming downloads keep this much in memory before spooling to disk
+DOWNLOAD_SPOOL_MEMORY = int(os.getenv("DOWNLOAD_SPOOL_MEMORY", str(8 * 1024 * 1024)))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# JSON batching: Graph accepts at most 20 sub-requests per $batch call
+GRAPH_BATCH_SIZE = min(int(os.getenv("GRAPH_BATCH_SIZE", "20")), 20)
+
+# Retries, per-tenant pacing and circuit breaking for Graph calls
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "3"))
+GRAPH_MAX_RETRY_DELAY = float(os.getenv("GRAPH_MAX_RETRY_DELAY", "10"))
+
+graph_throttle = GraphThrottle(
+    tenant_rate=float(os.getenv("GRAPH_TENANT_RATE", "50")),
+    tenant_burst=float(os.getenv("GRAPH_TENANT_BURST", "100")),
+    max_retry_delay=GRAPH_MAX_RETRY_DELAY,
+    breaker_failures=int(os.getenv("GRAPH_BREAKER_FAILURES", "10")),
+    breaker_reset=float(os.getenv("GRAPH_BREAKER_RESET", "30")),
+    background_rate=float(os.getenv("GRAPH_BACKGROUND_RATE", "5")),
+    background_burst=float(os.getenv("GRAPH_BACKGROUND_BURST", "10"))
+)
+
+# Short-lived per-user cache for idempotent Graph GETs (sites, drives, lists, me)
+GRAPH_CACHE_ENABLED = os.getenv("GRAPH_CACHE_ENABLED", "true").lower() == "true"
+GRAPH_CACHE_TTL = int(os.getenv("GRAPH_CACHE_TTL", "60"))
+GRAPH_CACHE_MAX_ENTRIES = int(os.getenv("GRAPH_CACHE_MAX_ENTRIES", "5000"))
+GRAPH_CACHE_STALE_TTL = int(os.getenv("GRAPH_CACHE_STALE_TTL", "3600"))
+
+response_cache = GraphResponseCache(
+    GRAPH_BASE_URL,
+    ttl=GRAPH_CACHE_TTL,
+    max_entries=GRAPH_CACHE_MAX_ENTRIES,
+    enabled=GRAPH_CACHE_ENABLED,
+    shared=shared_namespace("graph", encrypt=True),
+    stale_ttl=GRAPH_CACHE_STALE_TTL
+)
+
+
+
+@register_collector
+def collect_throttle_metrics() -> list:
+    """Export retry, throttling and circuit breaker state at scrape time"""
+    stats = graph_throttle.stats()
+    breaker_states = ("closed", "half_open", "open")
+    return (
+        metric_family("graph_retries_total", "counter", "Graph calls retried after throttling or failure",
+                      [({}, stats["retries"])])
+        + metric_family("graph_throttled_responses_total", "counter", "Graph responses with status 429 or 503",
+                        [({}, stats["throttled_responses"])])
+        + metric_family("graph_rate_limited_requests_total", "counter", "Graph calls delayed by the tenant rate limiter",
+                        [({}, stats["rate_limited_requests"])])
+        + metric_family("graph_rate_limited_seconds_total", "counter", "Total delay added by the tenant rate limiter",
+                        [({}, stats["rate_limited_seconds"])])
+        + metric_family("graph_breaker_state", "gauge", "Circuit breaker state (1 for the current state)",
+                        [({"state": state}, int(stats["breaker_state"] == state)) for state in breaker_states])
+        + metric_family("graph_breaker_opens_total", "counter", "Times the circuit breaker opened",
+                        [({}, stats["breaker_opens"])])
+        + metric_family("graph_breaker_rejections_total", "counter", "Graph calls rejected by the open circuit breaker",
+                        [({}, stats["breaker_rejections"])])
+    )
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared async HTTP client, creating it on first use"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=GRAPH_HTTP2,
+            timeout=httpx.Timeout(GRAPH_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=GRAPH_MAX_CONNECTIONS,
+                max_keepalive_connections=GRAPH_MAX_KEEPALIVE,
+            ),
+            follow_redirects=True,
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared HTTP client and release pooled connections"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def graph_error(status_code: int, error_data) -> HTTPException:
+    """Map a failed Graph response (status plus parsed body or raw text) to an HTTPException"""
+    if status_code == 401:
+        return HTTPException(status_code=401, detail="Unauthorized: Token may be expired or invalid")
+    elif status_code == 403:
+        return HTTPException(status_code=403, detail="Forbidden: Insufficient permissions")
+
+    error_detail = f"Graph API call failed with status {status_code}"
+    if isinstance(error_data, dict):
+        if "error" in error_data:
+            error_detail += f": {error_data['error'].get('message', 'Unknown error')}"
+    elif error_data:
+        error_detail += f": {error_data}"
+    return HTTPException(status_code=status_code, detail=error_detail)
+
+
+async def send_graph_request(method: str, url: str, cost: int = 1, stream: bool = False, **kwargs) -> httpx.Response:
+    """
+    Send a Graph request through the tenant rate limiter and circuit breaker.
+
+    Throttled (429/503), gateway-failed and network-failed attempts are retried
+    after ``Retry-After`` or a jittered exponential backoff; the final response
+    is returned whatever its status. Only use this for idempotent requests.
+    With ``stream=True`` the final response body is left unread and the caller
+    must close the response.
+    """
+    endpoint = graph_endpoint_template(url, GRAPH_BASE_URL)
+    headers = dict(kwargs.pop("headers", None) or {})
+    for attempt in range(GRAPH_MAX_RETRIES + 1):
+        probe_id = await graph_throttle.acquire(cost)
+        # Graph echoes client-request-id and adds its own request-id, both needed to trace a call with Microsoft
+        headers["client-request-id"] = str(uuid.uuid4())
+        try:
+            with start_span(f"graph {method} {endpoint}", {
+                "http.method": method,
+                "graph.endpoint": endpoint,
+                "graph.client_request_id": headers["client-request-id"],
+                "graph.attempt": attempt + 1
+            }) as span:
+                start = time.perf_counter()
+                try:
+                    client = get_http_client()
+                    response = await client.send(client.build_request(method, url, headers=headers, **kwargs), stream=stream)
+                except httpx.TransportError as e:
+                    GRAPH_REQUEST_SECONDS.labels(method, endpoint, "error").observe(time.perf_counter() - start)
+                    span.record_error(e)
+                    graph_throttle.record_network_error()
+                    if attempt >= GRAPH_MAX_RETRIES:
+                        raise
+                    delay = graph_throttle.backoff_delay(attempt)
+                    logger.warning("Graph network error, retrying in %.2fs: %s", delay, e,
+                                   extra={"method": method, "endpoint": endpoint, "attempt": attempt + 1})
+                else:
+                    duration = time.perf_counter() - start
+                    request_id = response.headers.get("request-id")
+                    span.set_attribute("http.status_code", response.status_code)
+                    span.set_attribute("graph.request_id", request_id)
+                    GRAPH_REQUEST_SECONDS.labels(method, endpoint, str(response.status_code)).observe(duration)
+                    logger.info("Graph request completed", extra={
+                        "method": method, "endpoint": endpoint, "status": response.status_code,
+                        "duration_ms": round(duration * 1000, 1), "request_id": request_id,
+                        "client_request_id": headers["client-request-id"], "sampled": response.status_code < 400
+                    })
+                    retry_after = parse_retry_after(response.headers.get("retry-after"))
+                    graph_throttle.record_response(response.status_code, retry_after)
+                    if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= GRAPH_MAX_RETRIES:
+                        return response
+                    await response.aclose()
+                    delay = graph_throttle.backoff_delay(attempt, retry_after)
+                    span.set_attribute("graph.retry_after", delay)
+                    logger.warning("Graph returned %s, retrying in %.2fs", response.status_code, delay,
+                                   extra={"method": method, "endpoint": endpoint, "attempt": attempt + 1})
+        finally:
+            # A half-open probe that was cancelled or failed without a recorded outcome
+            # must not leave the breaker waiting on it forever (no-op once recorded)
+            graph_throttle.abandon_probe(probe_id)
+
+        graph_throttle.retries += 1
+        await asyncio.sleep(delay)
+
+
+async def make_graph_request(endpoint: str, graph_token: str) -> dict:
+    """
+    Make a request to Microsoft Graph API with proper error handling.
+
+    Cacheable endpoints are answered from the per-user response cache while
+    fresh and revalidated with ``If-None-Match`` once stale. Cached bodies are
+    shared between callers and must be treated as read-only.
+    """
+    try:
+        headers = {
+            "Authorization": f"Bearer {graph_token}",
+            "Content-Type": "application/json"
+        }
+
+        cacheable = response_cache.is_cacheable(endpoint)
+        cached = None
+        if cacheable:
+            partition = cache_partition(graph_token)
+            cached = await response_cache.lookup(partition, endpoint)
+            if cached is not None and cached.fresh:
+                return cached.body
+            if cached is not None and cached.etag:
+                headers["If-None-Match"] = cached.etag
+
+        response = await send_graph_request("GET", endpoint, headers=headers)
+
+        if response.status_code == 304 and cached is not None:
+            logger.debug("Graph resource not modified, using cached response")
+            return await response_cache.revalidated(partition, endpoint, cached)
+
+        if response.status_code == 200:
+            data = response.json()
+            if cacheable:
+                await response_cache.store(partition, endpoint, data, response.headers)
+            return data
+
+        try:
+            error_data = response.json()
+        except:
+            error_data = response.text
+        raise graph_error(response.status_code, error_data)
+
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
+        logger.error("Request exception in make_graph_request: %s", e)
+        raise HTTPException(status_code=500, detail=f"Network error: {str(e)}")
+    except Exception as e:
+        logger.exception("Unexpected error in make_graph_request: %s", e)
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+
+def with_page_size(endpoint: str, page_size: Optional[int]) -> str:
+    """Add a server-side $top page size to an endpoint unless one is already present"""
+    if not page_size or "$top=" in endpoint:
+        return endpoint
+    separator = "&" if "?" in endpoint else "?"
+    return f"{endpoint}{separator}$top={page_size}"
+
+
+async def iter_graph_pages(endpoint: str, graph_token: str, page_size: Optional[int] = None,
+                           max_items: Optional[int] = None) -> AsyncIterator[dict]:
+    """
+    Lazily yield Graph collection pages, following ``@odata.nextLink``.
+
+    Pages are only fetched as the caller consumes them, so breaking out of the
+    loop (or reaching ``max_items``) stops paging early.
+    """
+    url = with_page_size(endpoint, page_size)
+    seen = 0
+    while url:
+        page = await make_graph_request(url, graph_token)
+        yield page
+
+        seen += len(page.get("value", []))
+        if max_items is not None and seen >= max_items:
+            return
+        url = page.get("@odata.nextLink")
+
+
+async def iter_graph_items(endpoint: str, graph_token: str, page_size: Optional[int] = None,
+                           max_items: Optional[int] = None) -> AsyncIterator[dict]:
+    """Lazily yield the items of a Graph collection across all of its pages"""
+    count = 0
+    async for page in iter_graph_pages(endpoint, graph_token, page_size=page_size, max_items=max_items):
+        for item in page.get("value", []):
+            yield item
+            count += 1
+            if max_items is not None and count >= max_items:
+                return
+
+
+def encode_cursor(next_link: Optional[str], **context) -> Optional[str]:
+    """Wrap an @odata.nextLink (plus display context) in an opaque client-facing cursor"""
+    if not next_link:
+        return None
+    payload = json.dumps({"next": next_link, "context": context}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Return (next_link, context) for a cursor, rejecting anything that does not point at Graph"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        next_link = payload["next"]
+        context = payload.get("context", {})
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # The cursor is replayed with the user's Graph token, so it must never leave the Graph API
+    if not isinstance(next_link, str) or not next_link.startswith(GRAPH_BASE_URL + "/"):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return next_link, context
+
+
+@asynccontextmanager
+async def stream_graph_content(url: str, graph_token: Optional[str] = None) -> AsyncIterator[httpx.Response]:
+    """
+    Open a streaming download (pre-authenticated URLs need no token).
+
+    Downloads go through ``send_graph_request`` like every other Graph call,
+    so they count against the tenant's rate limit, are retried when throttled
+    and fail fast while the circuit breaker is open.
+    """
+    headers = {"Authorization": f"Bearer {graph_token}"} if graph_token else {}
+    with start_span("graph download") as span:
+        response = await send_graph_request("GET", url, headers=headers, stream=True)
+        span.set_attribute("http.status_code", response.status_code)
+        span.set_attribute("graph.request_id", response.headers.get("request-id"))
+        try:
+            yield response
+        finally:
+            span.set_attribute("download.bytes", response.num_bytes_downloaded)
+            await response.aclose()
+
+
+async def read_text_prefix(response: httpx.Response, max_chars: int) -> str:
+    """Decode a streaming response until max_chars characters are read, then stop downloading"""
+    chunks = []
+    length = 0
+    async for chunk in response.aiter_text():
+        chunks.append(chunk)
+        length += len(chunk)
+        if length >= max_chars:
+            break
+    return "".join(chunks)[:max_chars]
+
+
+class SpooledDownload:
+    """Downloaded content held in memory, rolling over to a temp file past a size threshold"""
+
+    def __init__(self, max_memory: int):
+        self.max_memory = max_memory
+        self.size = 0
+        self.path: Optional[str] = None
+        self._buffer = io.BytesIO()
+        self._file = None
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self._file is None and self.size > self.max_memory:
+            # Move what we have so far to disk and keep writing there
+            self._file = tempfile.NamedTemporaryFile(prefix="graph-download-", delete=False)
+            self.path = self._file.name
+            self._file.write(self._buffer.getvalue())
+            self._buffer = None
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._buffer.write(chunk)
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+
+    def source(self):
+        """Return the content as bytes, or the temp file path once it has spilled to disk"""
+        return self.path if self.path else self._buffer.getvalue()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def spool_response(response: httpx.Response, max_bytes: int, max_memory: int = DOWNLOAD_SPOOL_MEMORY) -> SpooledDownload:
+    """
+    Copy a streaming response into a SpooledDownload.
+
+    Small downloads stay in memory and larger ones roll over to disk, so peak
+    memory is bounded by ``max_memory``. Raises ValueError past ``max_bytes``.
+    """
+    download = SpooledDownload(max_memory)
+    try:
+        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+            if download.size + len(chunk) > max_bytes:
+                raise ValueError(f"Download exceeds the {max_bytes // (1024 * 1024)} MB limit")
+            download.write(chunk)
+        download.finish()
+        return download
+    except BaseException:
+        download.close()
+        raise
+
+
+async def gather_with_concurrency(coros, limit: Optional[int] = None) -> list:
+    """
+    Run coroutines concurrently with at most ``limit`` in flight.
+
+    Results are returned in input order; a failing branch yields its exception
+    in place of a result so one bad drive or list never fails the whole request.
+    """
+    semaphore = asyncio.Semaphore(limit or GRAPH_FANOUT_CONCURRENCY)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(coro) for coro in coros), return_exceptions=True)
+
+
+async def iter_completed_with_concurrency(coros, limit: Optional[int] = None) -> AsyncIterator[tuple]:
+    """
+    Like ``gather_with_concurrency``, but yield ``(index, result)`` pairs as each coroutine finishes.
+
+    Used by streaming responses to forward each branch as soon as it is ready.
+    Branches still running when the consumer stops iterating are cancelled.
+    """
+    semaphore = asyncio.Semaphore(limit or GRAPH_FANOUT_CONCURRENCY)
+
+    async def run(index, coro):
+        async with semaphore:
+            try:
+                return index, await coro
+            except Exception as e:
+                return index, e
+
+    tasks = [asyncio.ensure_future(run(index, coro)) for index, coro in enumerate(coros)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def make_graph_batch(endpoints: list, graph_token: str) -> list:
+    """
+    Execute several Graph GET requests through JSON ``$batch`` calls.
+
+    Endpoints are split into batches of up to 20 sub-requests, sent
+    concurrently, and the results are returned in input order. Failed items
+    yield the same ``HTTPException`` that ``make_graph_request`` would raise,
+    and only throttled items are retried, honoring ``Retry-After``. Cacheable
+    endpoints go through the response cache just as in ``make_graph_request``.
+    """
+    results = [None] * len(endpoints)
+    partition = cache_partition(graph_token)
+
+    # Serve fresh cached responses directly and revalidate stale ones inside the batch
+    cached_entries = {}
+    for i, endpoint in enumerate(endpoints):
+        if response_cache.is_cacheable(endpoint):
+            cached = await response_cache.lookup(partition, endpoint)
+            if cached is not None and cached.fresh:
+                results[i] = cached.body
+            else:
+                cached_entries[i] = cached
+
+    # Only URLs relative to the Graph base can be batched
+    remaining = [i for i in range(len(endpoints)) if results[i] is None]
+    batchable = [i for i in remaining if endpoints[i].startswith(GRAPH_BASE_URL + "/")]
+    unbatched = [i for i in remaining if not endpoints[i].startswith(GRAPH_BASE_URL + "/")]
+
+    chunks = [batchable[i:i + GRAPH_BATCH_SIZE] for i in range(0, len(batchable), GRAPH_BATCH_SIZE)]
+    chunk_results = await gather_with_concurrency(
+        [
+            _send_graph_batch(
+                [endpoints[i] for i in chunk], graph_token,
+                cached=[cached_entries.get(i) for i in chunk], partition=partition
+            )
+            for chunk in chunks
+        ]
+    )
+    for chunk, chunk_result in zip(chunks, chunk_results):
+        for position, index in enumerate(chunk):
+            if isinstance(chunk_result, Exception):
+                results[index] = chunk_result
+            else:
+                results[index] = chunk_result[position]
+
+    # Fall back to individual requests for anything that could not be batched
+    if unbatched:
+        single_results = await gather_with_concurrency(
+            [make_graph_request(endpoints[i], graph_token) for i in unbatched]
+        )
+        for index, result in zip(unbatched, single_results):
+            results[index] = result
+
+    return results
+
+
+def _batch_sub_request(index: int, endpoint: str, cached) -> dict:
+    sub_request = {
+        "id": str(index),
+        "method": "GET",
+        "url": quote(endpoint[len(GRAPH_BASE_URL):], safe="/?&=$,:;@!*'()%+")
+    }
+    if cached is not None and cached.etag:
+        sub_request["headers"] = {"If-None-Match": cached.etag}
+    return sub_request
+
+
+async def _send_graph_batch(endpoints: list, graph_token: str, cached: Optional[list] = None,
+                            partition: Optional[str] = None) -> list:
+    """Send up to 20 GET requests as one $batch call, retrying throttled items"""
+    cached = cached or [None] * len(endpoints)
+    headers = {
+        "Authorization": f"Bearer {graph_token}",
+        "Content-Type": "application/json"
+    }
+    results = [None] * len(endpoints)
+    pending = list(range(len(endpoints)))
+
+    for attempt in range(GRAPH_MAX_RETRIES + 1):
+        payload = {
+            "requests": [_batch_sub_request(index, endpoints[index], cached[index]) for index in pending]
+        }
+
+        logger.debug("Sending Graph batch with %d sub-requests", len(pending))
+        try:
+            # Every sub-request counts against Graph's limits, so pace the batch by its size
+            response = await send_graph_request(
+                "POST", f"{GRAPH_BASE_URL}/$batch", cost=len(pending), headers=headers, json=payload
+            )
+        except httpx.HTTPError as e:
+            logger.error("Request exception in make_graph_batch: %s", e)
+            raise HTTPException(status_code=500, detail=f"Network error: {str(e)}")
+
+        if response.status_code != 200:
+            try:
+                error_data = response.json()
+            except:
+                error_data = response.text
+            raise graph_error(response.status_code, error_data)
+
+        throttled = []
+        retry_after = None
+        for item in response.json().get("responses", []):
+            index = int(item["id"])
+            status_code = item.get("status", 500)
+            body = item.get("body") or {}
+            item_headers = {k.lower(): v for k, v in (item.get("headers") or {}).items()}
+
+            if status_code == 200:
+                results[index] = body
+                if partition and response_cache.is_cacheable(endpoints[index]):
+                    await response_cache.store(partition, endpoints[index], body, item_headers)
+            elif status_code == 304 and cached[index] is not None:
+                results[index] = await response_cache.revalidated(partition, endpoints[index], cached[index])
+            elif status_code in THROTTLED_STATUS_CODES and attempt < GRAPH_MAX_RETRIES:
+                throttled.append(index)
+                item_retry_after = parse_retry_after(item_headers.get("retry-after"))
+                graph_throttle.record_response(status_code, item_retry_after)
+                if item_retry_after is not None:
+                    retry_after = max(retry_after or 0.0, item_retry_after)
+            else:
+                results[index] = graph_error(status_code, body)
+
+        if not throttled:
+            break
+
+        # Back off before retrying only the throttled sub-requests
+        delay = graph_throttle.backoff_delay(attempt, retry_after)
+        logger.warning("%d batch sub-requests throttled, retrying in %.2fs", len(throttled), delay)
+        graph_throttle.retries += 1
+        await asyncio.sleep(delay)
+        pending = throttled
+
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = HTTPException(status_code=500, detail="Graph API batch response missing sub-request")
+
+    return results
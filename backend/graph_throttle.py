@@ -0,0 +1,250 @@
+"""
+Client-side throttling, retry and circuit breaking for Microsoft Graph calls.
+
+Graph enforces per-tenant and per-app request limits and answers 429 (or 503)
+with a ``Retry-After`` hint when they are exceeded. Rather than surfacing those
+responses to users, Graph calls go through:
+
+- a per-tenant token bucket that paces outgoing requests and pauses the whole
+  tenant when Graph asks it to back off, plus a smaller per-tenant budget for
+  background work so crawls cannot starve user requests,
+- retries with ``Retry-After`` or jittered exponential backoff for throttled,
+  unavailable and network-failed requests, and
+- a circuit breaker that fails fast while Graph is consistently erroring, so a
+  degraded dependency does not tie up every worker in retries.
+"""
+import asyncio
+import random
+import time
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from fastapi import HTTPException
+
+# Tenant of the request being served; Graph limits are applied per tenant
+graph_tenant: ContextVar[Optional[str]] = ContextVar("graph_tenant", default=None)
+# Set by background work (drive index syncs), which is also paced by the tenant's background budget
+graph_background: ContextVar[bool] = ContextVar("graph_background", default=False)
+
+THROTTLED_STATUS_CODES = (429, 503)
+RETRYABLE_STATUS_CODES = (429, 502, 503, 504)
+# Responses that indicate Graph itself is unhealthy (429 is a quota signal, not a failure)
+FAILURE_STATUS_CODES = (500, 502, 503, 504)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Return a Retry-After header (seconds or HTTP date) as seconds from now"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Reservation-based token bucket; callers wait for their turn instead of being rejected"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+
+    def reserve(self, cost: float = 1) -> float:
+        """Take cost tokens and return how long the caller must wait before sending"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self.tokens -= cost
+
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def pause(self, seconds: float):
+        """Hold back every request for this bucket, e.g. after Graph returned Retry-After"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 10, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejections = 0
+        self._probe_in_flight = False
+        # Identifies the current half-open probe, so only its owner can abandon it
+        self._probe_id = 0
+
+    def allow(self) -> bool:
+        """Return True if a request may be sent now"""
+        return self.admit()[0]
+
+    def admit(self) -> tuple:
+        """Return (allowed, probe id); the probe id is set when the caller is the half-open probe"""
+        if self.failure_threshold <= 0 or self.state == self.CLOSED:
+            return True, None
+
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            self._probe_id += 1
+            return True, self._probe_id
+
+        self.rejections += 1
+        return False, None
+
+    def abandon_probe(self, probe_id: Optional[int]):
+        """Count a probe that ended without a recorded outcome (cancelled or errored) as a failure"""
+        # Once an outcome is recorded the probe is no longer in flight, so this is a no-op
+        if probe_id is not None and self._probe_in_flight and probe_id == self._probe_id:
+            self.record_failure()
+
+    def retry_after(self) -> float:
+        return max(self.reset_timeout - (time.monotonic() - self.opened_at), 1.0)
+
+    def record_success(self):
+        self.failures = 0
+        self.state = self.CLOSED
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and 0 < self.failure_threshold <= self.failures):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.opens += 1
+        self._probe_in_flight = False
+
+
+class GraphThrottle:
+    """Per-tenant pacing, retry policy and circuit breaker shared by all Graph calls"""
+
+    def __init__(self, tenant_rate: float = 50, tenant_burst: float = 100, max_retry_delay: float = 10,
+                 backoff_base: float = 0.5, breaker_failures: int = 10, breaker_reset: float = 30,
+                 background_rate: float = 5, background_burst: float = 10):
+        self.tenant_rate = tenant_rate
+        self.tenant_burst = tenant_burst
+        self.background_rate = background_rate
+        self.background_burst = background_burst
+        self.max_retry_delay = max_retry_delay
+        self.backoff_base = backoff_base
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset)
+        self._buckets = {}
+        self._background_buckets = {}
+        self.retries = 0
+        self.throttled_responses = 0
+        self.rate_limited_requests = 0
+        self.rate_limited_seconds = 0.0
+
+    def _bucket(self) -> Optional[TokenBucket]:
+        if self.tenant_rate <= 0:
+            return None
+        tenant_id = graph_tenant.get()
+        bucket = self._buckets.get(tenant_id)
+        if bucket is None:
+            bucket = self._buckets[tenant_id] = TokenBucket(self.tenant_rate, self.tenant_burst)
+        return bucket
+
+    def _background_bucket(self) -> Optional[TokenBucket]:
+        if self.background_rate <= 0 or not graph_background.get():
+            return None
+        tenant_id = graph_tenant.get()
+        bucket = self._background_buckets.get(tenant_id)
+        if bucket is None:
+            bucket = self._background_buckets[tenant_id] = TokenBucket(self.background_rate, self.background_burst)
+        return bucket
+
+    async def acquire(self, cost: float = 1) -> Optional[int]:
+        """
+        Fail fast while the breaker is open, otherwise wait for the tenant's rate limit.
+
+        Background requests take from both the tenant bucket and the tenant's
+        background bucket, so they never use more than the background budget.
+
+        Returns the probe id when this request is the breaker's half-open
+        probe. The caller must then record the outcome with ``record_response``
+        or ``record_network_error``, or call ``abandon_probe`` if it gives up.
+        """
+        allowed, probe_id = self.breaker.admit()
+        if not allowed:
+            retry_after = self.breaker.retry_after()
+            raise HTTPException(
+                status_code=503,
+                detail="Microsoft Graph is temporarily unavailable, please retry later",
+                headers={"Retry-After": str(int(retry_after))}
+            )
+
+        wait = max((bucket.reserve(cost) for bucket in (self._bucket(), self._background_bucket()) if bucket is not None),
+                   default=0.0)
+        if wait > 0:
+            self.rate_limited_requests += 1
+            self.rate_limited_seconds += wait
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                # Cancelled while waiting for the rate limit: release the probe for another request
+                self.abandon_probe(probe_id)
+                raise
+        return probe_id
+
+    def abandon_probe(self, probe_id: Optional[int]):
+        self.breaker.abandon_probe(probe_id)
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Delay before retry number attempt+1: Retry-After if given, else full-jitter exponential backoff"""
+        if retry_after is not None:
+            # A little jitter keeps clients released by the same Retry-After from retrying in lockstep
+            delay = retry_after + random.uniform(0, min(retry_after * 0.1, 1.0))
+        else:
+            delay = random.uniform(0, self.backoff_base * 2 ** attempt)
+        return min(delay, self.max_retry_delay)
+
+    def record_response(self, status_code: int, retry_after: Optional[float] = None):
+        """Update the breaker and tenant pacing from a Graph response status"""
+        if status_code in FAILURE_STATUS_CODES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        if status_code in THROTTLED_STATUS_CODES:
+            self.throttled_responses += 1
+            bucket = self._bucket()
+            if bucket is not None and retry_after:
+                bucket.pause(retry_after)
+
+    def record_network_error(self):
+        self.breaker.record_failure()
+
+    def stats(self) -> dict:
+        """Return retry, throttle and breaker counters for monitoring"""
+        return {
+            "retries": self.retries,
+            "throttled_responses": self.throttled_responses,
+            "rate_limited_requests": self.rate_limited_requests,
+            "rate_limited_seconds": round(self.rate_limited_seconds, 3),
+            "tenants": len(self._buckets),
+            "background_tenants": len(self._background_buckets),
+            "breaker_state": self.breaker.state,
+            "breaker_failures": self.breaker.failures,
+            "breaker_opens": self.breaker.opens,
+            "breaker_rejections": self.breaker.rejections
+        }
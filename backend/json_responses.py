@@ -0,0 +1,61 @@
+"""
+Fast JSON serialization for API responses.
+
+FastAPI normally walks every returned value with ``jsonable_encoder`` and then
+serializes the copy with the standard library encoder. Handlers here return
+plain dicts and lists built from Graph JSON, for which that walk only costs
+CPU. ``FastJSONRoute`` hands such results straight to ``FastJSONResponse``,
+which encodes them with orjson (when installed) in a single pass, and only
+falls back to ``jsonable_encoder`` for values orjson cannot encode.
+"""
+import asyncio
+import functools
+import json
+from typing import Any, Callable
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any, default: Callable = None) -> bytes:
+    """Serialize content to compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(content, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson, falling back to jsonable_encoder for other types"""
+
+    def render(self, content: Any) -> bytes:
+        try:
+            return dumps(content)
+        except TypeError:
+            # Pydantic models, sets and the like
+            return dumps(jsonable_encoder(content))
+
+
+def _respond_directly(endpoint: Callable, status_code: int) -> Callable:
+    @functools.wraps(endpoint)
+    async def wrapper(**kwargs):
+        result = await endpoint(**kwargs)
+        if type(result) in (dict, list):
+            return FastJSONResponse(result, status_code=status_code)
+        return result
+    return wrapper
+
+
+class FastJSONRoute(APIRoute):
+    """APIRoute that serializes plain dict and list results without the jsonable_encoder walk"""
+
+    def get_route_handler(self) -> Callable:
+        # Routes with a response model keep FastAPI's validation and serialization
+        if self.response_model is None and asyncio.iscoroutinefunction(self.dependant.call):
+            self.dependant.call = _respond_directly(self.dependant.call, self.status_code or 200)
+        return super().get_route_handler()
@@ -1,22 +1,113 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from fastapi import FastAPI, HTTPException, Depends, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import PlainTextResponse
 import msal
 import os
 from dotenv import load_dotenv
-import json
 import jwt
-import requests
 from jwt.exceptions import InvalidTokenError
 from msal import ConfidentialClientApplication
 
 load_dotenv()
 
+from app_logging import configure_logging, get_logger
+from cache_backend import close_shared_backend, shared_namespace
+from compression import CompressionMiddleware
+from drive_index import DriveIndexManager
+from extraction import find_extractor, run_extractor, shutdown_extraction_pool
+from extraction_cache import ExtractionCache
+from graph_client import (
+    GRAPH_BASE_URL,
+    close_http_client,
+    decode_cursor,
+    encode_cursor,
+    gather_with_concurrency,
+    graph_throttle,
+    iter_completed_with_concurrency,
+    iter_graph_items,
+    make_graph_batch,
+    make_graph_request,
+    read_text_prefix,
+    response_cache,
+    spool_response,
+    stream_graph_content,
+    with_page_size,
+)
+from graph_throttle import graph_tenant
+from json_responses import FastJSONResponse, FastJSONRoute
+from metrics import (
+    DOWNLOAD_BYTES,
+    OBO_EXCHANGE_SECONDS,
+    MetricsMiddleware,
+    metric_family,
+    register_collector,
+    render_metrics,
+)
+from projection import (
+    COLUMNS_PATTERN,
+    DRIVE_ITEM_SEARCH_SELECT,
+    DRIVE_ITEM_SELECT,
+    DRIVE_SELECT,
+    DOWNLOAD_URL_SELECT,
+    FIELDS_PATTERN,
+    FILE_METADATA_SELECT,
+    LIST_ITEM_SELECT,
+    LIST_SELECT,
+    PAGE_SELECT,
+    SITE_SELECT,
+    expand_fields,
+    parse_fields,
+    project,
+    with_select,
+)
+from server import ConcurrencyLimitMiddleware, serve
+from site_cache import SiteResolver
+from streaming import STREAM_FORMAT_PATTERN, event_stream_response
+from token_cache import NonPersistentTokenCache, OboTokenCache, hash_assertion
+from token_validation import JwksCache, ParsedToken, TokenValidator
+from tracing import TracingMiddleware, start_span
+
+# Logs are written by a background thread so stdout back-pressure never blocks requests
+configure_logging()
+auth_logger = get_logger("auth")
+obo_logger = get_logger("obo")
+logger = get_logger("api")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Manage shared resources for the lifetime of the application"""
+    # Keep the tenant's signing keys warm so token validation never waits on the network
+    jwks_cache.start_background_refresh()
+    yield
+    await jwks_cache.stop_background_refresh()
+    await drive_index.close()
+    # Release pooled Graph connections and worker pools on shutdown
+    await close_http_client()
+    shutdown_obo_executor()
+    # In-flight requests have drained by now, so waiting only lets the pool exit cleanly
+    await asyncio.to_thread(shutdown_extraction_pool, True)
+    await close_shared_backend()
+
 app = FastAPI(
     title="Microsoft Entra ID OBO Flow Demo",
     description="On-Behalf-Of (OBO) flow implementation for Microsoft Graph API access",
-    version="5.0.0"
+    version="5.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
+# Plain dict results are encoded directly instead of going through jsonable_encoder first
+app.router.route_class = FastJSONRoute
+
+# Compress large JSON responses; innermost, so compression counts towards the concurrency limit
+app.add_middleware(CompressionMiddleware)
+
+# Bound the requests each worker handles at once; added first so rejections still get CORS headers and metrics
+app.add_middleware(ConcurrencyLimitMiddleware)
 
 # CORS middleware configuration
 app.add_middleware(
@@ -27,7 +118,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-security = HTTPBearer()
+# Handler latency by route template; added last so it wraps CORS and also times preflights
+app.add_middleware(MetricsMiddleware)
+
+# Root span per request; spans for token validation, OBO and Graph calls nest under it
+app.add_middleware(TracingMiddleware)
 
 # Azure AD configuration
 TENANT_ID = os.getenv("AZURE_TENANT_ID")
@@ -39,97 +134,200 @@ AUTHORITY = os.getenv("AUTHORITY")
 PORT = int(os.getenv("PORT", "5000"))
 HOST = os.getenv("HOST", "localhost")
 
-# Initialize MSAL application for OBO flow
+# Initialize MSAL application for OBO flow; tokens are cached per user in obo_token_cache, not by MSAL
 msal_app = ConfidentialClientApplication(
     client_id=CLIENT_ID,
     client_credential=CLIENT_SECRET,
-    authority=AUTHORITY
+    authority=AUTHORITY,
+    token_cache=NonPersistentTokenCache()
+)
+
+# Per-user cache of Graph tokens obtained via OBO
+obo_token_cache = OboTokenCache(
+    max_entries=int(os.getenv("OBO_CACHE_MAX_ENTRIES", "1000")),
+    refresh_skew=int(os.getenv("OBO_CACHE_REFRESH_SKEW", "300")),
+    shared=shared_namespace("obo", encrypt=True)
+)
+
+# Largest page size clients may request (Graph caps most collections at 999)
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "999"))
+
+# File searches match names ("name", answered from drive indexes when ready) or names and content via Graph search
+SEARCH_SCOPE_PATTERN = "^(name|content)$"
+# Name matches returned per drive from an index, like a page of Graph search results
+INDEX_SEARCH_LIMIT = 200
+
+# File content downloads are streamed, so the size cap only bounds temp disk use
+MAX_DOWNLOAD_BYTES = int(os.getenv("MAX_DOWNLOAD_MB", "250")) * 1024 * 1024
+MAX_EXTRACT_CHARS = int(os.getenv("MAX_EXTRACT_CHARS", "100000"))
+
+# Extracted text keyed by drive item and content tag
+extraction_cache = ExtractionCache(
+    max_memory_bytes=int(os.getenv("EXTRACTION_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+    disk_dir=os.getenv("EXTRACTION_CACHE_DIR") or None,
+    max_disk_bytes=int(os.getenv("EXTRACTION_CACHE_DISK_MB", "1024")) * 1024 * 1024
+)
+
+# Tenant-scoped cache of resolved SharePoint site IDs
+site_resolver = SiteResolver(
+    ttl=int(os.getenv("SITE_CACHE_TTL", "900")),
+    negative_ttl=int(os.getenv("SITE_CACHE_NEGATIVE_TTL", "120")),
+    max_url_indexes=int(os.getenv("SITE_CACHE_MAX_INDEXES", "100")),
+    shared=shared_namespace("site")
+)
+
+# Per-user drive indexes maintained with delta queries for listing, search and recent files
+drive_index = DriveIndexManager(
+    refresh_interval=int(os.getenv("DRIVE_INDEX_REFRESH_INTERVAL", "60")),
+    max_indexes=int(os.getenv("DRIVE_INDEX_MAX_DRIVES", "50")),
+    max_items=int(os.getenv("DRIVE_INDEX_MAX_ITEMS", "20000")),
+    max_total_items=int(os.getenv("DRIVE_INDEX_MAX_TOTAL_ITEMS", "200000")),
+    enabled=os.getenv("DRIVE_INDEX_ENABLED", "true").lower() == "true"
+)
+
+# Signing keys and validation settings for incoming access tokens
+EXPECTED_AUDIENCE = f"api://{CLIENT_ID}"
+JWKS_URL = os.getenv("JWKS_URL", f"https://login.microsoftonline.com/{TENANT_ID}/discovery/v2.0/keys")
+TOKEN_ISSUERS = os.getenv(
+    "TOKEN_ISSUERS",
+    f"https://sts.windows.net/{TENANT_ID}/,https://login.microsoftonline.com/{TENANT_ID}/v2.0"
+).split(",")
+
+jwks_cache = JwksCache(
+    JWKS_URL,
+    refresh_interval=int(os.getenv("JWKS_REFRESH_INTERVAL", "3600"))
+)
+token_validator = TokenValidator(
+    jwks_cache,
+    audience=EXPECTED_AUDIENCE,
+    issuers=TOKEN_ISSUERS,
+    leeway=int(os.getenv("TOKEN_CLOCK_SKEW", "60")),
+    cache_size=int(os.getenv("TOKEN_VALIDATION_CACHE_SIZE", "1024"))
 )
 
-def validate_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Validate the incoming token for our custom API scope"""
+# MSAL is synchronous, so OBO exchanges run on a bounded thread pool
+OBO_MAX_WORKERS = int(os.getenv("OBO_MAX_WORKERS", "8"))
+_obo_executor = None
+
+# In-flight OBO exchanges keyed by cache key, shared by concurrent callers
+_obo_inflight = {}
+
+def get_obo_executor() -> ThreadPoolExecutor:
+    """Return the thread pool used for MSAL calls, creating it on first use"""
+    global _obo_executor
+    if _obo_executor is None:
+        _obo_executor = ThreadPoolExecutor(max_workers=OBO_MAX_WORKERS, thread_name_prefix="obo")
+    return _obo_executor
+
+def shutdown_obo_executor():
+    """Stop the OBO worker threads; the next exchange creates a fresh pool"""
+    global _obo_executor
+    if _obo_executor is not None:
+        _obo_executor.shutdown(wait=False)
+        _obo_executor = None
+
+async def get_parsed_token(authorization: str = Header(...)) -> ParsedToken:
+    """Extract and validate the bearer token once, sharing the parsed result with the handler"""
     if not all([TENANT_ID, CLIENT_ID]):
         raise HTTPException(
             status_code=500,
             detail="Azure AD configuration is incomplete. Please check environment variables."
         )
 
-    try:
-        token = credentials.credentials
-        print(f"Received token length: {len(token) if token else 'None'}")
-        
-        if not token or len(token) < 10:
-            raise HTTPException(status_code=401, detail="Token is empty or too short")
-        
-        # Decode without verification for basic validation
-        try:
-            unverified_payload = jwt.decode(token, options={"verify_signature": False})
-            
-            # Validate audience - should be our custom API
-            aud = unverified_payload.get('aud')
-            expected_audience = f"api://{CLIENT_ID}"
-            
-            if aud != expected_audience:
-                print(f"Token audience mismatch. Got: {aud}, Expected: {expected_audience}")
-                raise HTTPException(
-                    status_code=401, 
-                    detail=f"Token must be for custom API scope: {expected_audience}"
-                )
-            
-            print(f"✅ Token validation successful. Audience: {aud}")
-            return unverified_payload
-            
-        except Exception as decode_error:
-            print(f"Error decoding token: {decode_error}")
-            raise HTTPException(status_code=401, detail=f"Invalid token format: {str(decode_error)}")
-        
-    except Exception as e:
-        print(f"Token validation error: {str(e)}")
-        raise HTTPException(status_code=401, detail=f"Token validation failed: {str(e)}")
-
-async def get_bearer_token(authorization: str = Header(...)) -> str:
-    """Extract and validate bearer token from authorization header"""
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid authorization header")
     
     token = authorization.split(" ")[1]
     
-    # Validate that the token is for our custom API
+    if not token or len(token) < 10:
+        raise HTTPException(status_code=401, detail="Token is empty or too short")
+    
+    # Verify signature, issuer, audience and expiry against the tenant's signing keys
     try:
-        unverified_payload = jwt.decode(token, options={"verify_signature": False})
-        aud = unverified_payload.get('aud')
-        expected_audience = f"api://{CLIENT_ID}"
+        assertion_hash = hash_assertion(token)
+        with start_span("validate_token") as span:
+            claims = await token_validator.validate(token, token_hash=assertion_hash)
+            span.set_attribute("enduser.tenant_id", claims.get("tid"))
         
-        if aud != expected_audience:
-            raise HTTPException(
-                status_code=401, 
-                detail=f"Token must be for custom API scope: {expected_audience}"
-            )
+        # Pace this request's Graph calls against its tenant's rate limit
+        graph_tenant.set(claims.get("tid") or TENANT_ID)
         
-        return token
+        return ParsedToken(
+            raw=token,
+            claims=claims,
+            audience=claims.get("aud"),
+            audience_valid=claims.get("aud") == EXPECTED_AUDIENCE,
+            assertion_hash=assertion_hash
+        )
         
-    except jwt.InvalidTokenError as e:
-        print(f"Token validation error: {str(e)}")
-        raise HTTPException(status_code=401, detail="Invalid token format")
+    except jwt.InvalidAudienceError:
+        auth_logger.warning("Token audience mismatch. Expected: %s", EXPECTED_AUDIENCE)
+        raise HTTPException(
+            status_code=401, 
+            detail=f"Token must be for custom API scope: {EXPECTED_AUDIENCE}"
+        )
+    except InvalidTokenError as e:
+        auth_logger.warning("Token validation error: %s", e)
+        raise HTTPException(status_code=401, detail=f"Invalid token format: {str(e)}")
     except Exception as e:
-        print(f"Unexpected token validation error: {str(e)}")
+        auth_logger.exception("Unexpected token validation error: %s", e)
         raise HTTPException(status_code=401, detail="Token validation failed")
 
-async def exchange_token_via_obo(user_token: str, scopes: list) -> str:
+async def exchange_token_via_obo(user_token: ParsedToken, scopes: list) -> str:
     """
     OBO Flow: Exchange user token for Microsoft Graph token
     """
+    with start_span("exchange_token_via_obo", {"obo.scopes": " ".join(scopes)}) as span:
+        cache_key = OboTokenCache.make_key(user_token.assertion_hash, scopes)
+        cached_token = await obo_token_cache.get(cache_key)
+        if cached_token:
+            span.set_attribute("obo.cache", "hit")
+            obo_logger.info("Using cached OBO token", extra={"sampled": True})
+            return cached_token
+
+        # Concurrent requests for the same user and scopes share a single exchange
+        exchange = _obo_inflight.get(cache_key)
+        if exchange is None:
+            span.set_attribute("obo.cache", "miss")
+            exchange = asyncio.ensure_future(_acquire_token_on_behalf_of(user_token.raw, scopes, cache_key))
+            _obo_inflight[cache_key] = exchange
+            exchange.add_done_callback(partial(_finish_obo_exchange, cache_key))
+        else:
+            span.set_attribute("obo.cache", "shared")
+            obo_logger.info("Joining in-flight OBO token exchange", extra={"sampled": True})
+
+        # Shield so one cancelled caller does not cancel the exchange for the others
+        return await asyncio.shield(exchange)
+
+def _finish_obo_exchange(cache_key: str, exchange: asyncio.Future):
+    """Forget a completed in-flight exchange"""
+    _obo_inflight.pop(cache_key, None)
+    if not exchange.cancelled():
+        # Mark the exception as retrieved in case every waiter was cancelled
+        exchange.exception()
+
+async def _acquire_token_on_behalf_of(user_token: str, scopes: list, cache_key: str) -> str:
+    """Run the MSAL OBO exchange on the worker pool and cache the result"""
     try:
-        print(f"🔄 Starting OBO token exchange...")
-        print(f"Requested scopes: {scopes}")
+        obo_logger.info("Starting OBO token exchange", extra={"scopes": scopes})
         
-        result = msal_app.acquire_token_on_behalf_of(
-            user_assertion=user_token,
-            scopes=scopes
-        )
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        with start_span("msal acquire_token_on_behalf_of") as span:
+            result = await loop.run_in_executor(
+                get_obo_executor(),
+                partial(msal_app.acquire_token_on_behalf_of, user_assertion=user_token, scopes=scopes)
+            )
+            span.set_attribute("msal.correlation_id", result.get("correlation_id"))
+            span.set_attribute("msal.token_source", result.get("token_source"))
+            if "access_token" not in result:
+                span.status = "error"
+                span.set_attribute("msal.error", result.get("error"))
+        OBO_EXCHANGE_SECONDS.labels("success" if "access_token" in result else "error").observe(time.perf_counter() - start)
 
         if "access_token" in result:
-            print("✅ OBO token exchange successful")
+            obo_logger.info("OBO token exchange successful", extra={"scopes": scopes})
+            await obo_token_cache.set(cache_key, result)
             return result["access_token"]
         else:
             # Handle OBO flow errors
@@ -137,10 +335,10 @@ async def exchange_token_via_obo(user_token: str, scopes: list) -> str:
             error_description = result.get("error_description", "No description available")
             correlation_id = result.get("correlation_id", "N/A")
             
-            print(f"❌ OBO token exchange failed:")
-            print(f"  Error Code: {error_code}")
-            print(f"  Description: {error_description}")
-            print(f"  Correlation ID: {correlation_id}")
+            obo_logger.error("OBO token exchange failed: %s", error_description, extra={
+                "error_code": error_code,
+                "correlation_id": correlation_id
+            })
             
             # Provide specific error messages based on error code
             if error_code == "invalid_grant":
@@ -167,47 +365,12 @@ async def exchange_token_via_obo(user_token: str, scopes: list) -> str:
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Unexpected error in OBO flow: {str(e)}")
+        obo_logger.exception("Unexpected error in OBO flow: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Token exchange failed: {str(e)}"
         )
 
-async def make_graph_request(endpoint: str, graph_token: str) -> dict:
-    """Make a request to Microsoft Graph API with proper error handling"""
-    try:
-        headers = {
-            "Authorization": f"Bearer {graph_token}",
-            "Content-Type": "application/json"
-        }
-        
-        print(f"🌐 Making Graph API request to: {endpoint}")
-        response = requests.get(endpoint, headers=headers, timeout=30)
-        
-        if response.status_code == 200:
-            print("✅ Graph API request successful")
-            return response.json()
-        elif response.status_code == 401:
-            raise HTTPException(status_code=401, detail="Unauthorized: Token may be expired or invalid")
-        elif response.status_code == 403:
-            raise HTTPException(status_code=403, detail="Forbidden: Insufficient permissions")
-        else:
-            error_detail = f"Graph API call failed with status {response.status_code}"
-            try:
-                error_data = response.json()
-                if "error" in error_data:
-                    error_detail += f": {error_data['error'].get('message', 'Unknown error')}"
-            except:
-                error_detail += f": {response.text}"
-            raise HTTPException(status_code=response.status_code, detail=error_detail)
-            
-    except requests.exceptions.RequestException as e:
-        print(f"Request exception in make_graph_request: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Network error: {str(e)}")
-    except Exception as e:
-        print(f"Unexpected error in make_graph_request: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
-
 @app.get("/")
 async def root():
     return {
@@ -237,403 +400,1039 @@ async def root():
         }
     }
 
+async def user_section(token: ParsedToken) -> dict:
+    """Basic user details from the token claims"""
+    token_data = token.claims
+    
+    return {
+        "message": "Successfully authenticated with custom API scope",
+        "user_info": {
+            "name": token_data.get("name", "Unknown"),
+            "email": token_data.get("email", token_data.get("preferred_username", "Unknown")),
+            "oid": token_data.get("oid", "Unknown"),
+            "preferred_username": token_data.get("preferred_username", "Unknown"),
+            "given_name": token_data.get("given_name", "Unknown"),
+            "family_name": token_data.get("family_name", "Unknown"),
+            "tenant_id": token_data.get("tid", "Unknown"),
+            "scope": token_data.get("scp", "Unknown")
+        },
+        "authentication_method": "OBO Flow with Custom API Scope",
+        "raw_token_claims": token_data
+    }
+
 @app.get("/api/user")
-async def get_user_details(token_data: dict = Depends(validate_token)):
+async def get_user_details(token: ParsedToken = Depends(get_parsed_token)):
     """Get basic user details from token claims"""
     try:
-        print("Complete token data:", json.dumps(token_data, indent=2))
-        
-        return {
-            "message": "Successfully authenticated with custom API scope",
-            "user_info": {
-                "name": token_data.get("name", "Unknown"),
-                "email": token_data.get("email", token_data.get("preferred_username", "Unknown")),
-                "oid": token_data.get("oid", "Unknown"),
-                "preferred_username": token_data.get("preferred_username", "Unknown"),
-                "given_name": token_data.get("given_name", "Unknown"),
-                "family_name": token_data.get("family_name", "Unknown"),
-                "tenant_id": token_data.get("tid", "Unknown"),
-                "scope": token_data.get("scp", "Unknown")
-            },
-            "authentication_method": "OBO Flow with Custom API Scope",
-            "raw_token_claims": token_data
-        }
+        return await user_section(token)
     except Exception as e:
-        print(f"Error in get_user_details: {str(e)}")
+        logger.exception("Error in get_user_details: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+async def graph_user_section(graph_token: str) -> dict:
+    """The signed-in user's Graph profile"""
+    user_data = await make_graph_request(f"{GRAPH_BASE_URL}/me", graph_token)
+
+    return {
+        "message": "Successfully retrieved user information via OBO Flow",
+        "user_data": user_data,
+        "authentication_method": "OBO Flow",
+        "scopes_used": ["User.Read"]
+    }
+
 @app.get("/api/graph/user")
-async def get_graph_user_info(token: str = Depends(get_bearer_token)):
+async def get_graph_user_info(
+    fields: str = Query(None, pattern=FIELDS_PATTERN),
+    token: ParsedToken = Depends(get_parsed_token)
+):
     """Get detailed user information from Microsoft Graph API using OBO Flow"""
     try:
         # Exchange user token for Graph API token using OBO flow
         graph_token = await exchange_token_via_obo(token, ["https://graph.microsoft.com/User.Read"])
         
-        # Use the OBO token to call Graph API
-        user_data = await make_graph_request("https://graph.microsoft.com/v1.0/me", graph_token)
-
-        return {
-            "message": "Successfully retrieved user information via OBO Flow",
-            "user_data": user_data,
-            "authentication_method": "OBO Flow",
-            "scopes_used": ["User.Read"]
-        }
+        return project(await graph_user_section(graph_token), parse_fields(fields))
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_graph_user_info: {str(e)}")
+        logger.exception("Error in get_graph_user_info: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+async def sites_section(graph_token: str) -> dict:
+    """The root site and the sites the user follows"""
+    # Get root site and followed sites in a single batch round trip
+    root_site, followed_sites = await make_graph_batch([
+        with_select(f"{GRAPH_BASE_URL}/sites/root", SITE_SELECT),
+        with_select(f"{GRAPH_BASE_URL}/me/followedSites", SITE_SELECT)
+    ], graph_token)
+    
+    if isinstance(root_site, Exception):
+        raise root_site
+    if isinstance(followed_sites, Exception):
+        followed_sites = {"value": [], "note": "Could not retrieve followed sites"}
+
+    return {
+        "message": "Successfully retrieved SharePoint sites via OBO Flow",
+        "root_site": root_site,
+        "followed_sites": followed_sites,
+        "authentication_method": "OBO Flow",
+        "scopes_used": ["Sites.Read.All"]
+    }
+
 @app.get("/api/sharepoint/sites")
-async def get_sharepoint_sites(token: str = Depends(get_bearer_token)):
+async def get_sharepoint_sites(
+    fields: str = Query(None, pattern=FIELDS_PATTERN),
+    token: ParsedToken = Depends(get_parsed_token)
+):
     """Get SharePoint sites information using OBO Flow"""
     try:
         # Exchange user token for Graph API token using OBO flow
         graph_token = await exchange_token_via_obo(token, ["https://graph.microsoft.com/Sites.Read.All"])
         
-        # Get root site and followed sites
-        root_site = await make_graph_request("https://graph.microsoft.com/v1.0/sites/root", graph_token)
+        return project(await sites_section(graph_token), parse_fields(fields))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in get_sharepoint_sites: %s", e)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+def drives_url(site_id: str) -> str:
+    """Graph URL for a site's document libraries"""
+    return with_select(f"{GRAPH_BASE_URL}/sites/{site_id}/drives", DRIVE_SELECT)
+
+def lists_url(site_id: str) -> str:
+    """Graph URL for a site's lists"""
+    return with_select(f"{GRAPH_BASE_URL}/sites/{site_id}/lists", LIST_SELECT)
+
+async def read_collection(endpoint: str, graph_token: str) -> dict:
+    """Every item of a Graph collection, following @odata.nextLink, as a single {"value": [...]} page"""
+    return {"value": [item async for item in iter_graph_items(endpoint, graph_token)]}
+
+def library_file_entry(file_item: dict, drive_name: str) -> dict:
+    """Shape a driveItem for the libraries file listing"""
+    return {
+        "id": file_item.get("id"),
+        "name": file_item.get("name"),
+        "size": file_item.get("size", 0),
+        "content_type": file_item.get("file", {}).get("mimeType", "unknown"),
+        "drive_name": drive_name,
+        "last_modified": file_item.get("lastModifiedDateTime", ""),
+        "web_url": file_item.get("webUrl", "")
+    }
+
+def library_search_entry(file_item: dict, drive_name: str) -> dict:
+    """Shape a driveItem for the libraries search results"""
+    return {
+        "id": file_item.get("id"),
+        "name": file_item.get("name"),
+        "size": file_item.get("size", 0),
+        "content_type": file_item.get("file", {}).get("mimeType", "unknown"),
+        "web_url": file_item.get("webUrl", ""),
+        "drive_name": drive_name,
+        "last_modified": file_item.get("lastModifiedDateTime", ""),
+        "download_url": file_item.get("@microsoft.graph.downloadUrl", "")
+    }
+
+def library_drive_files(drive: dict, files: dict, index, site_id: str, limit: int) -> tuple:
+    """Return (file entries, next cursor) for the first page of one drive in the libraries listing"""
+    drive_name = drive.get("name", "Unknown")
+    entries = [library_file_entry(file_item, drive_name) for file_item in files.get("value", [])[:limit]]
+    
+    # Let clients page through large drives without the server buffering them
+    if index is not None and len(files.get("value", [])) > limit:
+        next_cursor = encode_cursor(
+            with_page_size(with_select(f"{GRAPH_BASE_URL}/drives/{drive.get('id')}/root/children", DRIVE_ITEM_SELECT), limit),
+            drive_name=drive_name, site_id=site_id, drive_id=drive.get("id"), offset=limit
+        )
+    else:
+        next_cursor = encode_cursor(files.get("@odata.nextLink"), drive_name=drive_name, site_id=site_id)
+    return entries, next_cursor
+
+def drive_query_url(site_id: str, drive_id: str, search_name: str = None, page_size: int = None) -> str:
+    """Graph URL listing the root of (or searching) one drive"""
+    if search_name:
+        return with_select(f"{GRAPH_BASE_URL}/sites/{site_id}/drives/{drive_id}/root/search(q='{search_name}')",
+                           DRIVE_ITEM_SEARCH_SELECT)
+    return with_page_size(
+        with_select(f"{GRAPH_BASE_URL}/sites/{site_id}/drives/{drive_id}/root/children", DRIVE_ITEM_SELECT), page_size
+    )
+
+def stream_error(error: Exception) -> str:
+    """Describe a failed drive or list in a streamed event"""
+    return error.detail if isinstance(error, HTTPException) else str(error)
+
+async def index_search_page(index, search_name: str, graph_token: str) -> dict:
+    """
+    Files in an indexed drive whose names match search_name, as a Graph search page.
+
+    The index does not keep download URLs, so they are fetched for the
+    matching files only, in batched round trips.
+    """
+    hits = index.search(search_name, limit=INDEX_SEARCH_LIMIT)
+    files = [entry for entry in hits if "file" in entry]
+    endpoints = [with_select(f"{GRAPH_BASE_URL}/drives/{index.drive_id}/items/{entry['id']}", DOWNLOAD_URL_SELECT)
+                 for entry in files]
+    results = await make_graph_batch(endpoints, graph_token) if endpoints else []
+    
+    download_urls = {
+        entry["id"]: result.get("@microsoft.graph.downloadUrl")
+        for entry, result in zip(files, results) if not isinstance(result, Exception)
+    }
+    return {"value": [
+        {**entry, "@microsoft.graph.downloadUrl": download_urls[entry["id"]]} if entry["id"] in download_urls else entry
+        for entry in hits
+    ]}
+
+def drive_indexes(drives: list, token: ParsedToken, graph_token: str, search_name: str, search_scope: str) -> list:
+    """Ready indexes for the drives (None where a drive must be queried live)"""
+    # Only Graph search matches file content and metadata, so content searches never use the indexes
+    if search_name and search_scope != "name":
+        return [None] * len(drives)
+    return [drive_index.get(token.user_key, drive.get("id"), graph_token) for drive in drives]
+
+async def query_drives(drives: list, site_id: str, token: ParsedToken, graph_token: str,
+                       search_name: str = None, page_size: int = None, search_scope: str = "name") -> list:
+    """
+    List root files of (or search) each drive, returning (files, index) pairs.
+
+    Listings and name searches of drives with a ready index are answered from
+    memory; content searches and the remaining drives are queried live in
+    batched round trips. A failing drive yields its exception as files.
+    """
+    indexes = drive_indexes(drives, token, graph_token, search_name, search_scope)
+    
+    live = [i for i, index in enumerate(indexes) if index is None]
+    drive_urls = [drive_query_url(site_id, drives[i].get("id"), search_name, page_size) for i in live]
+    live_results = dict(zip(live, await make_graph_batch(drive_urls, graph_token))) if live else {}
+    
+    searched = [i for i, index in enumerate(indexes) if index is not None and search_name]
+    search_pages = [index_search_page(indexes[i], search_name, graph_token) for i in searched]
+    index_results = dict(zip(searched, await gather_with_concurrency(search_pages))) if searched else {}
+    
+    results = []
+    for i, index in enumerate(indexes):
+        if index is None:
+            results.append((live_results[i], None))
+        elif search_name:
+            results.append((index_results[i], index))
+        else:
+            results.append(({"value": index.children()}, index))
+    return results
+
+async def iter_drives(drives: list, site_id: str, token: ParsedToken, graph_token: str,
+                      search_name: str = None, page_size: int = None, search_scope: str = "name"):
+    """
+    Like ``query_drives``, but yield (drive, files, index) as each drive's results arrive.
+
+    Indexed listings are yielded first. The rest are fetched with one request
+    (or, for indexed name searches, one download URL batch) per drive rather
+    than a shared batch, so a slow drive does not hold back the others.
+    """
+    pending = []
+    for drive, index in zip(drives, drive_indexes(drives, token, graph_token, search_name, search_scope)):
+        if index is not None and not search_name:
+            yield drive, {"value": index.children()}, index
+        else:
+            pending.append((drive, index))
+    
+    requests = [
+        index_search_page(index, search_name, graph_token) if index is not None
+        else make_graph_request(drive_query_url(site_id, drive.get("id"), search_name, page_size), graph_token)
+        for drive, index in pending
+    ]
+    async for position, files in iter_completed_with_concurrency(requests):
+        drive, index = pending[position]
+        yield drive, files, index
+
+async def indexed_children_page(next_link: str, context: dict, limit: int, token: ParsedToken, graph_token: str) -> tuple:
+    """Return (files, next_cursor) for a cursor issued from a drive index listing"""
+    offset = context["offset"]
+    index = drive_index.get(token.user_key, context.get("drive_id"), graph_token)
+    if index is not None:
+        children = index.children()
+        has_more = len(children) > offset + limit
+        files = children[offset:offset + limit]
+    else:
+        # The index was evicted since the cursor was issued; skip ahead through the live listing
+        children = [item async for item in iter_graph_items(next_link, graph_token, max_items=offset + limit + 1)]
+        has_more = len(children) > offset + limit
+        files = children[offset:offset + limit]
+    
+    next_cursor = encode_cursor(next_link, **{**context, "offset": offset + limit}) if has_more else None
+    return files, next_cursor
+
+async def library_events(libraries: dict, site_id: str, search_name: str, limit: int,
+                         token: ParsedToken, graph_token: str, search_scope: str = "name"):
+    """Events for the streamed libraries listing: libraries, one drive event per drive, summary"""
+    drives = libraries.get("value", [])
+    yield "libraries", {"site_id": site_id, "libraries": drives}
+    
+    files_count = 0
+    next_cursors = {}
+    async for drive, files, index in iter_drives(drives, site_id, token, graph_token, search_name=search_name, page_size=limit,
+                                                 search_scope=search_scope):
+        drive_name = drive.get("name", "Unknown")
+        drive_event = {"drive_id": drive.get("id"), "drive_name": drive_name}
         
-        try:
-            followed_sites = await make_graph_request("https://graph.microsoft.com/v1.0/me/followedSites", graph_token)
-        except:
-            followed_sites = {"value": [], "note": "Could not retrieve followed sites"}
+        if isinstance(files, Exception):
+            logger.warning("Error processing drive %s: %s", drive_name, files)
+            drive_event["error"] = stream_error(files)
+        elif search_name:
+            drive_event["search_results"] = [library_search_entry(file_item, drive_name) for file_item in files.get("value", [])]
+            files_count += len(drive_event["search_results"])
+        else:
+            drive_event["files"], drive_event["next_cursor"] = library_drive_files(drive, files, index, site_id, limit)
+            files_count += len(drive_event["files"])
+            if drive_event["next_cursor"]:
+                next_cursors[drive.get("id")] = drive_event["next_cursor"]
+        yield "drive", drive_event
+    
+    summary = {
+        "site_id": site_id,
+        "libraries_count": len(drives),
+        "files_count": files_count,
+        "authentication_method": "OBO Flow",
+        "scopes_used": ["Sites.Read.All"]
+    }
+    if search_name:
+        summary["message"] = f"Found {files_count} file(s) matching '{search_name}' in document libraries"
+        summary["search_term"] = search_name
+    else:
+        summary["message"] = "Successfully retrieved SharePoint document libraries via OBO Flow"
+        summary["next_cursors"] = next_cursors
+    yield "summary", summary
 
+async def libraries_section(site_id: str, search_name: str, limit: int, token: ParsedToken, graph_token: str,
+                            search_scope: str = "name") -> dict:
+    """A site's document libraries with the first page of files of each, or the files matching search_name"""
+    # Get document libraries (drives)
+    libraries = await read_collection(drives_url(site_id), graph_token)
+    
+    # Get files from document libraries
+    all_files = []
+    search_results = []
+    next_cursors = {}
+    
+    # Query all drives from their indexes or in batched round trips; a failing drive does not fail the request
+    drives = libraries.get("value", [])
+    drive_results = await query_drives(drives, site_id, token, graph_token, search_name=search_name, page_size=limit,
+                                       search_scope=search_scope)
+    
+    for drive, (files, index) in zip(drives, drive_results):
+        drive_name = drive.get("name", "Unknown")
+        
+        if isinstance(files, Exception):
+            logger.warning("Error processing drive %s: %s", drive_name, files)
+        elif search_name:
+            search_results.extend(library_search_entry(file_item, drive_name) for file_item in files.get("value", []))
+        else:
+            # Show first page of files per drive
+            drive_files, drive_cursor = library_drive_files(drive, files, index, site_id, limit)
+            all_files.extend(drive_files)
+            if drive_cursor:
+                next_cursors[drive.get("id")] = drive_cursor
+    
+    if search_name and search_results:
         return {
-            "message": "Successfully retrieved SharePoint sites via OBO Flow",
-            "root_site": root_site,
-            "followed_sites": followed_sites,
+            "message": f"Found {len(search_results)} file(s) matching '{search_name}' in document libraries",
+            "instruction": "Copy a file 'id' from below. Note: File content reading requires Files.Read.All permission.",
+            "search_results": search_results,
+            "site_id": site_id,
+            "search_term": search_name,
+            "permission_note": "Files.Read.All consent required for content reading",
+            "authentication_method": "OBO Flow",
+            "scopes_used": ["Sites.Read.All"]
+        }
+    elif search_name:
+        return {
+            "message": f"No files found matching '{search_name}' in document libraries",
+            "instruction": "Try a different search term or leave search_name empty to see all files",
+            "site_id": site_id,
+            "authentication_method": "OBO Flow"
+        }
+    else:
+        return {
+            "message": "Successfully retrieved SharePoint document libraries via OBO Flow",
+            "site_id": site_id,
+            "libraries": libraries.get("value", []),
+            "all_files": all_files,
+            "files_count": len(all_files),
+            "next_cursors": next_cursors,
+            "instruction": "Copy file IDs to use with File Content Reader (requires Files.Read.All consent)",
+            "permission_note": "Files.Read.All admin consent required for content reading functionality",
             "authentication_method": "OBO Flow",
             "scopes_used": ["Sites.Read.All"]
         }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Error in get_sharepoint_sites: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/api/sharepoint/libraries")
-async def get_sharepoint_libraries(site_id: str = None, search_name: str = None, token: str = Depends(get_bearer_token)):
-    """Get SharePoint document libraries and their files using OBO Flow"""
+async def get_sharepoint_libraries(
+    site_id: str = None,
+    search_name: str = None,
+    search_scope: str = Query("name", pattern=SEARCH_SCOPE_PATTERN),
+    cursor: str = None,
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    stream: str = Query(None, pattern=STREAM_FORMAT_PATTERN),
+    fields: str = Query(None, pattern=FIELDS_PATTERN),
+    token: ParsedToken = Depends(get_parsed_token)
+):
+    """
+    Get SharePoint document libraries and their files using OBO Flow.
+
+    With ``stream=sse`` or ``stream=ndjson`` the listing is streamed: a
+    ``libraries`` event, one ``drive`` event per library as its files arrive,
+    then a ``summary`` event. ``fields`` trims the libraries and files to the
+    given properties. ``search_name`` matches file names by default, from the
+    drive indexes where ready; ``search_scope=content`` searches file content
+    and metadata through Graph search instead.
+    """
     try:
         # Exchange user token for Graph API token using OBO flow
         graph_token = await exchange_token_via_obo(token, ["https://graph.microsoft.com/Sites.Read.All"])
         
-        # Use root site if no site_id provided, but try to find the specific site if it looks like a domain
-        if not site_id:
-            root_site = await make_graph_request("https://graph.microsoft.com/v1.0/sites/root", graph_token)
-            site_id = root_site.get("id", "root")
-        elif site_id and "sharepoint.com" in site_id and "," not in site_id:
-            # If site_id looks like a domain, find the actual site ID
-            try:
-                sites = await make_graph_request("https://graph.microsoft.com/v1.0/sites?search=*", graph_token)
-                for site in sites.get("value", []):
-                    if site_id in site.get("webUrl", ""):
-                        site_id = site.get("id")
-                        break
-            except:
-                pass
+        # Continue paging through a single drive when a cursor is supplied
+        if cursor:
+            next_link, context = decode_cursor(cursor)
+            if "offset" in context:
+                files, next_cursor = await indexed_children_page(next_link, context, limit, token, graph_token)
+            else:
+                page = await make_graph_request(next_link, graph_token)
+                files, next_cursor = page.get("value", []), encode_cursor(page.get("@odata.nextLink"), **context)
+            drive_name = context.get("drive_name", "Unknown")
+            page_files = [library_file_entry(file_item, drive_name) for file_item in files]
+            
+            return project({
+                "message": "Successfully retrieved the next page of SharePoint files via OBO Flow",
+                "site_id": context.get("site_id"),
+                "drive_name": drive_name,
+                "all_files": page_files,
+                "files_count": len(page_files),
+                "next_cursor": next_cursor,
+                "authentication_method": "OBO Flow",
+                "scopes_used": ["Sites.Read.All"]
+            }, parse_fields(fields))
         
-        # Get document libraries (drives)
-        libraries = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives", graph_token)
+        # Resolve root, hostname and URL-style site IDs through the tenant site cache
+        site_id = await site_resolver.resolve(site_id, graph_token, token.tenant_id, token.user_key)
         
-        # Get files from document libraries
-        all_files = []
-        search_results = []
+        if stream:
+            libraries = await read_collection(drives_url(site_id), graph_token)
+            return event_stream_response(
+                library_events(libraries, site_id, search_name, limit, token, graph_token, search_scope), stream,
+                fields=parse_fields(fields)
+            )
         
-        if libraries.get("value"):
-            for drive in libraries["value"]:
-                drive_id = drive.get("id")
-                drive_name = drive.get("name", "Unknown")
-                
-                try:
-                    if search_name:
-                        # Search for specific file
-                        search_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root/search(q='{search_name}')"
-                        search_files = await make_graph_request(search_url, graph_token)
-                        
-                        for file_item in search_files.get("value", []):
-                            search_results.append({
-                                "id": file_item.get("id"),
-                                "name": file_item.get("name"),
-                                "size": file_item.get("size", 0),
-                                "content_type": file_item.get("file", {}).get("mimeType", "unknown"),
-                                "web_url": file_item.get("webUrl", ""),
-                                "drive_name": drive_name,
-                                "last_modified": file_item.get("lastModifiedDateTime", ""),
-                                "download_url": file_item.get("@microsoft.graph.downloadUrl", "")
-                            })
-                    else:
-                        # Get all files from drive root
-                        files = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root/children", graph_token)
-                        
-                        for file_item in files.get("value", [])[:10]:  # Show first 10 files per drive
-                            all_files.append({
-                                "id": file_item.get("id"),
-                                "name": file_item.get("name"),
-                                "size": file_item.get("size", 0),
-                                "content_type": file_item.get("file", {}).get("mimeType", "unknown"),
-                                "drive_name": drive_name,
-                                "last_modified": file_item.get("lastModifiedDateTime", ""),
-                                "web_url": file_item.get("webUrl", "")
-                            })
-                except Exception as e:
-                    print(f"Error processing drive {drive_name}: {str(e)}")
-        
-        if search_name and search_results:
-            return {
-                "message": f"Found {len(search_results)} file(s) matching '{search_name}' in document libraries",
-                "instruction": "Copy a file 'id' from below. Note: File content reading requires Files.Read.All permission.",
-                "search_results": search_results,
-                "site_id": site_id,
-                "search_term": search_name,
-                "permission_note": "Files.Read.All consent required for content reading",
-                "authentication_method": "OBO Flow",
-                "scopes_used": ["Sites.Read.All"]
-            }
-        elif search_name:
-            return {
-                "message": f"No files found matching '{search_name}' in document libraries",
-                "instruction": "Try a different search term or leave search_name empty to see all files",
-                "site_id": site_id,
-                "authentication_method": "OBO Flow"
-            }
-        else:
-            return {
-                "message": "Successfully retrieved SharePoint document libraries via OBO Flow",
-                "site_id": site_id,
-                "libraries": libraries.get("value", []),
-                "all_files": all_files,
-                "files_count": len(all_files),
-                "instruction": "Copy file IDs to use with File Content Reader (requires Files.Read.All consent)",
-                "permission_note": "Files.Read.All admin consent required for content reading functionality",
-                "authentication_method": "OBO Flow",
-                "scopes_used": ["Sites.Read.All"]
-            }
+        return project(await libraries_section(site_id, search_name, limit, token, graph_token, search_scope),
+                       parse_fields(fields))
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_sharepoint_libraries: {str(e)}")
+        logger.exception("Error in get_sharepoint_libraries: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def list_items_url(site_id: str, list_id: str, limit: int, columns: str = None) -> str:
+    """Graph URL for the first page of a list's items, with every property and column unless columns narrows them"""
+    endpoint = f"{GRAPH_BASE_URL}/sites/{site_id}/lists/{list_id}/items"
+    if columns:
+        endpoint = with_select(endpoint, LIST_ITEM_SELECT, expand_fields(columns))
+    else:
+        endpoint = f"{endpoint}?$expand={expand_fields(columns)}"
+    return with_page_size(endpoint, limit)
+
+async def list_events(lists: dict, site_id: str, limit: int, graph_token: str, columns: str = None):
+    """Events for the streamed lists listing: lists, one list event per list, summary"""
+    all_lists = lists.get("value", [])
+    yield "lists", {"site_id": site_id, "lists_count": len(all_lists), "lists": all_lists}
+    
+    # System lists are returned without items, as in the JSON response
+    user_lists = []
+    for sp_list in all_lists:
+        if sp_list.get("system", False):
+            yield "list", {"list": sp_list, "items": [], "next_cursor": None}
+        else:
+            user_lists.append(sp_list)
+    
+    items_count = 0
+    requests = [make_graph_request(list_items_url(site_id, sp_list.get("id"), limit, columns), graph_token) for sp_list in user_lists]
+    async for position, items in iter_completed_with_concurrency(requests):
+        sp_list = user_lists[position]
+        list_event = {"list": sp_list, "items": [], "next_cursor": None}
+        if isinstance(items, Exception):
+            logger.warning("Error getting items for list %s: %s", sp_list.get("id"), items)
+            list_event["error"] = stream_error(items)
+        else:
+            list_event["items"] = items.get("value", [])
+            list_event["next_cursor"] = encode_cursor(items.get("@odata.nextLink"), site_id=site_id, list_id=sp_list.get("id"))
+            items_count += len(list_event["items"])
+        yield "list", list_event
+    
+    yield "summary", {
+        "message": "Successfully retrieved SharePoint lists via OBO Flow",
+        "site_id": site_id,
+        "lists_count": len(lists.get("value", [])),
+        "items_count": items_count,
+        "authentication_method": "OBO Flow",
+        "scopes_used": ["Sites.Read.All"]
+    }
+
+async def lists_section(site_id: str, limit: int, graph_token: str, columns: str = None) -> dict:
+    """A site's lists with the first page of items (with the given columns) of each user list"""
+    # Get every SharePoint list of the site
+    lists = await read_collection(lists_url(site_id), graph_token)
+    
+    # Get the first page of items of each list (excluding system lists) in batched round trips
+    all_lists = lists.get("value", [])
+    user_lists = [sp_list for sp_list in all_lists if not sp_list.get("system", False)]
+    items_results = await make_graph_batch(
+        [list_items_url(site_id, sp_list.get("id"), limit, columns) for sp_list in user_lists],
+        graph_token
+    )
+    items_by_list = {
+        sp_list.get("id"): ({} if isinstance(items, Exception) else items)
+        for sp_list, items in zip(user_lists, items_results)
+    }
+    
+    lists_with_items = []
+    for sp_list in all_lists:
+        items = items_by_list.get(sp_list.get("id"), {})
+        lists_with_items.append({
+            "list": sp_list,
+            "items": items.get("value", []),
+            "next_cursor": encode_cursor(items.get("@odata.nextLink"), site_id=site_id, list_id=sp_list.get("id"))
+        })
+
+    return {
+        "message": "Successfully retrieved SharePoint lists via OBO Flow",
+        "site_id": site_id,
+        "lists_count": len(lists.get("value", [])),
+        "lists_with_items": lists_with_items,
+        "authentication_method": "OBO Flow",
+        "scopes_used": ["Sites.Read.All"]
+    }
+
 @app.get("/api/sharepoint/lists")
-async def get_sharepoint_lists(site_id: str = None, token: str = Depends(get_bearer_token)):
-    """Get SharePoint lists and their items using OBO Flow"""
+async def get_sharepoint_lists(
+    site_id: str = None,
+    cursor: str = None,
+    limit: int = Query(5, ge=1, le=MAX_PAGE_SIZE),
+    stream: str = Query(None, pattern=STREAM_FORMAT_PATTERN),
+    columns: str = Query(None, pattern=COLUMNS_PATTERN),
+    fields: str = Query(None, pattern=FIELDS_PATTERN),
+    token: ParsedToken = Depends(get_parsed_token)
+):
+    """
+    Get SharePoint lists and their items using OBO Flow.
+
+    Items carry every property and list column (under ``fields``) unless
+    ``columns`` names the columns to keep, which also trims the items to their
+    id, webUrl and timestamps. With ``stream=sse`` or
+    ``stream=ndjson`` the response is streamed: a ``lists`` event, one
+    ``list`` event per list as its items arrive, then a ``summary`` event.
+    ``fields`` trims the lists and items to the given properties.
+    """
     try:
         # Exchange user token for Graph API token using OBO flow
         graph_token = await exchange_token_via_obo(token, ["https://graph.microsoft.com/Sites.Read.All"])
         
-        # Use root site if no site_id provided
-        if not site_id:
-            root_site = await make_graph_request("https://graph.microsoft.com/v1.0/sites/root", graph_token)
-            site_id = root_site.get("id", "root")
-        
-        # Get SharePoint lists
-        lists = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists", graph_token)
-        
-        # Get items from the first few lists (excluding system lists)
-        lists_with_items = []
-        for sp_list in lists.get("value", [])[:3]:  # Limit to first 3 lists
-            list_info = {
-                "list": sp_list,
-                "items": []
-            }
+        # Continue paging through a single list's items when a cursor is supplied
+        if cursor:
+            next_link, context = decode_cursor(cursor)
+            items = await make_graph_request(next_link, graph_token)
             
-            # Skip system lists
-            if not sp_list.get("system", False):
-                try:
-                    list_id = sp_list.get("id")
-                    items = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items?expand=fields&$top=5", graph_token)
-                    list_info["items"] = items.get("value", [])
-                except:
-                    list_info["items"] = []
-            
-            lists_with_items.append(list_info)
-
-        return {
-            "message": "Successfully retrieved SharePoint lists via OBO Flow",
-            "site_id": site_id,
-            "lists_count": len(lists.get("value", [])),
-            "lists_with_items": lists_with_items,
-            "authentication_method": "OBO Flow",
-            "scopes_used": ["Sites.Read.All"]
-        }
+            return project({
+                "message": "Successfully retrieved the next page of SharePoint list items via OBO Flow",
+                "site_id": context.get("site_id"),
+                "list_id": context.get("list_id"),
+                "items": items.get("value", []),
+                "next_cursor": encode_cursor(items.get("@odata.nextLink"), **context),
+                "authentication_method": "OBO Flow",
+                "scopes_used": ["Sites.Read.All"]
+            }, parse_fields(fields))
+        
+        # Use root site if no site_id provided
+        site_id = await site_resolver.resolve(site_id, graph_token, token.tenant_id, token.user_key)
+        
+        if stream:
+            lists = await read_collection(lists_url(site_id), graph_token)
+            return event_stream_response(
+                list_events(lists, site_id, limit, graph_token, columns), stream, fields=parse_fields(fields)
+            )
+        
+        return project(await lists_section(site_id, limit, graph_token, columns), parse_fields(fields))
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_sharepoint_lists: {str(e)}")
+        logger.exception("Error in get_sharepoint_lists: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+async def pages_section(site_id: str, graph_token: str) -> dict:
+    """A site's pages, falling back to the Site Pages library"""
+    # Get site pages
+    try:
+        pages = await make_graph_request(with_select(f"{GRAPH_BASE_URL}/sites/{site_id}/pages", PAGE_SELECT), graph_token)
+    except:
+        # If pages endpoint doesn't work, try getting from Site Pages library
+        try:
+            pages_list = await make_graph_request(
+                with_select(f"{GRAPH_BASE_URL}/sites/{site_id}/lists/SitePages/items", LIST_ITEM_SELECT,
+                            "fields($select=Title,FileLeafRef,Description)"),
+                graph_token
+            )
+            pages = {"value": pages_list.get("value", [])}
+        except:
+            pages = {"value": [], "note": "Could not retrieve site pages"}
+
+    return {
+        "message": "Successfully retrieved SharePoint site pages via OBO Flow",
+        "site_id": site_id,
+        "pages": pages.get("value", []),
+        "pages_count": len(pages.get("value", [])),
+        "authentication_method": "OBO Flow",
+        "scopes_used": ["Sites.Read.All"]
+    }
+
 @app.get("/api/sharepoint/pages")
-async def get_sharepoint_pages(site_id: str = None, token: str = Depends(get_bearer_token)):
+async def get_sharepoint_pages(
+    site_id: str = None,
+    fields: str = Query(None, pattern=FIELDS_PATTERN),
+    token: ParsedToken = Depends(get_parsed_token)
+):
     """Get SharePoint site pages using OBO Flow"""
     try:
         # Exchange user token for Graph API token using OBO flow
         graph_token = await exchange_token_via_obo(token, ["https://graph.microsoft.com/Sites.Read.All"])
         
         # Use root site if no site_id provided
-        if not site_id:
-            root_site = await make_graph_request("https://graph.microsoft.com/v1.0/sites/root", graph_token)
-            site_id = root_site.get("id", "root")
+        site_id = await site_resolver.resolve(site_id, graph_token, token.tenant_id, token.user_key)
         
-        # Get site pages
-        try:
-            pages = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}/pages", graph_token)
-        except:
-            # If pages endpoint doesn't work, try getting from Site Pages library
-            try:
-                pages_list = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/SitePages/items?expand=fields", graph_token)
-                pages = {"value": pages_list.get("value", [])}
-            except:
-                pages = {"value": [], "note": "Could not retrieve site pages"}
-
-        return {
-            "message": "Successfully retrieved SharePoint site pages via OBO Flow",
-            "site_id": site_id,
-            "pages": pages.get("value", []),
-            "pages_count": len(pages.get("value", [])),
-            "authentication_method": "OBO Flow",
-            "scopes_used": ["Sites.Read.All"]
-        }
+        return project(await pages_section(site_id, graph_token), parse_fields(fields))
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_sharepoint_pages: {str(e)}")
+        logger.exception("Error in get_sharepoint_pages: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+async def navigation_section(site_id: str, graph_token: str) -> dict:
+    """A site's details and subsites"""
+    # Get site information and subsites in a single batch round trip
+    site_info, subsites = await make_graph_batch([
+        with_select(f"{GRAPH_BASE_URL}/sites/{site_id}", SITE_SELECT),
+        with_select(f"{GRAPH_BASE_URL}/sites/{site_id}/sites", SITE_SELECT)
+    ], graph_token)
+    
+    if isinstance(site_info, Exception):
+        raise site_info
+    if isinstance(subsites, Exception):
+        subsites = {"value": []}
+    
+    # Get web parts or navigation (this might need different permissions)
+    navigation_info = {
+        "site_info": {
+            "name": site_info.get("displayName", "Unknown"),
+            "description": site_info.get("description", ""),
+            "webUrl": site_info.get("webUrl", ""),
+            "createdDateTime": site_info.get("createdDateTime", ""),
+            "lastModifiedDateTime": site_info.get("lastModifiedDateTime", "")
+        },
+        "subsites": subsites.get("value", []),
+        "structure": {
+            "lists_available": "Use /api/sharepoint/lists endpoint",
+            "libraries_available": "Use /api/sharepoint/libraries endpoint",
+            "pages_available": "Use /api/sharepoint/pages endpoint"
+        }
+    }
+
+    return {
+        "message": "Successfully retrieved SharePoint site navigation via OBO Flow",
+        "site_id": site_id,
+        "navigation": navigation_info,
+        "subsites_count": len(subsites.get("value", [])),
+        "authentication_method": "OBO Flow",
+        "scopes_used": ["Sites.Read.All"]
+    }
+
 @app.get("/api/sharepoint/navigation")
-async def get_sharepoint_navigation(site_id: str = None, token: str = Depends(get_bearer_token)):
+async def get_sharepoint_navigation(
+    site_id: str = None,
+    fields: str = Query(None, pattern=FIELDS_PATTERN),
+    token: ParsedToken = Depends(get_parsed_token)
+):
     """Get SharePoint site navigation structure using OBO Flow"""
     try:
         # Exchange user token for Graph API token using OBO flow
         graph_token = await exchange_token_via_obo(token, ["https://graph.microsoft.com/Sites.Read.All"])
         
         # Use root site if no site_id provided
-        if not site_id:
-            root_site = await make_graph_request("https://graph.microsoft.com/v1.0/sites/root", graph_token)
-            site_id = root_site.get("id", "root")
+        site_id = await site_resolver.resolve(site_id, graph_token, token.tenant_id, token.user_key)
         
-        # Get site information and subsites
-        site_info = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}", graph_token)
-        
-        try:
-            subsites = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}/sites", graph_token)
-        except:
-            subsites = {"value": []}
-        
-        # Get web parts or navigation (this might need different permissions)
-        navigation_info = {
-            "site_info": {
-                "name": site_info.get("displayName", "Unknown"),
-                "description": site_info.get("description", ""),
-                "webUrl": site_info.get("webUrl", ""),
-                "createdDateTime": site_info.get("createdDateTime", ""),
-                "lastModifiedDateTime": site_info.get("lastModifiedDateTime", "")
-            },
-            "subsites": subsites.get("value", []),
-            "structure": {
-                "lists_available": "Use /api/sharepoint/lists endpoint",
-                "libraries_available": "Use /api/sharepoint/libraries endpoint",
-                "pages_available": "Use /api/sharepoint/pages endpoint"
-            }
-        }
-
-        return {
-            "message": "Successfully retrieved SharePoint site navigation via OBO Flow",
-            "site_id": site_id,
-            "navigation": navigation_info,
-            "subsites_count": len(subsites.get("value", [])),
-            "authentication_method": "OBO Flow",
-            "scopes_used": ["Sites.Read.All"]
-        }
+        return project(await navigation_section(site_id, graph_token), parse_fields(fields))
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_sharepoint_navigation: {str(e)}")
+        logger.exception("Error in get_sharepoint_navigation: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+async def recent_section(site_id: str, token: ParsedToken, graph_token: str) -> dict:
+    """Recently modified files of a resolved site, or the user's recent SharePoint files when site_id is None"""
+    # For a specific site, answer from the drive indexes once they are built
+    if site_id:
+        libraries = await read_collection(drives_url(site_id), graph_token)
+        indexes = [drive_index.get(token.user_key, drive.get("id"), graph_token) for drive in libraries.get("value", [])]
+        
+        if indexes and all(index is not None for index in indexes):
+            recent_site_files = sorted(
+                (entry for index in indexes for entry in index.recent(10)),
+                key=lambda entry: entry["lastModifiedDateTime"],
+                reverse=True
+            )[:10]
+            return {
+                "message": "Successfully retrieved recently modified SharePoint files via OBO Flow",
+                "site_id": site_id,
+                "recent_files": recent_site_files,
+                "sharepoint_files": recent_site_files[:5],
+                "total_recent": len(recent_site_files),
+                "sharepoint_count": len(recent_site_files),
+                "authentication_method": "OBO Flow",
+                "scopes_used": ["Sites.Read.All", "Files.Read.All"]
+            }
+    
+    # Get recent files from Microsoft Graph
+    try:
+        recent_files = await make_graph_request(f"{GRAPH_BASE_URL}/me/drive/recent", graph_token)
+    except:
+        # Alternative: Get files from user's OneDrive and SharePoint
+        try:
+            recent_files = await make_graph_request(f"{GRAPH_BASE_URL}/me/insights/used", graph_token)
+        except:
+            recent_files = {"value": [], "note": "Could not retrieve recent files"}
+    
+    # Filter SharePoint files (files with sharepoint.com in the URL)
+    sharepoint_files = []
+    for file_item in recent_files.get("value", []):
+        web_url = ""
+        if "webUrl" in file_item:
+            web_url = file_item.get("webUrl", "")
+        elif "resourceVisualization" in file_item:
+            web_url = file_item.get("resourceVisualization", {}).get("containerWebUrl", "")
+        
+        if "sharepoint.com" in web_url.lower():
+            sharepoint_files.append(file_item)
+
+    return {
+        "message": "Successfully retrieved recent SharePoint files via OBO Flow",
+        "recent_files": recent_files.get("value", [])[:10],  # Show first 10
+        "sharepoint_files": sharepoint_files[:5],  # Show first 5 SharePoint files
+        "total_recent": len(recent_files.get("value", [])),
+        "sharepoint_count": len(sharepoint_files),
+        "authentication_method": "OBO Flow",
+        "scopes_used": ["Sites.Read.All", "Files.Read.All"]
+    }
+
 @app.get("/api/sharepoint/recent")
-async def get_sharepoint_recent_files(token: str = Depends(get_bearer_token)):
+async def get_sharepoint_recent_files(
+    site_id: str = None,
+    fields: str = Query(None, pattern=FIELDS_PATTERN),
+    token: ParsedToken = Depends(get_parsed_token)
+):
     """Get recently accessed SharePoint files using OBO Flow"""
     try:
         # Exchange user token for Graph API token using OBO flow
         graph_token = await exchange_token_via_obo(token, ["https://graph.microsoft.com/Sites.Read.All", "https://graph.microsoft.com/Files.Read.All"])
         
-        # Get recent files from Microsoft Graph
-        try:
-            recent_files = await make_graph_request("https://graph.microsoft.com/v1.0/me/drive/recent", graph_token)
-        except:
-            # Alternative: Get files from user's OneDrive and SharePoint
-            try:
-                recent_files = await make_graph_request("https://graph.microsoft.com/v1.0/me/insights/used", graph_token)
-            except:
-                recent_files = {"value": [], "note": "Could not retrieve recent files"}
-        
-        # Filter SharePoint files (files with sharepoint.com in the URL)
-        sharepoint_files = []
-        for file_item in recent_files.get("value", []):
-            web_url = ""
-            if "webUrl" in file_item:
-                web_url = file_item.get("webUrl", "")
-            elif "resourceVisualization" in file_item:
-                web_url = file_item.get("resourceVisualization", {}).get("containerWebUrl", "")
-            
-            if "sharepoint.com" in web_url.lower():
-                sharepoint_files.append(file_item)
+        if site_id:
+            site_id = await site_resolver.resolve(site_id, graph_token, token.tenant_id, token.user_key)
+        return project(await recent_section(site_id, token, graph_token), parse_fields(fields))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in get_sharepoint_recent_files: %s", e)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+GRAPH_USER_READ = "https://graph.microsoft.com/User.Read"
+GRAPH_SITES_READ = "https://graph.microsoft.com/Sites.Read.All"
+GRAPH_FILES_READ = "https://graph.microsoft.com/Files.Read.All"
+
+# Dashboard sections: the Graph scopes each needs and its builder, called as (site_id, token, graph_token)
+DASHBOARD_SECTIONS = {
+    "user": ([], lambda site_id, token, graph_token: user_section(token)),
+    "graph_user": ([GRAPH_USER_READ], lambda site_id, token, graph_token: graph_user_section(graph_token)),
+    "sites": ([GRAPH_SITES_READ], lambda site_id, token, graph_token: sites_section(graph_token)),
+    "libraries": ([GRAPH_SITES_READ], lambda site_id, token, graph_token: libraries_section(site_id, None, 10, token, graph_token)),
+    "lists": ([GRAPH_SITES_READ], lambda site_id, token, graph_token: lists_section(site_id, 5, graph_token)),
+    "pages": ([GRAPH_SITES_READ], lambda site_id, token, graph_token: pages_section(site_id, graph_token)),
+    "navigation": ([GRAPH_SITES_READ], lambda site_id, token, graph_token: navigation_section(site_id, graph_token)),
+    "recent": ([GRAPH_SITES_READ, GRAPH_FILES_READ], lambda site_id, token, graph_token: recent_section(site_id, token, graph_token)),
+}
+
+# Sections that always address a site; recent only does when a site_id is given
+DASHBOARD_SITE_SECTIONS = {"libraries", "lists", "pages", "navigation"}
+
+def section_error(error: Exception) -> dict:
+    """Describe a failed dashboard section"""
+    if isinstance(error, HTTPException):
+        return {"status_code": error.status_code, "detail": error.detail}
+    return {"status_code": 500, "detail": f"Internal server error: {str(error)}"}
+
+async def dashboard_graph_tokens(token: ParsedToken, sections: list) -> dict:
+    """
+    Return a Graph token (or the exchange error) per section.
+
+    One OBO exchange for the union of the sections' scopes serves them all.
+    If that fails, e.g. because one scope lacks consent, each distinct scope
+    set is exchanged on its own so only the sections needing it fail.
+    """
+    scope_sets = {name: DASHBOARD_SECTIONS[name][0] for name in sections if DASHBOARD_SECTIONS[name][0]}
+    if not scope_sets:
+        return {}
+    
+    union = sorted({scope for scopes in scope_sets.values() for scope in scopes})
+    try:
+        graph_token = await exchange_token_via_obo(token, union)
+        return {name: graph_token for name in scope_sets}
+    except HTTPException as e:
+        obo_logger.warning("Combined OBO exchange failed (%s), exchanging per scope set", e.detail)
+    
+    distinct = list({tuple(sorted(scopes)) for scopes in scope_sets.values()})
+    results = await asyncio.gather(
+        *(exchange_token_via_obo(token, list(scopes)) for scopes in distinct), return_exceptions=True
+    )
+    by_scopes = dict(zip(distinct, results))
+    return {name: by_scopes[tuple(sorted(scopes))] for name, scopes in scope_sets.items()}
+
+@app.get("/api/dashboard")
+async def get_dashboard(
+    sections: str = None,
+    site_id: str = None,
+    fields: str = Query(None, pattern=FIELDS_PATTERN),
+    token: ParsedToken = Depends(get_parsed_token)
+):
+    """
+    Get several SharePoint views in one round trip using OBO Flow.
 
+    ``sections`` is a comma-separated subset of user, graph_user, sites,
+    libraries, lists, pages, navigation and recent (default: all). Each
+    section holds what its own endpoint returns. The token is exchanged once
+    for all sections, the site is resolved once, and the sections are
+    fetched concurrently; a section that fails is reported under ``errors``
+    without failing the others. ``fields`` trims the resources in every
+    section to the given properties.
+    """
+    try:
+        selected = [name.strip() for name in (sections or ",".join(DASHBOARD_SECTIONS)).split(",") if name.strip()]
+        unknown = [name for name in selected if name not in DASHBOARD_SECTIONS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown dashboard sections: {', '.join(unknown)}. Choose from: {', '.join(DASHBOARD_SECTIONS)}"
+            )
+        selected = list(dict.fromkeys(selected))
+        
+        graph_tokens = await dashboard_graph_tokens(token, selected)
+        
+        # Resolve the site once for every section that addresses it
+        site_sections = [name for name in selected if name in DASHBOARD_SITE_SECTIONS or (name == "recent" and site_id)]
+        resolved_site = None
+        site_token = next((graph_tokens[name] for name in site_sections if isinstance(graph_tokens[name], str)), None)
+        if site_token is not None:
+            try:
+                resolved_site = await site_resolver.resolve(site_id, site_token, token.tenant_id, token.user_key)
+            except Exception as e:
+                resolved_site = e
+        
+        async def build_section(name: str):
+            with start_span(f"dashboard {name}"):
+                graph_token = graph_tokens.get(name)
+                if isinstance(graph_token, Exception):
+                    raise graph_token
+                if name in site_sections and isinstance(resolved_site, Exception):
+                    raise resolved_site
+                return await DASHBOARD_SECTIONS[name][1](resolved_site if name in site_sections else None, token, graph_token)
+        
+        results = await asyncio.gather(*(build_section(name) for name in selected), return_exceptions=True)
+        
+        selected_fields = parse_fields(fields)
+        section_results = {}
+        errors = {}
+        for name, result in zip(selected, results):
+            if isinstance(result, Exception):
+                if not isinstance(result, HTTPException):
+                    logger.error("Error building dashboard section %s: %s", name, result, exc_info=result)
+                errors[name] = section_error(result)
+            else:
+                section_results[name] = project(result, selected_fields)
+        
+        scopes_used = sorted({scope.rsplit("/", 1)[-1] for name in selected for scope in DASHBOARD_SECTIONS[name][0]})
         return {
-            "message": "Successfully retrieved recent SharePoint files via OBO Flow",
-            "recent_files": recent_files.get("value", [])[:10],  # Show first 10
-            "sharepoint_files": sharepoint_files[:5],  # Show first 5 SharePoint files
-            "total_recent": len(recent_files.get("value", [])),
-            "sharepoint_count": len(sharepoint_files),
+            "message": "Successfully retrieved SharePoint dashboard via OBO Flow",
+            "site_id": resolved_site if isinstance(resolved_site, str) else None,
+            "sections": section_results,
+            "errors": errors,
             "authentication_method": "OBO Flow",
-            "scopes_used": ["Sites.Read.All", "Files.Read.All"]
+            "scopes_used": scopes_used
         }
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_sharepoint_recent_files: {str(e)}")
+        logger.exception("Error in get_dashboard: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def collect_cache_metrics() -> list:
+    """Export the caches' own hit/miss counters at scrape time"""
+    caches = {
+        "obo_token": obo_token_cache.stats(),
+        "site": site_resolver.stats(),
+        "extraction": extraction_cache.stats(),
+        "graph_response": response_cache.stats(),
+        "drive_index": drive_index.stats()
+    }
+    return (
+        metric_family("cache_hits_total", "counter", "Cache lookups answered from the cache",
+                      [({"cache": name}, stats["hits"]) for name, stats in caches.items()])
+        + metric_family("cache_misses_total", "counter", "Cache lookups that missed",
+                        [({"cache": name}, stats["misses"]) for name, stats in caches.items()])
+        + metric_family("cache_revalidations_total", "counter", "Stale Graph responses revalidated with a 304",
+                        [({"cache": "graph_response"}, caches["graph_response"]["revalidations"])])
+        + metric_family("cache_evictions_total", "counter", "Entries evicted to stay within the cache size",
+                        [({"cache": "obo_token"}, caches["obo_token"]["evictions"])])
+    )
+
+register_collector(collect_cache_metrics)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/debug/cache")
+async def debug_cache_stats(token: ParsedToken = Depends(get_parsed_token)):
+    """Debug endpoint to inspect server-side cache statistics"""
+    return {
+        "message": "Cache statistics",
+        "obo_token_cache": obo_token_cache.stats(),
+        "site_cache": site_resolver.stats(),
+        "extraction_cache": extraction_cache.stats(),
+        "graph_response_cache": response_cache.stats(),
+        "drive_index": drive_index.stats()
+    }
+
+@app.get("/api/debug/graph")
+async def debug_graph_stats(token: ParsedToken = Depends(get_parsed_token)):
+    """Debug endpoint to inspect Graph retry, throttling and circuit breaker state"""
+    return {
+        "message": "Graph client throttling statistics",
+        "graph_throttle": graph_throttle.stats()
+    }
+
 @app.get("/api/debug/token")
-async def debug_token_info(token: str = Depends(get_bearer_token)):
+async def debug_token_info(token: ParsedToken = Depends(get_parsed_token)):
     """Debug endpoint to inspect token details"""
     try:
-        # Decode token without verification to see what we're getting
-        unverified_payload = jwt.decode(token, options={"verify_signature": False})
+        # Claims were already verified and parsed by the dependency
+        claims = token.claims
         
         return {
             "message": "Token debug information",
-            "token_length": len(token),
-            "token_preview": f"{token[:20]}...{token[-20:]}",
-            "audience": unverified_payload.get("aud"),
-            "issuer": unverified_payload.get("iss"),
-            "scopes": unverified_payload.get("scp", "No scopes found"),
-            "application_id": unverified_payload.get("appid"),
-            "subject": unverified_payload.get("sub"),
-            "upn": unverified_payload.get("upn"),
-            "roles": unverified_payload.get("roles", []),
-            "token_version": unverified_payload.get("ver"),
+            "token_length": len(token.raw),
+            "token_preview": f"{token.raw[:20]}...{token.raw[-20:]}",
+            "audience": claims.get("aud"),
+            "issuer": claims.get("iss"),
+            "scopes": claims.get("scp", "No scopes found"),
+            "application_id": claims.get("appid"),
+            "subject": claims.get("sub"),
+            "upn": claims.get("upn"),
+            "roles": claims.get("roles", []),
+            "token_version": claims.get("ver"),
             "authentication_method": "OBO Flow with Custom API Scope"
         }
     except Exception as e:
         return {
             "error": f"Failed to decode token: {str(e)}",
-            "token_length": len(token),
-            "token_preview": f"{token[:20]}...{token[-20:]}"
+            "token_length": len(token.raw),
+            "token_preview": f"{token.raw[:20]}...{token.raw[-20:]}"
         }
 
+def content_file_entry(file_item: dict, drive_name: str) -> dict:
+    """Shape a driveItem for the file-content listing"""
+    return {
+        "id": file_item.get("id"),
+        "name": file_item.get("name"),
+        "size": file_item.get("size", 0),
+        "content_type": file_item.get("file", {}).get("mimeType", "unknown"),
+        "drive_name": drive_name
+    }
+
+def content_search_entry(file_item: dict, drive_name: str) -> dict:
+    """Shape a driveItem for the file-content search results"""
+    return {
+        "id": file_item.get("id"),
+        "name": file_item.get("name"),
+        "size": file_item.get("size", 0),
+        "content_type": file_item.get("file", {}).get("mimeType", "unknown"),
+        "web_url": file_item.get("webUrl", ""),
+        "drive_name": drive_name,
+        "last_modified": file_item.get("lastModifiedDateTime", "")
+    }
+
+async def file_listing_events(libraries: dict, site_id: str, search_name: str, token: ParsedToken, graph_token: str,
+                              search_scope: str = "name"):
+    """Events for the streamed file-content listing: one drive event per drive, then a summary"""
+    files_count = 0
+    async for drive, files, _ in iter_drives(libraries.get("value", []), site_id, token, graph_token, search_name=search_name,
+                                             search_scope=search_scope):
+        drive_name = drive.get("name", "Unknown")
+        drive_event = {"drive_id": drive.get("id"), "drive_name": drive_name}
+        
+        if isinstance(files, Exception):
+            logger.warning("Error listing files in drive %s: %s", drive_name, files)
+            drive_event["error"] = stream_error(files)
+        elif search_name:
+            drive_event["search_results"] = [content_search_entry(file_item, drive_name) for file_item in files.get("value", [])]
+            files_count += len(drive_event["search_results"])
+        else:
+            # Show first 5 files per drive
+            drive_event["available_files"] = [content_file_entry(file_item, drive_name) for file_item in files.get("value", [])[:5]]
+            files_count += len(drive_event["available_files"])
+        yield "drive", drive_event
+    
+    if search_name:
+        message = (f"Found {files_count} file(s) matching '{search_name}':" if files_count
+                   else f"No files found matching '{search_name}'")
+    else:
+        message = ("No file_id provided. Here are available files to read content from:" if files_count
+                   else "No file_id provided and no files found")
+    yield "summary", {
+        "message": message,
+        "instruction": "Copy a file 'id' from above and use: /api/sharepoint/file-content?file_id=<copied_id>",
+        "site_id": site_id,
+        "files_count": files_count,
+        "authentication_method": "OBO Flow",
+        "scopes_used": ["Sites.Read.All", "Files.Read.All"]
+    }
+
 @app.get("/api/sharepoint/file-content")
-async def get_sharepoint_file_content(file_id: str = None, site_id: str = None, search_name: str = None, token: str = Depends(get_bearer_token)):
-    """Get actual content from SharePoint files using OBO Flow"""
+async def get_sharepoint_file_content(
+    file_id: str = None,
+    site_id: str = None,
+    search_name: str = None,
+    search_scope: str = Query("name", pattern=SEARCH_SCOPE_PATTERN),
+    max_chars: int = Query(None, ge=1, le=MAX_EXTRACT_CHARS),
+    stream: str = Query(None, pattern=STREAM_FORMAT_PATTERN),
+    token: ParsedToken = Depends(get_parsed_token)
+):
+    """
+    Get actual content from SharePoint files using OBO Flow.
+
+    Without a ``file_id`` the available files are listed (or searched by name,
+    or with ``search_scope=content`` by content); that listing can be streamed
+    with ``stream=sse`` or ``stream=ndjson`` as one ``drive`` event per library
+    followed by a ``summary`` event.
+    """
     try:
         # Exchange user token for Graph API token using OBO flow
         graph_token = await exchange_token_via_obo(token, [
@@ -641,66 +1440,44 @@ async def get_sharepoint_file_content(file_id: str = None, site_id: str = None,
             "https://graph.microsoft.com/Files.Read.All"
         ])
         
-        # Use root site if no site_id provided, but try to find the specific site if it looks like a domain
-        if not site_id:
-            root_site = await make_graph_request("https://graph.microsoft.com/v1.0/sites/root", graph_token)
-            site_id = root_site.get("id", "root")
-        elif site_id and "sharepoint.com" in site_id and "," not in site_id:
-            # If site_id looks like a domain (e.g., contoso.sharepoint.com), find the actual site ID
-            try:
-                sites = await make_graph_request("https://graph.microsoft.com/v1.0/sites?search=*", graph_token)
-                for site in sites.get("value", []):
-                    if site_id in site.get("webUrl", ""):
-                        site_id = site.get("id")
-                        break
-            except:
-                pass  # Fall back to using the provided site_id
+        # Resolve root, hostname and URL-style site IDs through the tenant site cache
+        site_id = await site_resolver.resolve(site_id, graph_token, token.tenant_id, token.user_key)
         
         # If no file_id provided, get available files or search by name
         if not file_id:
             try:
-                libraries = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives", graph_token)
+                libraries = await read_collection(drives_url(site_id), graph_token)
+                
+                if stream:
+                    return event_stream_response(
+                        file_listing_events(libraries, site_id, search_name, token, graph_token, search_scope), stream
+                    )
+                
                 available_files = []
                 search_results = []
                 
-                if libraries.get("value"):
-                    for drive in libraries["value"]:
-                        drive_id = drive.get("id")
-                        drive_name = drive.get("name", "Unknown")
+                # Query all drives from their indexes or in batched round trips; a failing drive does not fail the request
+                drives = libraries.get("value", [])
+                drive_results = await query_drives(drives, site_id, token, graph_token, search_name=search_name,
+                                                   search_scope=search_scope)
+                
+                for drive, (files, _) in zip(drives, drive_results):
+                    drive_name = drive.get("name", "Unknown")
+                    
+                    # If searching by name, use search endpoint results
+                    if search_name:
+                        if isinstance(files, Exception):
+                            logger.warning("Search error in drive %s: %s", drive_name, files)
+                            continue
+                        
+                        search_results.extend(content_search_entry(file_item, drive_name) for file_item in files.get("value", []))
+                    else:
+                        if isinstance(files, Exception):
+                            logger.warning("Error listing files in drive %s: %s", drive_name, files)
+                            continue
                         
-                        # If searching by name, use search endpoint
-                        if search_name:
-                            try:
-                                search_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root/search(q='{search_name}')"
-                                search_files = await make_graph_request(search_url, graph_token)
-                                
-                                for file_item in search_files.get("value", []):
-                                    search_results.append({
-                                        "id": file_item.get("id"),
-                                        "name": file_item.get("name"),
-                                        "size": file_item.get("size", 0),
-                                        "content_type": file_item.get("file", {}).get("mimeType", "unknown"),
-                                        "web_url": file_item.get("webUrl", ""),
-                                        "drive_name": drive_name,
-                                        "last_modified": file_item.get("lastModifiedDateTime", "")
-                                    })
-                            except Exception as e:
-                                print(f"Search error in drive {drive_name}: {str(e)}")
-                        else:
-                            # Get files from root of drive
-                            try:
-                                files = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root/children", graph_token)
-                                
-                                for file_item in files.get("value", [])[:5]:  # Show first 5 files per drive
-                                    available_files.append({
-                                        "id": file_item.get("id"),
-                                        "name": file_item.get("name"),
-                                        "size": file_item.get("size", 0),
-                                        "content_type": file_item.get("file", {}).get("mimeType", "unknown"),
-                                        "drive_name": drive_name
-                                    })
-                            except Exception as e:
-                                print(f"Error listing files in drive {drive_name}: {str(e)}")
+                        # Show first 5 files per drive
+                        available_files.extend(content_file_entry(file_item, drive_name) for file_item in files.get("value", [])[:5])
                 
                 if search_name and search_results:
                     return {
@@ -744,19 +1521,10 @@ async def get_sharepoint_file_content(file_id: str = None, site_id: str = None,
                     "authentication_method": "OBO Flow"
                 }
         
-        # Exchange user token for Graph API token using OBO flow
-        graph_token = await exchange_token_via_obo(token, [
-            "https://graph.microsoft.com/Sites.Read.All", 
-            "https://graph.microsoft.com/Files.Read.All"
-        ])
-        
-        # Use root site if no site_id provided
-        if not site_id:
-            root_site = await make_graph_request("https://graph.microsoft.com/v1.0/sites/root", graph_token)
-            site_id = root_site.get("id", "root")
-        
         # Get file metadata first
-        file_metadata = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/items/{file_id}", graph_token)
+        file_metadata = await make_graph_request(
+            with_select(f"{GRAPH_BASE_URL}/sites/{site_id}/drive/items/{file_id}", FILE_METADATA_SELECT), graph_token
+        )
         
         file_content_result = {
             "file_metadata": file_metadata,
@@ -769,9 +1537,9 @@ async def get_sharepoint_file_content(file_id: str = None, site_id: str = None,
         file_name = file_metadata.get("name", "").lower()
         file_size = file_metadata.get("size", 0)
         
-        # Check if file is too large (limit to 10MB for demo)
-        if file_size > 10 * 1024 * 1024:
-            file_content_result["content"] = "File too large for content extraction (>10MB)"
+        # Check if file is too large to download
+        if file_size > MAX_DOWNLOAD_BYTES:
+            file_content_result["content"] = f"File too large for content extraction (>{MAX_DOWNLOAD_BYTES // (1024 * 1024)}MB)"
             file_content_result["content_type"] = "size_limit_exceeded"
             return {
                 "message": "File metadata retrieved, but content too large to extract",
@@ -780,122 +1548,96 @@ async def get_sharepoint_file_content(file_id: str = None, site_id: str = None,
                 "scopes_used": ["Sites.Read.All", "Files.Read.All"]
             }
         
+        # Unchanged files are served from the extraction cache without downloading them again.
+        # The metadata GET above ran with the user's own token, so access is still checked per user.
+        extractor = find_extractor(file_name, file_metadata.get("file", {}).get("mimeType"))
+        extraction_budget = max_chars or (extractor.default_max_chars if extractor else 0)
+        cache_key = ExtractionCache.make_key(file_metadata, extractor.name, extraction_budget) if extractor else None
+        
+        cached_extraction = await extraction_cache.get(cache_key) if cache_key else None
+        if cached_extraction:
+            file_content_result["can_extract_text"] = True
+            file_content_result["content"] = cached_extraction["content"]
+            file_content_result["content_type"] = cached_extraction["content_type"]
+            return {
+                "message": "Successfully retrieved SharePoint file content via OBO Flow",
+                "site_id": site_id,
+                "file_id": file_id,
+                "file_content": file_content_result,
+                "authentication_method": "OBO Flow",
+                "scopes_used": ["Sites.Read.All", "Files.Read.All"]
+            }
+        
         try:
-            # Get download URL and download file content
+            # Stream from the direct download URL, or fall back to the Graph content endpoint
             download_url = file_metadata.get("@microsoft.graph.downloadUrl")
-            if not download_url:
-                # Alternative method to get content
-                content_response = requests.get(
-                    f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/items/{file_id}/content",
-                    headers={"Authorization": f"Bearer {graph_token}"},
-                    timeout=30
-                )
+            if download_url:
+                content_stream = stream_graph_content(download_url)
             else:
-                # Download using the direct URL
-                content_response = requests.get(download_url, timeout=30)
+                content_stream = stream_graph_content(
+                    f"{GRAPH_BASE_URL}/sites/{site_id}/drive/items/{file_id}/content",
+                    graph_token
+                )
             
-            if content_response.status_code == 200:
-                file_content_result["can_extract_text"] = True
-                
-                # Text files
-                if any(ext in file_name for ext in ['.txt', '.md', '.csv', '.json', '.xml', '.html', '.htm']):
-                    try:
-                        file_content_result["content"] = content_response.text[:5000]  # Limit to first 5000 chars
-                        file_content_result["content_type"] = "text"
-                    except:
-                        file_content_result["content"] = "Could not decode text content"
-                        file_content_result["content_type"] = "text_decode_error"
-                
-                # Office documents (basic text extraction)
-                elif any(ext in file_name for ext in ['.docx', '.xlsx', '.pptx']):
-                    try:
-                        import zipfile
-                        import io
-                        from xml.etree import ElementTree as ET
-                        
-                        # Office files are ZIP archives
-                        zip_file = zipfile.ZipFile(io.BytesIO(content_response.content))
-                        
-                        if '.docx' in file_name:
-                            # Extract text from Word document
-                            doc_xml = zip_file.read('word/document.xml')
-                            tree = ET.fromstring(doc_xml)
-                            
-                            # Extract text nodes
-                            text_content = []
-                            for elem in tree.iter():
-                                if elem.text:
-                                    text_content.append(elem.text)
-                            
-                            file_content_result["content"] = ' '.join(text_content)[:3000]
-                            file_content_result["content_type"] = "word_document"
-                            
-                        elif '.xlsx' in file_name:
-                            # Extract text from Excel workbook
-                            try:
-                                shared_strings = zip_file.read('xl/sharedStrings.xml')
-                                tree = ET.fromstring(shared_strings)
-                                
-                                strings = []
-                                for si in tree.findall('.//{http://schemas.openxmlformats.org/spreadsheetml/2006/main}si'):
-                                    for t in si.findall('.//{http://schemas.openxmlformats.org/spreadsheetml/2006/main}t'):
-                                        if t.text:
-                                            strings.append(t.text)
-                                
-                                file_content_result["content"] = ' | '.join(strings[:100])  # First 100 strings
-                                file_content_result["content_type"] = "excel_workbook"
-                            except:
-                                file_content_result["content"] = "Excel file detected but could not extract text content"
-                                file_content_result["content_type"] = "excel_extraction_error"
-                        
-                        elif '.pptx' in file_name:
-                            # Extract text from PowerPoint
-                            slides_text = []
-                            slide_files = [f for f in zip_file.namelist() if f.startswith('ppt/slides/slide')]
-                            
-                            for slide_file in slide_files[:10]:  # First 10 slides
-                                try:
-                                    slide_xml = zip_file.read(slide_file)
-                                    tree = ET.fromstring(slide_xml)
-                                    
-                                    slide_text = []
-                                    for elem in tree.iter():
-                                        if elem.text and elem.text.strip():
-                                            slide_text.append(elem.text.strip())
-                                    
-                                    if slide_text:
-                                        slides_text.append(' '.join(slide_text))
-                                except:
-                                    continue
-                            
-                            file_content_result["content"] = '\n\n--- SLIDE ---\n\n'.join(slides_text)[:3000]
-                            file_content_result["content_type"] = "powerpoint_presentation"
-                        
-                    except Exception as office_error:
-                        file_content_result["content"] = f"Office document detected but extraction failed: {str(office_error)}"
-                        file_content_result["content_type"] = "office_extraction_error"
-                
-                # PDF files (basic info)
-                elif '.pdf' in file_name:
-                    file_content_result["content"] = "PDF file detected. Content extraction requires additional libraries."
-                    file_content_result["content_type"] = "pdf"
-                    file_content_result["can_extract_text"] = False
-                
-                # Image files
-                elif any(ext in file_name for ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']):
-                    file_content_result["content"] = f"Image file: {file_name} ({file_content_result['size_mb']} MB)"
-                    file_content_result["content_type"] = "image"
-                    file_content_result["can_extract_text"] = False
+            async with content_stream as content_response:
+                if content_response.status_code == 200:
+                    file_content_result["can_extract_text"] = True
+                    
+                    # Text files: stop downloading once the character budget is filled
+                    if extractor and extractor.streamed:
+                        try:
+                            file_content_result["content"] = await read_text_prefix(content_response, extraction_budget)
+                            file_content_result["content_type"] = extractor.content_type
+                            if cache_key:
+                                await extraction_cache.set(cache_key, {
+                                    "content": file_content_result["content"],
+                                    "content_type": extractor.content_type
+                                })
+                        except Exception as text_error:
+                            file_content_result["content"] = extractor.error_message.format(error=str(text_error))
+                            file_content_result["content_type"] = extractor.error_content_type
+                    
+                    # Office documents: spool the ZIP archive, then parse it in the extraction pool
+                    elif extractor:
+                        try:
+                            with await spool_response(content_response, MAX_DOWNLOAD_BYTES) as download:
+                                file_content_result["content"] = await run_extractor(
+                                    extractor, download.source(), extraction_budget
+                                )
+                                file_content_result["content_type"] = extractor.content_type
+                            if cache_key:
+                                await extraction_cache.set(cache_key, {
+                                    "content": file_content_result["content"],
+                                    "content_type": extractor.content_type
+                                })
+                        except Exception as office_error:
+                            file_content_result["content"] = extractor.error_message.format(error=str(office_error))
+                            file_content_result["content_type"] = extractor.error_content_type
+                    
+                    # PDF files (basic info)
+                    elif '.pdf' in file_name:
+                        file_content_result["content"] = "PDF file detected. Content extraction requires additional libraries."
+                        file_content_result["content_type"] = "pdf"
+                        file_content_result["can_extract_text"] = False
+                    
+                    # Image files
+                    elif any(ext in file_name for ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']):
+                        file_content_result["content"] = f"Image file: {file_name} ({file_content_result['size_mb']} MB)"
+                        file_content_result["content_type"] = "image"
+                        file_content_result["can_extract_text"] = False
+                    
+                    # Binary files
+                    else:
+                        file_content_result["content"] = f"Binary file: {file_name} (Content type not supported for text extraction)"
+                        file_content_result["content_type"] = "binary"
+                        file_content_result["can_extract_text"] = False
+                    
+                    if extractor:
+                        DOWNLOAD_BYTES.labels(extractor.name).observe(content_response.num_bytes_downloaded)
                 
-                # Binary files
                 else:
-                    file_content_result["content"] = f"Binary file: {file_name} (Content type not supported for text extraction)"
-                    file_content_result["content_type"] = "binary"
-                    file_content_result["can_extract_text"] = False
-            
-            else:
-                file_content_result["content"] = f"Could not download file content (HTTP {content_response.status_code})"
-                file_content_result["content_type"] = "download_error"
+                    file_content_result["content"] = f"Could not download file content (HTTP {content_response.status_code})"
+                    file_content_result["content_type"] = "download_error"
         
         except Exception as content_error:
             file_content_result["content"] = f"Error reading file content: {str(content_error)}"
@@ -913,26 +1655,31 @@ async def get_sharepoint_file_content(file_id: str = None, site_id: str = None,
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_sharepoint_file_content: {str(e)}")
+        logger.exception("Error in get_sharepoint_file_content: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/api/sharepoint/page-content")
-async def get_sharepoint_page_content(page_id: str = None, site_id: str = None, token: str = Depends(get_bearer_token)):
+async def get_sharepoint_page_content(page_id: str = None, site_id: str = None, token: ParsedToken = Depends(get_parsed_token)):
     """Get actual HTML content from SharePoint pages using OBO Flow"""
     try:
         # Exchange user token for Graph API token using OBO flow
         graph_token = await exchange_token_via_obo(token, ["https://graph.microsoft.com/Sites.Read.All"])
         
         # Use root site if no site_id provided
-        if not site_id:
-            root_site = await make_graph_request("https://graph.microsoft.com/v1.0/sites/root", graph_token)
-            site_id = root_site.get("id", "root")
+        site_id = await site_resolver.resolve(site_id, graph_token, token.tenant_id, token.user_key)
         
         # If no page_id provided, get available pages to choose from
         if not page_id:
             try:
                 # Get Site Pages library
-                pages_list = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/SitePages/items?expand=fields&$top=10", graph_token)
+                pages_list = await make_graph_request(
+                    with_page_size(
+                        with_select(f"{GRAPH_BASE_URL}/sites/{site_id}/lists/SitePages/items", "id",
+                                    "fields($select=Title,FileLeafRef,Created,Modified)"),
+                        10
+                    ),
+                    graph_token
+                )
                 
                 available_pages = []
                 for page_item in pages_list.get("value", []):
@@ -964,11 +1711,11 @@ async def get_sharepoint_page_content(page_id: str = None, site_id: str = None,
         
         try:
             # Try to get page content using the Graph API
-            page_content = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}/pages/{page_id}/webParts", graph_token)
+            page_content = await make_graph_request(f"{GRAPH_BASE_URL}/sites/{site_id}/pages/{page_id}/webParts", graph_token)
         except:
             # Alternative: Get from Site Pages library
             try:
-                page_item = await make_graph_request(f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/SitePages/items/{page_id}?expand=fields", graph_token)
+                page_item = await make_graph_request(f"{GRAPH_BASE_URL}/sites/{site_id}/lists/SitePages/items/{page_id}?expand=fields", graph_token)
                 
                 # Extract content from fields
                 fields = page_item.get("fields", {})
@@ -995,13 +1742,15 @@ async def get_sharepoint_page_content(page_id: str = None, site_id: str = None,
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_sharepoint_page_content: {str(e)}")
+        logger.exception("Error in get_sharepoint_page_content: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def _close_connections_before_fork():
+    """Drop pooled connections opened while loading the app so workers never share a socket"""
+    msal_app.http_client.close()
+
 if __name__ == "__main__":
-    import uvicorn
-    print("🚀 Starting OBO Flow Demo Server...")
-    print("🔐 Authentication: Custom API Scope with OBO Token Exchange")
-    print("📍 Server URL: http://localhost:5000")
-    print("📋 API Documentation: http://localhost:5000/docs")
-    uvicorn.run(app, host=HOST, port=PORT)
+    import sys
+    logger.info("Starting OBO Flow Demo Server (custom API scope with OBO token exchange)")
+    logger.info("Server URL: http://%s:%s, API documentation: http://%s:%s/docs", HOST, PORT, HOST, PORT)
+    sys.exit(serve(app, host=HOST, port=PORT, before_fork=_close_connections_before_fork))
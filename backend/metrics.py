@@ -0,0 +1,250 @@
+"""
+In-process Prometheus metrics.
+
+A deliberately small implementation of counters and histograms rendered in the
+Prometheus text exposition format. Labelled children are created once per
+label combination and reused, so recording an observation on the hot path is
+a dict lookup, a bisect and a few integer increments with no allocation.
+
+Statistics that already live elsewhere (cache hit/miss counters, throttling
+state) are not duplicated: collectors registered with ``register_collector``
+read them when ``/metrics`` is scraped.
+"""
+import abc
+import bisect
+import logging
+import re
+import time
+from typing import Callable, Iterable
+
+# Latency buckets in seconds, from cache-hit fast paths up to slow Graph calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Download size buckets in bytes, 1 KB to 256 MB
+BYTE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+
+_metrics = []
+_collectors = []
+
+
+def _format_labels(labels: Iterable[tuple]) -> str:
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return "{" + pairs + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric(abc.ABC):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        _metrics.append(self)
+
+    def labels(self, *values):
+        """Return the child for a label combination, creating it on first use"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """Create the state for one label combination"""
+
+    @abc.abstractmethod
+    def _render_child(self, labels: list, child) -> list:
+        """Render one label combination as exposition lines"""
+
+    def _label_pairs(self, values: tuple) -> list:
+        return list(zip(self.labelnames, values))
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(self._label_pairs(values), child))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _render_child(self, labels: list, child: _CounterChild) -> list:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(child.value)}"]
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, labels: list, child: _HistogramChild) -> list:
+        lines = []
+        cumulative = 0
+        for upper, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            bucket_labels = labels + [("le", _format_value(float(upper)))]
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {child.count}")
+        return lines
+
+
+def metric_family(name: str, type_name: str, documentation: str, samples: Iterable[tuple]) -> list:
+    """Render a collector-provided family from (labels dict, value) samples"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {type_name}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(labels.items())} {_format_value(value)}")
+    return lines
+
+
+def register_collector(collector: Callable[[], list]):
+    """Register a callable returning rendered metric families, invoked on every scrape"""
+    _collectors.append(collector)
+    return collector
+
+
+def render_metrics() -> str:
+    """Render every metric and collector in the Prometheus text format"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            logging.getLogger("app.metrics").exception("Metrics collector failed: %s", e)
+    return "\n".join(lines) + "\n"
+
+
+# Graph URL path segments kept verbatim in endpoint templates; anything else is an identifier
+_GRAPH_PATH_KEYWORDS = {
+    "$batch", "me", "sites", "root", "drives", "drive", "items", "children", "content", "delta",
+    "lists", "columns", "contentTypes", "fields", "pages", "followedSites", "recent", "insights",
+    "used", "trending", "shared", "users", "groups", "analytics", "versions", "permissions",
+    "thumbnails", "microsoft.graph.sitePage", "canvasLayout", "webParts"
+}
+_FUNCTION_SEGMENT = re.compile(r"^([A-Za-z.]+)\(.*\)$")
+
+
+def graph_endpoint_template(url: str, base_url: str) -> str:
+    """Reduce a Graph URL to a low-cardinality template such as /sites/{id}/drives"""
+    if not url.startswith(base_url):
+        return "external"
+
+    path = url[len(base_url):].split("?", 1)[0]
+    segments = []
+    for segment in path.strip("/").split("/"):
+        if segment in _GRAPH_PATH_KEYWORDS:
+            segments.append(segment)
+            continue
+        function = _FUNCTION_SEGMENT.match(segment)
+        if function:
+            segments.append(f"{function.group(1)}()")
+        elif segment.endswith(":"):
+            # Path-based addressing such as sites/{host}:/{path}: or root:/{path}:
+            segments.append("{path}:")
+        else:
+            segments.append("{id}")
+    return "/" + "/".join(segments)
+
+
+# Hot-path timings
+OBO_EXCHANGE_SECONDS = Histogram(
+    "obo_exchange_seconds", "Duration of MSAL on-behalf-of token exchanges", ("result",)
+)
+GRAPH_REQUEST_SECONDS = Histogram(
+    "graph_request_seconds", "Duration of individual Microsoft Graph HTTP calls", ("method", "endpoint", "status")
+)
+DOWNLOAD_BYTES = Histogram(
+    "file_download_bytes", "Bytes downloaded per file content request", ("file_type",), buckets=BYTE_BUCKETS
+)
+EXTRACTION_SECONDS = Histogram(
+    "text_extraction_seconds", "Duration of text extraction from downloaded files", ("file_type", "result")
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "End-to-end API handler latency", ("method", "route", "status")
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording handler latency by route template and status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status[0])
+            ).observe(time.perf_counter() - start)
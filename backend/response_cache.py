@@ -0,0 +1,154 @@
+"""
+Per-user cache for idempotent Microsoft Graph GET responses.
+
+Responses for rarely-changing resources (``me``, ``sites/{id}``, drive and
+list collections, ...) are cached per Graph token, so one user's cached data is
+never served to another. Fresh entries are served directly for a short TTL;
+stale entries that carried an ``ETag`` are revalidated with ``If-None-Match``
+and refreshed on ``304 Not Modified``. With a shared backend configured,
+entries are also kept there (encrypted, and past their TTL for as long as an
+ETag makes them worth revalidating) so every worker benefits from them.
+"""
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from cache_backend import CacheNamespace
+
+# Graph resources whose responses are safe to cache briefly (paths relative to the API version)
+CACHEABLE_PATHS = [
+    re.compile(pattern) for pattern in (
+        r"^/me$",
+        r"^/me/followedSites$",
+        r"^/sites/root$",
+        r"^/sites/[^/]+$",
+        r"^/sites/[^/]+/drives$",
+        r"^/sites/[^/]+/lists$",
+        r"^/sites/[^/]+/sites$",
+    )
+]
+
+_MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+def cache_partition(graph_token: str) -> str:
+    """Return the cache partition for a Graph token"""
+    return hashlib.sha256(graph_token.encode("utf-8")).hexdigest()
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "expires_at")
+
+    def __init__(self, body: dict, etag: Optional[str], expires_at: float):
+        self.body = body
+        self.etag = etag
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires_at > time.time()
+
+
+class GraphResponseCache:
+    """Bounded LRU of Graph GET responses partitioned by user token"""
+
+    def __init__(self, base_url: str, ttl: int = 60, max_entries: int = 2000, enabled: bool = True,
+                 shared: Optional[CacheNamespace] = None, stale_ttl: int = 3600):
+        self.base_url = base_url
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.shared = shared
+        # How long the shared tier keeps expired entries that can still be revalidated by ETag
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def is_cacheable(self, url: str) -> bool:
+        """Return True if url is a Graph GET whose response may be cached"""
+        if not self.enabled or not url.startswith(self.base_url + "/"):
+            return False
+        path = url[len(self.base_url):].split("?", 1)[0]
+        return any(pattern.match(path) for pattern in CACHEABLE_PATHS)
+
+    async def lookup(self, partition: str, url: str) -> Optional[CachedResponse]:
+        """Return the cached entry (fresh or stale) for a URL; only fresh entries count as hits"""
+        entry = self._entries.get((partition, url))
+        if entry is not None:
+            self._entries.move_to_end((partition, url))
+
+        if (entry is None or not entry.fresh) and self.shared is not None:
+            stored = await self.shared.get(f"{partition}|{url}")
+            if stored is not None and (entry is None or stored["expires_at"] > entry.expires_at):
+                entry = CachedResponse(stored["body"], stored["etag"], stored["expires_at"])
+                self._store(partition, url, entry)
+                if entry.fresh:
+                    self.shared_hits += 1
+
+        if entry is not None and entry.fresh:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return entry
+
+    async def store(self, partition: str, url: str, body: dict, headers) -> None:
+        """Cache a successful response unless Graph marked it as uncacheable"""
+        cache_control = (headers.get("cache-control") or "").lower()
+        if "no-store" in cache_control:
+            return
+
+        ttl = self.ttl
+        max_age = _MAX_AGE_PATTERN.search(cache_control)
+        if max_age:
+            ttl = min(ttl, int(max_age.group(1)))
+
+        etag = headers.get("etag")
+        if ttl <= 0 and not etag:
+            return
+
+        entry = CachedResponse(body, etag, time.time() + ttl)
+        self._store(partition, url, entry)
+        await self._share(partition, url, entry)
+
+    async def revalidated(self, partition: str, url: str, entry: CachedResponse) -> dict:
+        """Extend a stale entry after Graph answered 304 Not Modified"""
+        entry.expires_at = time.time() + self.ttl
+        self.revalidations += 1
+        await self._share(partition, url, entry)
+        return entry.body
+
+    def _store(self, partition: str, url: str, entry: CachedResponse):
+        self._entries[(partition, url)] = entry
+        self._entries.move_to_end((partition, url))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _share(self, partition: str, url: str, entry: CachedResponse):
+        if self.shared is None:
+            return
+        ttl = entry.expires_at - time.time() + (self.stale_ttl if entry.etag else 0)
+        await self.shared.set(
+            f"{partition}|{url}", {"body": entry.body, "etag": entry.etag, "expires_at": entry.expires_at}, ttl
+        )
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Return hit/miss/revalidation counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "shared": self.shared.stats() if self.shared is not None else None
+        }
@@ -0,0 +1,259 @@
+"""
+Production launcher: a pre-forking supervisor around uvicorn workers.
+
+``serve`` is called with the already imported application, so MSAL,
+configuration and caches are built once in the parent and shared
+copy-on-write. It binds the listening socket, then forks ``WEB_CONCURRENCY``
+uvicorn workers that accept on the inherited socket. Workers that die are
+replaced. With a single worker, or where ``os.fork`` is unavailable
+(Windows), the application runs in-process under plain uvicorn instead.
+
+On SIGTERM or SIGINT the supervisor optionally keeps serving for
+``SHUTDOWN_DELAY`` seconds (so load balancers stop routing first), then asks
+every worker to shut down gracefully: each stops accepting, lets in-flight
+requests and their Graph calls finish for up to ``GRACEFUL_TIMEOUT`` seconds,
+and runs the application's lifespan shutdown before exiting.
+
+``ConcurrencyLimitMiddleware`` bounds the requests a worker handles at once and
+answers ``503`` with ``Retry-After`` beyond that, instead of letting latency
+grow without bound under overload.
+"""
+import importlib.util
+import json
+import os
+import signal
+import socket
+import time
+from typing import Callable, Optional
+
+import uvicorn
+
+from app_logging import configure_logging, get_logger, stop_logging
+from metrics import metric_family, register_collector
+
+logger = get_logger("server")
+
+# Requests one worker handles concurrently before answering 503 (0 disables the limit)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "256"))
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", "75"))
+BACKLOG = int(os.getenv("BACKLOG", "2048"))
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+SHUTDOWN_DELAY = float(os.getenv("SHUTDOWN_DELAY", "0"))
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+ACCESS_LOG = os.getenv("ACCESS_LOG", "false").lower() == "true"
+
+# uvicorn's exit status when the application fails to start
+STARTUP_FAILURE = 3
+
+
+def available_cpus() -> int:
+    """Return the CPUs this process may use, honoring affinity and cgroup CPU quotas"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # Containers commonly see every host CPU but are limited by a quota
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(int(quota) // int(period), 1))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def default_worker_count() -> int:
+    return int(os.getenv("WEB_CONCURRENCY") or available_cpus())
+
+
+_in_flight = 0
+_rejected = 0
+
+
+class ConcurrencyLimitMiddleware:
+    """Reject HTTP requests with 503 while the worker is already handling its limit"""
+
+    def __init__(self, app, limit: int = MAX_CONCURRENT_REQUESTS, exempt_paths: tuple = ("/metrics",)):
+        self.app = app
+        self.limit = limit
+        self.exempt_paths = exempt_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.limit <= 0 or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        global _in_flight, _rejected
+        if _in_flight >= self.limit:
+            _rejected += 1
+            body = json.dumps({"detail": "Server is busy, please retry"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", b"1")
+                ]
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        _in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _in_flight -= 1
+
+
+@register_collector
+def collect_concurrency_metrics() -> list:
+    return (
+        metric_family("http_requests_in_flight", "gauge", "Requests this worker is handling",
+                      [({}, _in_flight)])
+        + metric_family("http_requests_rejected_total", "counter", "Requests answered 503 by the concurrency limit",
+                        [({}, _rejected)])
+    )
+
+
+def _bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    # Connections queue here while workers start or are busy accepting
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(config: uvicorn.Config, sock: socket.socket) -> int:
+    """Serve on the inherited socket until asked to stop; returns the exit status"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # The parent's log writer thread does not survive fork
+    configure_logging()
+    server = uvicorn.Server(config)
+    try:
+        server.run(sockets=[sock])
+    finally:
+        stop_logging()
+    return 0 if server.started else STARTUP_FAILURE
+
+
+def _spawn_worker(config: uvicorn.Config, sock: socket.socket, before_fork: Optional[Callable]) -> int:
+    if before_fork is not None:
+        before_fork()
+    # Flush and stop the writer thread so no lock is held mid-write across fork
+    stop_logging()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            status = _run_worker(config, sock)
+        finally:
+            os._exit(status)
+    configure_logging()
+    return pid
+
+
+def _serve_single(config: uvicorn.Config) -> int:
+    """Run one uvicorn server in this process; uvicorn handles the signals and graceful shutdown"""
+    logger.info("Starting a single worker on %s:%s", config.host, config.port)
+    server = uvicorn.Server(config)
+    server.run()
+    return 0 if server.started else STARTUP_FAILURE
+
+
+def serve(app, host: str, port: int, workers: Optional[int] = None, before_fork: Optional[Callable] = None):
+    """Run app in pre-forked uvicorn workers until SIGTERM/SIGINT, then drain them"""
+    workers = max(workers or default_worker_count(), 1)
+    if workers > 1 and not hasattr(os, "fork"):
+        logger.warning("os.fork is not available on this platform, running a single worker instead of %d", workers)
+        workers = 1
+    config = uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        # uvloop and httptools are used when installed
+        loop="auto",
+        http="auto",
+        lifespan="on",
+        backlog=BACKLOG,
+        # Longer than typical load balancer idle timeouts, so the balancer closes idle connections first
+        timeout_keep_alive=KEEPALIVE_TIMEOUT,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+        access_log=ACCESS_LOG
+    )
+    if workers == 1:
+        return _serve_single(config)
+
+    sock = _bind_socket(host, port, BACKLOG)
+    logger.info("Starting %d workers on %s:%s (loop=%s, http=%s)", workers, host, port,
+                "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+                "httptools" if importlib.util.find_spec("httptools") else "h11")
+
+    stopping = []
+
+    def handle_stop(signum, frame):
+        if not stopping:
+            stopping.append(time.monotonic())
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    children = {}
+    for _ in range(workers):
+        children[_spawn_worker(config, sock, before_fork)] = time.monotonic()
+
+    exit_status = 0
+    signalled = killed = False
+    while children:
+        time.sleep(0.2)
+
+        if stopping and not signalled and time.monotonic() - stopping[0] >= SHUTDOWN_DELAY:
+            logger.info("Draining %d workers", len(children))
+            signalled = True
+            # Closing the parent's copy lets the socket go away once the workers stop accepting
+            sock.close()
+            for pid in children:
+                _signal_worker(pid, signal.SIGTERM)
+        if signalled and not killed and time.monotonic() - stopping[0] > SHUTDOWN_DELAY + GRACEFUL_TIMEOUT + 10:
+            killed = True
+            logger.error("Workers did not stop in time, killing %d", len(children))
+            for pid in children:
+                _signal_worker(pid, signal.SIGKILL)
+
+        while children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            started = children.pop(pid, None)
+            if started is None or stopping:
+                continue
+
+            code = os.waitstatus_to_exitcode(status)
+            if code == STARTUP_FAILURE:
+                logger.error("Worker %d failed to start, shutting down", pid)
+                exit_status = STARTUP_FAILURE
+                stopping.append(time.monotonic() - SHUTDOWN_DELAY)
+                continue
+
+            logger.warning("Worker %d exited with status %d, starting a replacement", pid, code)
+            # Avoid a tight crash loop when workers die right after starting
+            if time.monotonic() - started < 1:
+                time.sleep(1)
+            children[_spawn_worker(config, sock, before_fork)] = time.monotonic()
+
+    logger.info("All workers stopped")
+    return exit_status
+
+
+def _signal_worker(pid: int, signum: int):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
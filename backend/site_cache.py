@@ -0,0 +1,202 @@
+"""
+Tenant-scoped cache for resolving SharePoint site identifiers.
+
+Handlers accept an empty ``site_id`` (meaning the root site), a canonical
+Graph site ID, or a hostname/URL such as ``contoso.sharepoint.com/sites/hr``.
+The root site is cached per tenant with a TTL. URL lookups go through an
+indexed map instead of scanning the ``sites?search=*`` enumeration on every
+request; since that enumeration is trimmed to the sites the user can see, the
+index and URL resolutions (including negatively cached failures) are kept per
+user. Indexes live in a bounded LRU, so memory stays proportional to
+``max_url_indexes`` rather than to every user ever seen. With a shared backend
+configured, resolutions are also shared with the other workers.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app_logging import get_logger
+from cache_backend import CacheNamespace
+from graph_client import GRAPH_BASE_URL, iter_graph_items, make_graph_request
+from projection import SITE_SELECT, with_select
+
+logger = get_logger("cache")
+
+
+def normalize_site_url(value: str) -> str:
+    """Normalize a hostname or site URL for use as an index key"""
+    value = value.strip().lower()
+    for prefix in ("https://", "http://"):
+        if value.startswith(prefix):
+            value = value[len(prefix):]
+    return value.rstrip("/")
+
+
+def is_site_url(site_id: str) -> bool:
+    """Return True when site_id looks like a hostname or URL rather than a Graph site ID"""
+    return "sharepoint.com" in site_id and "," not in site_id
+
+
+class SiteResolver:
+    """Resolves "root", hostnames and site URLs to canonical Graph site IDs"""
+
+    def __init__(self, ttl: int = 900, negative_ttl: int = 120, max_entries: int = 10000,
+                 max_url_indexes: int = 100, shared: Optional[CacheNamespace] = None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.max_url_indexes = max_url_indexes
+        # (tenant_id or user_key, key) -> (site_id or None, expires_at)
+        self._entries = OrderedDict()
+        # user_key -> (expires_at, {normalized web URL: site_id}), least recently used first
+        self._url_indexes = OrderedDict()
+        # user_key -> lock serializing index builds; removed together with the index
+        self._index_locks = {}
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    async def resolve(self, site_id: Optional[str], graph_token: str, tenant_id: Optional[str], user_key: str) -> str:
+        """Return the canonical site ID for site_id, defaulting to the tenant's root site"""
+        if not site_id or site_id == "root":
+            cached = await self._get(tenant_id, "root")
+            if cached is not None:
+                return cached[0]
+
+            # Same projection as the sites endpoint, so both share one cached response
+            root_site = await make_graph_request(with_select(f"{GRAPH_BASE_URL}/sites/root", SITE_SELECT), graph_token)
+            resolved = root_site.get("id", "root")
+            await self._set(tenant_id, "root", resolved, self.ttl)
+            return resolved
+
+        if not is_site_url(site_id):
+            return site_id
+
+        key = normalize_site_url(site_id)
+        cached = await self._get(user_key, key)
+        if cached is not None:
+            # A negative entry means the value is used as given
+            return cached[0] or site_id
+
+        resolved = None
+        try:
+            resolved = await self._lookup_site_url(key, graph_token, user_key)
+        except Exception as e:
+            logger.warning("Could not resolve site %s: %s", site_id, e)
+
+        if resolved:
+            await self._set(user_key, key, resolved, self.ttl)
+            return resolved
+
+        await self._set(user_key, key, None, self.negative_ttl)
+        return site_id
+
+    async def _lookup_site_url(self, key: str, graph_token: str, user_key: str) -> Optional[str]:
+        # Graph can address a site directly by hostname and server-relative path
+        hostname, _, path = key.partition("/")
+        direct_url = f"{GRAPH_BASE_URL}/sites/{hostname}:/{path}" if path else f"{GRAPH_BASE_URL}/sites/{hostname}"
+        try:
+            site = await make_graph_request(with_select(direct_url, "id"), graph_token)
+            if site.get("id"):
+                return site["id"]
+        except Exception:
+            pass
+
+        # Fall back to the user's site index built from sites?search=*
+        index = await self._get_url_index(graph_token, user_key)
+        if key in index:
+            return index[key]
+
+        # Preserve the old partial-match behaviour for fragments of a site URL
+        for web_url, indexed_site_id in index.items():
+            if key in web_url:
+                return indexed_site_id
+        return None
+
+    def _cached_url_index(self, user_key: str) -> Optional[dict]:
+        index = self._url_indexes.get(user_key)
+        if index is None:
+            return None
+        if index[0] <= time.time():
+            del self._url_indexes[user_key]
+            return None
+        self._url_indexes.move_to_end(user_key)
+        return index[1]
+
+    async def _get_url_index(self, graph_token: str, user_key: str) -> dict:
+        url_index = self._cached_url_index(user_key)
+        if url_index is not None:
+            return url_index
+
+        lock = self._index_locks.setdefault(user_key, asyncio.Lock())
+        async with lock:
+            # Another request may have built the index while we waited
+            url_index = self._cached_url_index(user_key)
+            if url_index is not None:
+                return url_index
+
+            url_index = {}
+            async for site in iter_graph_items(f"{GRAPH_BASE_URL}/sites?search=*&$select=id,webUrl", graph_token):
+                if site.get("webUrl") and site.get("id"):
+                    url_index.setdefault(normalize_site_url(site["webUrl"]), site["id"])
+
+            self._store_url_index(user_key, url_index)
+            return url_index
+
+    def _store_url_index(self, user_key: str, url_index: dict):
+        now = time.time()
+        self._url_indexes[user_key] = (now + self.ttl, url_index)
+        self._url_indexes.move_to_end(user_key)
+
+        expired = [key for key, (expires_at, _) in self._url_indexes.items() if expires_at <= now]
+        for key in expired:
+            del self._url_indexes[key]
+        while len(self._url_indexes) > self.max_url_indexes:
+            self._url_indexes.popitem(last=False)
+
+        # Drop the build locks of evicted indexes, except any a build still holds
+        for key in [key for key, lock in self._index_locks.items()
+                    if key not in self._url_indexes and not lock.locked()]:
+            del self._index_locks[key]
+
+    async def _get(self, scope: Optional[str], key: str) -> Optional[tuple]:
+        entry = self._entries.get((scope, key))
+        if (entry is None or entry[1] <= time.time()) and self.shared is not None:
+            stored = await self.shared.get(f"{scope}|{key}")
+            if stored is not None:
+                entry = (stored["site_id"], stored["expires_at"])
+                self._store(scope, key, entry)
+                self.shared_hits += 1
+
+        if entry is None or entry[1] <= time.time():
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end((scope, key))
+        self.hits += 1
+        return entry
+
+    async def _set(self, scope: Optional[str], key: str, site_id: Optional[str], ttl: int):
+        expires_at = time.time() + ttl
+        self._store(scope, key, (site_id, expires_at))
+        if self.shared is not None:
+            await self.shared.set(f"{scope}|{key}", {"site_id": site_id, "expires_at": expires_at}, ttl)
+
+    def _store(self, scope: Optional[str], key: str, entry: tuple):
+        self._entries[(scope, key)] = entry
+        self._entries.move_to_end((scope, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters for monitoring"""
+        return {
+            "entries": len(self._entries),
+            "indexed_users": len(self._url_indexes),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "shared": self.shared.stats() if self.shared is not None else None
+        }
@@ -0,0 +1,72 @@
+"""
+Progressive responses for aggregate endpoints.
+
+Endpoints that fan out over several drives or lists can answer with a stream
+of events instead of one JSON document, so clients render each drive or list
+as soon as its Graph call returns rather than after the slowest one. Two
+encodings are offered:
+
+- ``sse``: Server-Sent Events (``text/event-stream``), one ``event:``/``data:``
+  block per event, usable with ``EventSource``-style readers.
+- ``ndjson``: newline-delimited JSON (``application/x-ndjson``), one
+  ``{"event": ..., "data": ...}`` object per line, easy to consume with
+  ``fetch`` and a stream reader.
+
+Every stream ends with a ``summary`` event on success or an ``error`` event if
+the handler fails after the response has started.
+"""
+from typing import AsyncIterator, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from app_logging import get_logger
+from json_responses import dumps
+from projection import project
+
+logger = get_logger("api")
+
+STREAM_FORMATS = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+# Query parameter pattern for endpoints offering a streaming variant
+STREAM_FORMAT_PATTERN = "^(" + "|".join(STREAM_FORMATS) + ")$"
+
+
+def encode_event(stream_format: str, event: str, data: dict) -> bytes:
+    """Serialize one event in the requested stream format"""
+    payload = dumps(data, default=str)
+    if stream_format == "sse":
+        return b"event: " + event.encode() + b"\ndata: " + payload + b"\n\n"
+    return b'{"event":' + dumps(event) + b',"data":' + payload + b"}\n"
+
+
+async def _encode_events(events: AsyncIterator[Tuple[str, dict]], stream_format: str,
+                         fields: Optional[dict]) -> AsyncIterator[bytes]:
+    try:
+        async for event, data in events:
+            yield encode_event(stream_format, event, project(data, fields))
+    except Exception as e:
+        # Headers are already sent, so failures are reported in-band
+        if isinstance(e, HTTPException):
+            error = {"status_code": e.status_code, "detail": e.detail}
+        else:
+            logger.exception("Error while streaming response: %s", e)
+            error = {"status_code": 500, "detail": f"Internal server error: {str(e)}"}
+        yield encode_event(stream_format, "error", error)
+
+
+def event_stream_response(events: AsyncIterator[Tuple[str, dict]], stream_format: str,
+                          fields: Optional[dict] = None) -> StreamingResponse:
+    """Wrap an async iterator of (event, data) pairs in a streaming response, trimmed to fields if given"""
+    return StreamingResponse(
+        _encode_events(events, stream_format, fields),
+        media_type=STREAM_FORMATS[stream_format],
+        headers={
+            "Cache-Control": "no-cache",
+            # Keep reverse proxies such as nginx from buffering the stream
+            "X-Accel-Buffering": "no"
+        }
+    )
@@ -0,0 +1,91 @@
+"""
+Shared fixtures: the benchmark's fake Entra ID and Graph services, served
+in-process through an ASGI transport so tests need no network or ports.
+"""
+import os
+import sys
+from functools import partial
+
+# Settings are read at import time, so they must be in place before the backend modules load
+os.environ.setdefault("GRAPH_BASE_URL", "http://graph.test/v1.0")
+os.environ.setdefault("GRAPH_TENANT_RATE", "0")
+os.environ.setdefault("GRAPH_CACHE_ENABLED", "false")
+os.environ.setdefault("CACHE_BACKEND", "none")
+os.environ.setdefault("TRACE_EXPORTER", "none")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_services import CLIENT_ID, PUBLIC_ENTRA_URL, TENANT_ID, FakeServiceConfig, FakeServices
+
+os.environ.setdefault("AZURE_TENANT_ID", TENANT_ID)
+os.environ.setdefault("AZURE_CLIENT_ID", CLIENT_ID)
+os.environ.setdefault("AZURE_CLIENT_SECRET", "test-secret")
+os.environ.setdefault("AUTHORITY", f"{PUBLIC_ENTRA_URL}/{TENANT_ID}")
+os.environ.setdefault("JWKS_URL", f"http://login.test/{TENANT_ID}/discovery/v2.0/keys")
+
+import httpx
+import msal
+import pytest
+from starlette.testclient import TestClient
+
+import graph_client
+
+
+def fake_config(**overrides) -> FakeServiceConfig:
+    """A small fake tenant without artificial latency"""
+    settings = dict(graph_latency_ms=0, graph_jitter_ms=0, token_latency_ms=0, items_per_drive=20, file_kb=1)
+    return FakeServiceConfig(**{**settings, **overrides})
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def fake_services():
+    return FakeServices(fake_config())
+
+
+@pytest.fixture
+async def graph_http_client(fake_services, monkeypatch):
+    """Route the shared Graph HTTP client to the fake services"""
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_services))
+    monkeypatch.setattr(graph_client, "_http_client", client)
+    yield client
+    await client.aclose()
+
+
+@pytest.fixture(scope="session")
+def api_services():
+    """Fake services behind the API module, which is imported once per session"""
+    return FakeServices(fake_config())
+
+
+@pytest.fixture(scope="session")
+def api(api_services):
+    """The API module, with MSAL sending its (synchronous) Entra ID calls to the fake services"""
+    original = msal.ConfidentialClientApplication
+    msal.ConfidentialClientApplication = partial(original, http_client=TestClient(api_services))
+    try:
+        import main
+    finally:
+        msal.ConfidentialClientApplication = original
+    return main
+
+
+@pytest.fixture
+async def api_client(api, api_services, monkeypatch):
+    """HTTP client for the API, with Graph and JWKS calls served by the fake services"""
+    graph = httpx.AsyncClient(transport=httpx.ASGITransport(app=api_services))
+    monkeypatch.setattr(graph_client, "_http_client", graph)
+    api.obo_token_cache.clear()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://api.test") as client:
+        yield client
+    await graph.aclose()
+
+
+@pytest.fixture
+def auth_headers(api_services):
+    return {"Authorization": f"Bearer {api_services.mint_user_token(1)}"}
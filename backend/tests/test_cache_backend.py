@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+
+from cache_backend import (
+    CacheBackend,
+    CacheNamespace,
+    MemoryCacheBackend,
+    SqliteCacheBackend,
+    create_cipher,
+)
+from token_cache import OboTokenCache
+
+pytestmark = pytest.mark.anyio
+
+
+class FailingCacheBackend(CacheBackend):
+    """Far tier that is down"""
+
+    name = "failing"
+
+    async def get(self, key):
+        raise ConnectionError("cache unavailable")
+
+    async def set(self, key, value, ttl):
+        raise ConnectionError("cache unavailable")
+
+    async def delete(self, key):
+        raise ConnectionError("cache unavailable")
+
+
+def test_backends_must_implement_every_operation():
+    class Incomplete(CacheBackend):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        CacheBackend()
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+async def test_encrypted_namespace_round_trip():
+    backend = MemoryCacheBackend()
+    namespace = CacheNamespace(backend, "obo", create_cipher("", "client-secret"))
+    await namespace.set("key", ["access-token", 123], ttl=60)
+
+    raw = await backend.get("obo:key")
+    assert b"access-token" not in raw
+    assert await namespace.get("key") == ["access-token", 123]
+
+    # Workers sharing the client secret derive the same key
+    other_worker = CacheNamespace(backend, "obo", create_cipher("", "client-secret"))
+    assert await other_worker.get("key") == ["access-token", 123]
+
+
+async def test_key_rotation():
+    old_key, new_key = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+    backend = MemoryCacheBackend()
+    await CacheNamespace(backend, "obo", create_cipher(old_key, None)).set("old", "value", ttl=60)
+
+    # New key first: entries written under the old key still read while it is listed
+    rotating = CacheNamespace(backend, "obo", create_cipher(f"{new_key},{old_key}", None))
+    assert await rotating.get("old") == "value"
+    await rotating.set("new", "value", ttl=60)
+
+    # Once the old key is retired its entries read as misses, never as errors
+    rotated = CacheNamespace(backend, "obo", create_cipher(new_key, None))
+    assert await rotated.get("old") is None
+    assert await rotated.get("new") == "value"
+    assert rotated.stats() == {"backend": "memory", "hits": 1, "misses": 1, "errors": 0}
+
+
+async def test_sqlite_backend_expires_and_purges(tmp_path, monkeypatch):
+    monkeypatch.setattr(SqliteCacheBackend, "PURGE_INTERVAL", 5)
+    path = str(tmp_path / "cache.sqlite3")
+    backend = SqliteCacheBackend(path, max_entries=3)
+    try:
+        await backend.set("expired", b"old", ttl=0.01)
+        time.sleep(0.02)
+        assert await backend.get("expired") is None
+
+        for i in range(4):
+            await backend.set(f"key-{i}", f"value-{i}".encode(), ttl=60 + i)
+        assert await backend.get("key-3") == b"value-3"
+
+        # The fifth write purges the expired row and the entries beyond max_entries, soonest to expire first
+        with sqlite3.connect(path) as connection:
+            keys = [row[0] for row in connection.execute("SELECT key FROM cache ORDER BY key")]
+        assert keys == ["key-1", "key-2", "key-3"]
+
+        await backend.delete("key-3")
+        assert await backend.get("key-3") is None
+        assert os.stat(path).st_mode & 0o777 == 0o600
+    finally:
+        await backend.close()
+
+
+async def test_far_tier_failures_are_misses():
+    namespace = CacheNamespace(FailingCacheBackend(), "obo")
+    await namespace.set("key", "value", ttl=60)
+    assert await namespace.get("key") is None
+    assert namespace.errors == 2
+
+    # A cache with a failing far tier keeps working from its near tier
+    cache = OboTokenCache(shared=namespace)
+    await cache.set("key", {"access_token": "token", "expires_in": 3600})
+    assert await cache.get("key") == "token"
+    assert await cache.get("other") is None
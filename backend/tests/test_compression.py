@@ -0,0 +1,115 @@
+import gzip
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import compression
+from compression import CompressionMiddleware, negotiate_encoding
+
+pytestmark = pytest.mark.anyio
+
+LARGE = {"items": [{"id": i, "name": f"Budget report {i}.xlsx"} for i in range(200)]}
+
+
+async def large(request):
+    return JSONResponse(LARGE, headers={"vary": "Authorization"})
+
+
+async def small(request):
+    return JSONResponse({"id": 1})
+
+
+async def image(request):
+    return Response(b"\x89PNG" * 1024, media_type="image/png")
+
+
+async def events(request):
+    async def stream():
+        for i in range(3):
+            yield f"data: {'x' * 1024} {i}\n\n"
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+async def chunked(request):
+    async def stream():
+        for _ in range(3):
+            yield "x" * 1024
+    return StreamingResponse(stream(), media_type="text/plain")
+
+
+async def encoded(request):
+    return PlainTextResponse(gzip.compress(b"x" * 2048), headers={"content-encoding": "gzip"})
+
+
+app = CompressionMiddleware(Starlette(routes=[
+    Route("/large", large), Route("/small", small), Route("/image", image), Route("/events", events),
+    Route("/chunked", chunked), Route("/encoded", encoded),
+]), minimum_size=1024)
+
+
+async def get(path: str, accept_encoding: str) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        # Read the raw bytes, so the assertions see what went over the wire
+        async with client.stream("GET", path, headers={"accept-encoding": accept_encoding}) as response:
+            response.raw_body = b"".join([chunk async for chunk in response.aiter_raw()])
+            return response
+
+
+@pytest.mark.parametrize("accept_encoding, with_brotli, expected", [
+    ("gzip, deflate, br", True, "br"),
+    ("gzip, deflate, br", False, "gzip"),
+    ("br", False, None),
+    ("gzip;q=1.0, br;q=0.5", True, "gzip"),
+    ("br;q=0, gzip", True, "gzip"),
+    ("gzip;q=0", False, None),
+    ("*", False, "gzip"),
+    ("*;q=0.5, br", True, "br"),
+    ("identity", True, None),
+    ("", True, None),
+])
+def test_negotiate_encoding(accept_encoding, with_brotli, expected, monkeypatch):
+    monkeypatch.setattr(compression, "brotli", object() if with_brotli else None)
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+async def test_large_json_is_gzipped():
+    response = await get("/large", "gzip, deflate")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Authorization, Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(response.raw_body)
+    assert gzip.decompress(response.raw_body) == JSONResponse(LARGE).body
+
+
+async def test_brotli_is_preferred_when_installed():
+    brotli = pytest.importorskip("brotli")
+    response = await get("/large", "gzip, br")
+    assert response.headers["content-encoding"] == "br"
+    assert brotli.decompress(response.raw_body) == JSONResponse(LARGE).body
+
+
+async def test_brotli_only_client_gets_identity_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    response = await get("/large", "br")
+    assert "content-encoding" not in response.headers
+    assert response.raw_body == JSONResponse(LARGE).body
+
+
+@pytest.mark.parametrize("path", ["/small", "/image", "/events", "/chunked", "/encoded"])
+async def test_passthrough(path):
+    expected = await get(path, "identity")
+    response = await get(path, "gzip")
+
+    # Small, incompressible, streamed and already encoded responses are sent as the app produced them
+    assert response.headers.get("content-encoding") == expected.headers.get("content-encoding")
+    assert response.raw_body == expected.raw_body
+    assert "accept-encoding" not in response.headers.get("vary", "").lower()
+
+
+async def test_api_responses_are_compressed(api, api_services, api_client, auth_headers):
+    response = await api_client.get("/api/dashboard", headers={**auth_headers, "accept-encoding": "gzip"},
+                                    params={"site_id": api_services.tenant.root_site_id})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json()["sections"]
@@ -0,0 +1,58 @@
+import pytest
+from fastapi import HTTPException
+
+pytestmark = pytest.mark.anyio
+
+
+async def get_dashboard(api_client, auth_headers, api_services, **params) -> dict:
+    params.setdefault("site_id", api_services.tenant.root_site_id)
+    response = await api_client.get("/api/dashboard", params=params, headers=auth_headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_all_sections(api, api_services, api_client, auth_headers):
+    dashboard = await get_dashboard(api_client, auth_headers, api_services)
+    assert set(dashboard["sections"]) == set(api.DASHBOARD_SECTIONS)
+    assert dashboard["errors"] == {}
+    assert dashboard["site_id"] == api_services.tenant.root_site_id
+
+
+async def test_failing_section_does_not_fail_the_others(api, api_services, api_client, auth_headers, monkeypatch):
+    async def forbidden(site_id, token, graph_token):
+        raise HTTPException(status_code=403, detail="Forbidden: Insufficient permissions")
+
+    async def broken(site_id, token, graph_token):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(api.DASHBOARD_SECTIONS, "lists", (api.DASHBOARD_SECTIONS["lists"][0], forbidden))
+    monkeypatch.setitem(api.DASHBOARD_SECTIONS, "pages", (api.DASHBOARD_SECTIONS["pages"][0], broken))
+    dashboard = await get_dashboard(api_client, auth_headers, api_services, sections="lists,pages,libraries,user")
+
+    assert dashboard["errors"] == {
+        "lists": {"status_code": 403, "detail": "Forbidden: Insufficient permissions"},
+        "pages": {"status_code": 500, "detail": "Internal server error: boom"},
+    }
+    assert set(dashboard["sections"]) == {"libraries", "user"}
+
+
+async def test_missing_consent_fails_only_the_sections_needing_it(api, api_services, api_client, auth_headers,
+                                                                  monkeypatch):
+    exchange = api.exchange_token_via_obo
+
+    async def exchange_without_files_consent(token, scopes):
+        if api.GRAPH_FILES_READ in scopes:
+            raise HTTPException(status_code=403, detail="Admin consent required for Files.Read.All")
+        return await exchange(token, scopes)
+
+    monkeypatch.setattr(api, "exchange_token_via_obo", exchange_without_files_consent)
+    dashboard = await get_dashboard(api_client, auth_headers, api_services, sections="sites,recent,navigation")
+
+    assert dashboard["errors"] == {"recent": {"status_code": 403, "detail": "Admin consent required for Files.Read.All"}}
+    assert set(dashboard["sections"]) == {"sites", "navigation"}
+
+
+async def test_unknown_section_is_rejected(api, api_client, auth_headers):
+    response = await api_client.get("/api/dashboard", params={"sections": "user,weather"}, headers=auth_headers)
+    assert response.status_code == 400
+    assert "weather" in response.json()["detail"]
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+import graph_throttle
+from drive_index import DriveIndex, DriveIndexManager
+from graph_throttle import GraphThrottle, graph_background
+
+pytestmark = pytest.mark.anyio
+
+
+def drive_item(item_id: str, name: str, parent_id: str = "root") -> dict:
+    return {"id": item_id, "name": name, "file": {"mimeType": "text/plain"},
+            "parentReference": {"id": parent_id, "driveId": "drive"}}
+
+
+def test_search_matches_name_token_prefixes():
+    index = DriveIndex("drive")
+    index.apply([
+        {"id": "root", "root": {}, "folder": {}},
+        drive_item("1", "Budget 2024.xlsx"),
+        drive_item("2", "Team budget-review.docx"),
+        drive_item("3", "Roadmap.pptx"),
+    ])
+
+    assert [entry["id"] for entry in index.search("budg")] == ["1", "2"]
+    assert [entry["id"] for entry in index.search("budget rev")] == ["2"]
+    assert index.search("udget") == []
+
+
+def test_search_follows_renames_and_deletions():
+    index = DriveIndex("drive")
+    index.apply([{"id": "root", "root": {}}, drive_item("1", "Budget.xlsx"), drive_item("2", "Notes.txt")])
+    index.apply([drive_item("1", "Forecast.xlsx"), {"id": "2", "deleted": {}}])
+
+    assert index.search("budget") == []
+    assert index.search("notes") == []
+    assert [entry["id"] for entry in index.search("fore")] == ["1"]
+
+
+def test_indexes_are_bounded_by_total_items():
+    manager = DriveIndexManager(max_indexes=10, max_total_items=5)
+    indexes = {}
+    for drive in ("a", "b", "c"):
+        indexes[drive] = DriveIndex(drive)
+        indexes[drive].apply([drive_item(f"{drive}{i}", f"File {i}.txt") for i in range(2)])
+
+    manager._store(("user", "a"), indexes["a"])
+    manager._store(("user", "b"), indexes["b"])
+    manager._store(("user", "a"), indexes["a"])
+    manager._store(("user", "c"), indexes["c"])
+
+    # b, the least recently used, goes once the total exceeds the budget, though the count is within max_indexes
+    assert list(manager._indexes) == [("user", "a"), ("user", "c")]
+
+
+async def test_background_requests_have_their_own_budget(monkeypatch):
+    waits = []
+
+    async def sleep(delay):
+        waits.append(delay)
+
+    monkeypatch.setattr(graph_throttle.asyncio, "sleep", sleep)
+    throttle = GraphThrottle(tenant_rate=100, tenant_burst=100, background_rate=1, background_burst=1)
+    for _ in range(5):
+        await throttle.acquire()
+    assert waits == []
+
+    async def crawl():
+        graph_background.set(True)
+        for _ in range(2):
+            await throttle.acquire()
+
+    # A crawl is paced by the background bucket long before the tenant bucket runs out
+    await asyncio.create_task(crawl())
+    assert len(waits) == 1 and 0.9 < waits[0] <= 1
+    assert throttle.stats()["background_tenants"] == 1
+
+
+async def build_indexes(api, api_client, auth_headers, site_id: str):
+    """Request a listing so the user's drive indexes are built, and wait for the syncs"""
+    response = await api_client.get("/api/sharepoint/libraries", params={"site_id": site_id}, headers=auth_headers)
+    assert response.status_code == 200
+    await asyncio.gather(*api.drive_index._syncs.values())
+
+
+async def test_name_search_is_answered_from_the_index(api, api_services, api_client, auth_headers):
+    site_id = api_services.tenant.root_site_id
+    await build_indexes(api, api_client, auth_headers, site_id)
+    hits = api.drive_index.hits
+
+    response = await api_client.get("/api/sharepoint/libraries", headers=auth_headers,
+                                     params={"site_id": site_id, "search_name": "budget"})
+    results = response.json()["search_results"]
+
+    assert api.drive_index.hits > hits
+    assert results and all("budget" in result["name"].lower() for result in results)
+    # Download URLs, which the index does not keep, are fetched per hit
+    assert all(result["download_url"].endswith(f"/benchmark/download/{result['id']}") for result in results)
+
+
+async def test_content_search_uses_graph_search(api, api_services, api_client, auth_headers):
+    site_id = api_services.tenant.root_site_id
+    await build_indexes(api, api_client, auth_headers, site_id)
+    hits = api.drive_index.hits
+
+    response = await api_client.get("/api/sharepoint/libraries", headers=auth_headers,
+                                     params={"site_id": site_id, "search_name": "udget", "search_scope": "content"})
+    results = response.json()["search_results"]
+
+    # Graph search matches inside words, which the name index does not
+    assert api.drive_index.hits == hits
+    assert results and all(result["download_url"] for result in results)
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import signal
+import time
+
+import pytest
+
+import extraction
+from extraction import Extractor, ExtractionTimeout, run_extractor
+
+pytestmark = pytest.mark.anyio
+
+
+def _echo(source, max_chars):
+    return source[:max_chars]
+
+
+def _busy(source, max_chars):
+    while True:
+        pass
+
+
+def _stuck(source, max_chars):
+    # Like an extractor stuck in C code, which the worker's own alarm cannot interrupt
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+    time.sleep(60)
+
+
+def _crash(source, max_chars):
+    os._exit(1)
+
+
+def extractor(func) -> Extractor:
+    return Extractor(name=func.__name__.strip("_"), content_type="text", func=func)
+
+
+@pytest.fixture(autouse=True)
+def pool(monkeypatch):
+    monkeypatch.setattr(extraction, "EXTRACTION_TIMEOUT", 0.5)
+    monkeypatch.setattr(extraction, "STUCK_WORKER_GRACE", 0.5)
+    yield
+    extraction.shutdown_extraction_pool(wait=True)
+
+
+async def test_runs_extractor_in_pool():
+    assert await run_extractor(extractor(_echo), "hello world", 5) == "hello"
+
+
+async def test_worker_aborts_itself_at_timeout():
+    pool = extraction.get_extraction_pool()
+    with pytest.raises(ExtractionTimeout):
+        await run_extractor(extractor(_busy), "", 10)
+
+    # The worker recovered on its own, so the pool is kept
+    assert extraction._extraction_pool is pool
+    assert await run_extractor(extractor(_echo), "still working", 5) == "still"
+
+
+async def test_stuck_worker_is_terminated(monkeypatch):
+    processes = []
+    discard_pool = extraction._discard_pool
+
+    def record_workers(pool):
+        processes.extend(pool._processes.values())
+        discard_pool(pool)
+
+    monkeypatch.setattr(extraction, "_discard_pool", record_workers)
+    with pytest.raises(asyncio.TimeoutError):
+        await run_extractor(extractor(_stuck), "", 10)
+
+    assert processes
+    for process in processes:
+        process.join(timeout=5)
+        assert not process.is_alive()
+    assert extraction._extraction_pool is None
+    assert await run_extractor(extractor(_echo), "fresh pool", 5) == "fresh"
+
+
+async def test_crashed_worker_replaces_pool():
+    pool = extraction.get_extraction_pool()
+    with pytest.raises(RuntimeError, match="crashed"):
+        await run_extractor(extractor(_crash), "", 10)
+
+    assert extraction._extraction_pool is None
+    assert pool._shutdown_thread
+    assert await run_extractor(extractor(_echo), "fresh pool", 5) == "fresh"
@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from extraction_cache import ExtractionCache
+
+pytestmark = pytest.mark.anyio
+
+
+def _disk_usage(disk_dir) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(disk_dir) if entry.name.endswith(".json"))
+
+
+async def test_overwriting_an_entry_keeps_disk_bytes_accurate(tmp_path):
+    cache = ExtractionCache(disk_dir=str(tmp_path))
+    await cache.set("key", {"content": "x" * 1000})
+    await cache.set("key", {"content": "y" * 400})
+    await cache.set("other", {"content": "z" * 10})
+
+    assert cache.stats()["disk_bytes"] == _disk_usage(tmp_path)
+
+
+
+async def test_disk_entries_are_private(tmp_path):
+    disk_dir = tmp_path / "extractions"
+    cache = ExtractionCache(disk_dir=str(disk_dir))
+    await cache.set("key", {"content": "confidential"})
+
+    assert os.stat(disk_dir).st_mode & 0o777 == 0o700
+    assert os.stat(disk_dir / "key.json").st_mode & 0o777 == 0o600
@@ -0,0 +1,123 @@
+import math
+
+import pytest
+from fastapi import HTTPException
+
+import graph_client
+from benchmarks.fake_services import FakeServiceConfig, FakeServices
+from graph_client import GRAPH_BASE_URL, GRAPH_BATCH_SIZE, make_graph_batch
+
+pytestmark = pytest.mark.anyio
+
+
+class ThrottleOnceServices(FakeServices):
+    """Fake services that throttle the first request for each of the given paths"""
+
+    def __init__(self, config: FakeServiceConfig):
+        super().__init__(config)
+        self.throttle_paths = set()
+        self.requests = []
+
+    def graph_response(self, path_and_query: str, base_url: str, if_none_match: str = None) -> tuple:
+        self.requests.append(path_and_query)
+        if path_and_query in self.throttle_paths:
+            self.throttle_paths.discard(path_and_query)
+            return 429, {"Retry-After": f"{self.config.retry_after:g}"}, b'{"error": {"code": "TooManyRequests"}}'
+        return super().graph_response(path_and_query, base_url, if_none_match)
+
+
+@pytest.fixture
+def fake_services():
+    return ThrottleOnceServices(FakeServiceConfig(
+        graph_latency_ms=0, graph_jitter_ms=0, token_latency_ms=0, items_per_drive=20, file_kb=1, retry_after=2
+    ))
+
+
+def _item_paths(fake_services, count: int) -> list:
+    site_id = fake_services.tenant.root_site_id
+    item_ids = [item_id for item_id, (item_site, _, _) in fake_services.tenant.items.items() if item_site == site_id]
+    return [f"/sites/{site_id}/drive/items/{item_id}" for item_id in item_ids[:count]]
+
+
+async def test_results_follow_input_order(fake_services, graph_http_client):
+    paths = _item_paths(fake_services, 15)
+    results = await make_graph_batch([GRAPH_BASE_URL + path for path in paths], "token")
+
+    # The fake answers in shuffled order; results are mapped back by sub-request id
+    assert [result["id"] for result in results] == [path.rsplit("/", 1)[1] for path in paths]
+    assert fake_services.calls["graph_batch"] == 1
+
+
+async def test_item_errors_inside_successful_batch(fake_services, graph_http_client):
+    site_id = fake_services.tenant.root_site_id
+    endpoints = [
+        f"{GRAPH_BASE_URL}/sites/{site_id}",
+        f"{GRAPH_BASE_URL}/sites/no-such-site",
+        f"{GRAPH_BASE_URL}/sites/{site_id}/drives",
+    ]
+    site, missing, drives = await make_graph_batch(endpoints, "token")
+
+    assert site["id"] == site_id
+    assert isinstance(missing, HTTPException)
+    assert missing.status_code == 404
+    assert drives["value"]
+    assert fake_services.calls["graph_batch"] == 1
+
+
+async def test_only_throttled_items_are_retried(fake_services, graph_http_client, monkeypatch):
+    paths = _item_paths(fake_services, 6)
+    fake_services.throttle_paths = {paths[1], paths[4]}
+
+    delays = []
+
+    def record_backoff(attempt, retry_after=None):
+        delays.append(retry_after)
+        return 0.0
+
+    monkeypatch.setattr(graph_client.graph_throttle, "backoff_delay", record_backoff)
+    results = await make_graph_batch([GRAPH_BASE_URL + path for path in paths], "token")
+
+    assert [result["id"] for result in results] == [path.rsplit("/", 1)[1] for path in paths]
+    assert fake_services.calls["graph_batch"] == 2
+    # The retry batch carries only the two throttled sub-requests
+    assert sorted(fake_services.requests[len(paths):]) == sorted([paths[1], paths[4]])
+    assert delays == [2.0]
+
+
+def test_backoff_honors_retry_after():
+    for attempt in range(3):
+        delay = graph_client.graph_throttle.backoff_delay(attempt, 2.0)
+        assert 2.0 <= delay <= 2.2
+
+
+async def test_large_request_sets_are_split_into_batches(fake_services, graph_http_client):
+    paths = _item_paths(fake_services, 45)
+    results = await make_graph_batch([GRAPH_BASE_URL + path for path in paths], "token")
+
+    assert [result["id"] for result in results] == [path.rsplit("/", 1)[1] for path in paths]
+    assert fake_services.calls["graph_batch"] == math.ceil(len(paths) / GRAPH_BATCH_SIZE)
+
+
+async def api_round_trips(api_services, api_client, auth_headers, path: str, **params) -> tuple:
+    """Call an API endpoint and return (Graph round trips, of which $batch calls) it made"""
+    graph, batches = api_services.calls["graph"], api_services.calls["graph_batch"]
+    response = await api_client.get(path, params=params, headers=auth_headers)
+    assert response.status_code == 200
+    return api_services.calls["graph"] - graph, api_services.calls["graph_batch"] - batches
+
+
+async def test_sites_and_navigation_take_one_round_trip(api, api_services, api_client, auth_headers):
+    site_id = api_services.tenant.root_site_id
+    assert await api_round_trips(api_services, api_client, auth_headers, "/api/sharepoint/sites") == (1, 1)
+    assert await api_round_trips(api_services, api_client, auth_headers, "/api/sharepoint/navigation",
+                                 site_id=site_id) == (1, 1)
+
+
+async def test_list_items_are_fetched_in_one_batch(api, api_services, api_client, auth_headers):
+    site_id = api_services.tenant.root_site_id
+    user_lists = [sp_list for sp_list in api_services.tenant.sites[site_id]["_lists"] if not sp_list.get("system")]
+    assert 1 < len(user_lists) <= GRAPH_BATCH_SIZE
+
+    # One request for the lists, then one batch for every list's items
+    assert await api_round_trips(api_services, api_client, auth_headers, "/api/sharepoint/lists",
+                                 site_id=site_id) == (2, 1)
@@ -0,0 +1,156 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import graph_client
+from graph_throttle import CircuitBreaker, GraphThrottle
+
+pytestmark = pytest.mark.anyio
+
+GRAPH_URL = "http://graph.test/v1.0/me"
+
+
+class BlockingTransport(httpx.AsyncBaseTransport):
+    """Transport whose requests hang (or fail) until told otherwise"""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.error = None
+
+    async def handle_async_request(self, request):
+        self.started.set()
+        if self.error is not None:
+            raise self.error
+        await self.release.wait()
+        return httpx.Response(200, json={"id": "me"})
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    transport = BlockingTransport()
+    monkeypatch.setattr(graph_client, "_http_client", httpx.AsyncClient(transport=transport))
+    return transport
+
+
+@pytest.fixture
+def throttle(monkeypatch):
+    # Trips on the first failure and allows a probe as soon as it is open
+    throttle = GraphThrottle(tenant_rate=0, breaker_failures=1, breaker_reset=0)
+    throttle.breaker.record_failure()
+    monkeypatch.setattr(graph_client, "graph_throttle", throttle)
+    return throttle
+
+
+async def test_cancelled_probe_releases_breaker(transport, throttle):
+    probe = asyncio.create_task(graph_client.send_graph_request("GET", GRAPH_URL))
+    await transport.started.wait()
+    assert throttle.breaker.state == CircuitBreaker.HALF_OPEN
+
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    # The abandoned probe counts as a failure instead of blocking every later request
+    assert throttle.breaker.state == CircuitBreaker.OPEN
+    transport.release.set()
+    response = await graph_client.send_graph_request("GET", GRAPH_URL)
+    assert response.status_code == 200
+    assert throttle.breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_probe_failing_unexpectedly_releases_breaker(transport, throttle):
+    transport.error = RuntimeError("unexpected")
+    with pytest.raises(RuntimeError):
+        await graph_client.send_graph_request("GET", GRAPH_URL)
+    assert throttle.breaker.state == CircuitBreaker.OPEN
+
+    transport.error = None
+    transport.release.set()
+    response = await graph_client.send_graph_request("GET", GRAPH_URL)
+    assert response.status_code == 200
+    assert throttle.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_abandon_after_outcome_is_noop():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    allowed, probe_id = breaker.admit()
+    assert allowed and probe_id is not None
+
+    breaker.record_success()
+    breaker.abandon_probe(probe_id)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_stale_probe_cannot_abandon_newer_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    breaker.opened_at -= 60
+    _, first_probe = breaker.admit()
+    breaker.record_failure()
+    breaker.opened_at -= 60
+    _, second_probe = breaker.admit()
+
+    breaker.abandon_probe(first_probe)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one probe at a time while the second is in flight
+    assert breaker.admit() == (False, None)
+
+
+async def test_downloads_are_retried_after_throttling(monkeypatch):
+    statuses = [429, 200]
+
+    def handler(request):
+        return httpx.Response(statuses.pop(0), headers={"Retry-After": "2"}, content=b"file content")
+
+    monkeypatch.setattr(graph_client, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    throttle = GraphThrottle(tenant_rate=0)
+    monkeypatch.setattr(graph_client, "graph_throttle", throttle)
+    delays = []
+    monkeypatch.setattr(throttle, "backoff_delay", lambda attempt, retry_after=None: delays.append(retry_after) or 0.0)
+
+    async with graph_client.stream_graph_content("https://contoso.sharepoint.com/download/1") as response:
+        assert response.status_code == 200
+        assert await response.aread() == b"file content"
+    assert delays == [2.0]
+    assert throttle.stats()["throttled_responses"] == 1 and throttle.retries == 1
+
+
+async def test_downloads_fail_fast_while_breaker_is_open(monkeypatch):
+    requests = []
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: requests.append(request) or httpx.Response(200)))
+    monkeypatch.setattr(graph_client, "_http_client", client)
+    throttle = GraphThrottle(tenant_rate=0, breaker_failures=1, breaker_reset=60)
+    throttle.breaker.record_failure()
+    monkeypatch.setattr(graph_client, "graph_throttle", throttle)
+
+    with pytest.raises(HTTPException) as error:
+        async with graph_client.stream_graph_content(f"{GRAPH_URL}/drive/items/1/content", "token"):
+            pass
+    assert error.value.status_code == 503
+    assert requests == []
+
+
+async def test_file_content_downloads_are_paced(api, api_services, api_client, auth_headers, monkeypatch):
+    throttle = GraphThrottle(tenant_rate=0)
+    monkeypatch.setattr(graph_client, "graph_throttle", throttle)
+    site_id = api_services.tenant.root_site_id
+    file_id = next(item_id for item_id, (item_site, extension, _) in api_services.tenant.items.items()
+                   if item_site == site_id and extension == "txt")
+    acquired = []
+    acquire = throttle.acquire
+    monkeypatch.setattr(throttle, "acquire", lambda cost=1: acquired.append(cost) or acquire(cost))
+
+    downloads = api_services.calls["download"]
+
+    # An unusual max_chars keeps the extraction cache from answering instead of a download
+    response = await api_client.get("/api/sharepoint/file-content", headers=auth_headers,
+                                    params={"site_id": site_id, "file_id": file_id, "max_chars": 123})
+    assert response.status_code == 200
+    assert len(response.json()["file_content"]["content"]) == 123
+    # The metadata request and the download both went through the tenant's limiter
+    assert len(acquired) == 2
+    assert api_services.calls["download"] == downloads + 1
@@ -0,0 +1,45 @@
+import pytest
+
+import metrics
+from metrics import Counter, Histogram, _Metric, graph_endpoint_template
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    # Keep test metrics out of the process-wide registry
+    monkeypatch.setattr(metrics, "_metrics", [])
+
+
+def test_metric_types_must_define_children():
+    class Gauge(_Metric):
+        type_name = "gauge"
+
+    with pytest.raises(TypeError):
+        Gauge("test_gauge", "A gauge without children")
+
+
+def test_render_labelled_metrics():
+    requests = Counter("test_requests_total", "Requests", ("route",))
+    requests.labels("/api/user").inc()
+    requests.labels("/api/user").inc(2)
+    latency = Histogram("test_latency_seconds", "Latency", buckets=(0.1, 1.0))
+    latency.observe(0.5)
+
+    assert metrics.render_metrics().splitlines()[:10] == [
+        "# HELP test_requests_total Requests",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{route="/api/user"} 3.0',
+        "# HELP test_latency_seconds Latency",
+        "# TYPE test_latency_seconds histogram",
+        'test_latency_seconds_bucket{le="0.1"} 0',
+        'test_latency_seconds_bucket{le="1.0"} 1',
+        'test_latency_seconds_bucket{le="+Inf"} 1',
+        "test_latency_seconds_sum 0.5",
+        "test_latency_seconds_count 1",
+    ]
+
+
+def test_graph_endpoint_template():
+    base_url = "https://graph.microsoft.com/v1.0"
+    url = f"{base_url}/sites/contoso.sharepoint.com,1,2/drives/b!abc/root/search(q='x')?$select=id"
+    assert graph_endpoint_template(url, base_url) == "/sites/{id}/drives/{id}/root/search()"
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from token_cache import OboTokenCache, hash_assertion
+from token_validation import ParsedToken
+
+pytestmark = pytest.mark.anyio
+
+GRAPH_SCOPES = ["https://graph.microsoft.com/Sites.Read.All"]
+
+
+def parsed_token(services, user: int) -> ParsedToken:
+    raw = services.mint_user_token(user)
+    claims = services.user_claims(user)
+    return ParsedToken(raw=raw, claims=claims, audience=claims["aud"], audience_valid=True,
+                       assertion_hash=hash_assertion(raw))
+
+
+async def test_token_caches_stay_bounded_across_users(api, api_services, api_client, monkeypatch):
+    monkeypatch.setattr(api, "obo_token_cache", OboTokenCache(max_entries=5))
+    for user in range(20):
+        assert await api.exchange_token_via_obo(parsed_token(api_services, user), GRAPH_SCOPES)
+
+    # Only the bounded per-user cache keeps tokens; MSAL's own cache holds nothing
+    assert len(api.obo_token_cache._entries) == 5
+    assert api.obo_token_cache.evictions == 15
+    assert not any(api.msal_app.token_cache._cache.values())
+
+
+async def test_cached_token_is_reused(api, api_services, api_client):
+    token = parsed_token(api_services, 1)
+    exchanges = api_services.calls["token"]
+    first = await api.exchange_token_via_obo(token, GRAPH_SCOPES)
+    second = await api.exchange_token_via_obo(token, GRAPH_SCOPES)
+
+    assert first == second
+    assert api_services.calls["token"] == exchanges + 1
+
+
+async def test_concurrent_exchanges_share_one_token_request(api, api_services, api_client):
+    token = parsed_token(api_services, 2)
+    exchanges = api_services.calls["token"]
+    results = await asyncio.gather(*(api.exchange_token_via_obo(token, GRAPH_SCOPES) for _ in range(10)))
+
+    assert len(set(results)) == 1
+    assert api_services.calls["token"] == exchanges + 1
+    assert not api._obo_inflight
+
+
+async def test_cancelled_caller_does_not_cancel_shared_exchange(api, api_services, api_client, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    acquire = api.msal_app.acquire_token_on_behalf_of
+
+    def slow_acquire(**kwargs):
+        started.set()
+        release.wait(5)
+        return acquire(**kwargs)
+
+    monkeypatch.setattr(api.msal_app, "acquire_token_on_behalf_of", slow_acquire)
+    token = parsed_token(api_services, 3)
+    first = asyncio.create_task(api.exchange_token_via_obo(token, GRAPH_SCOPES))
+    second = asyncio.create_task(api.exchange_token_via_obo(token, GRAPH_SCOPES))
+    await asyncio.to_thread(started.wait, 5)
+
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    release.set()
+
+    # The remaining caller still gets the token, and it is cached for later requests
+    graph_token = await second
+    assert await api.exchange_token_via_obo(token, GRAPH_SCOPES) == graph_token
+    assert not api._obo_inflight
+
+
+async def test_failed_exchange_is_shared_and_not_remembered(api, api_services, api_client, monkeypatch):
+    calls = []
+
+    def failing_acquire(**kwargs):
+        calls.append(kwargs)
+        return {"error": "invalid_grant", "error_description": "AADSTS50013: Assertion failed signature validation."}
+
+    monkeypatch.setattr(api.msal_app, "acquire_token_on_behalf_of", failing_acquire)
+    token = parsed_token(api_services, 4)
+    results = await asyncio.gather(*(api.exchange_token_via_obo(token, GRAPH_SCOPES) for _ in range(3)),
+                                   return_exceptions=True)
+    assert all(isinstance(result, HTTPException) and result.status_code == 401 for result in results)
+    assert len(calls) == 1
+
+    # The next request tries again rather than replaying the failure
+    with pytest.raises(HTTPException):
+        await api.exchange_token_via_obo(token, GRAPH_SCOPES)
+    assert len(calls) == 2
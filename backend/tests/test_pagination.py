@@ -0,0 +1,72 @@
+import pytest
+from fastapi import HTTPException
+
+from graph_client import GRAPH_BASE_URL, decode_cursor, encode_cursor, iter_graph_items, iter_graph_pages
+
+pytestmark = pytest.mark.anyio
+
+
+def children_url(fake_services) -> str:
+    drive_id = fake_services.tenant.sites[fake_services.tenant.root_site_id]["_drives"][0]["id"]
+    return f"{GRAPH_BASE_URL}/drives/{drive_id}/root/children"
+
+
+async def test_pages_follow_next_link(fake_services, graph_http_client):
+    pages = [page async for page in iter_graph_pages(children_url(fake_services), "token", page_size=7)]
+    assert [len(page["value"]) for page in pages] == [7, 7, 6]
+    assert "@odata.nextLink" not in pages[-1]
+    assert fake_services.calls["graph"] == 3
+
+
+async def test_paging_stops_at_max_items(fake_services, graph_http_client):
+    items = [item async for item in iter_graph_items(children_url(fake_services), "token", page_size=5, max_items=8)]
+    assert len(items) == 8
+    assert fake_services.calls["graph"] == 2
+
+
+def test_cursor_round_trip():
+    next_link = f"{GRAPH_BASE_URL}/drives/d/root/children?$top=5&$skiptoken=5"
+    cursor = encode_cursor(next_link, drive_name="Documents", site_id="site")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (next_link, {"drive_name": "Documents", "site_id": "site"})
+    assert encode_cursor(None, site_id="site") is None
+
+
+@pytest.mark.parametrize("next_link", [
+    "https://attacker.example/collect",
+    GRAPH_BASE_URL + ".attacker.example/collect",
+    GRAPH_BASE_URL.replace("http", "file", 1) + "/me",
+    ["not", "a", "url"],
+])
+def test_cursor_must_point_at_graph(next_link):
+    # Cursors are not signed, so clients can encode any link themselves
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(encode_cursor(next_link))
+    assert error.value.status_code == 400
+
+
+def test_malformed_cursor():
+    with pytest.raises(HTTPException) as error:
+        decode_cursor("not-base64-json")
+    assert error.value.status_code == 400
+
+
+async def test_library_cursor_pages_through_a_drive(api, api_services, api_client, auth_headers):
+    site_id = api_services.tenant.root_site_id
+    first = (await api_client.get("/api/sharepoint/libraries", params={"site_id": site_id, "limit": 5},
+                                  headers=auth_headers)).json()
+    drive_id = api_services.tenant.sites[site_id]["_drives"][0]["id"]
+    cursor = first["next_cursors"][drive_id]
+
+    graph_calls = api_services.calls["graph"]
+    foreign = encode_cursor("https://attacker.example/collect")
+    response = await api_client.get("/api/sharepoint/libraries", params={"cursor": foreign}, headers=auth_headers)
+    assert response.status_code == 400
+    assert api_services.calls["graph"] == graph_calls
+
+    second = (await api_client.get("/api/sharepoint/libraries", params={"cursor": cursor, "limit": 5},
+                                   headers=auth_headers)).json()
+    first_ids = {entry["id"] for entry in first["all_files"] if entry["drive_name"] == second["drive_name"]}
+    second_ids = {entry["id"] for entry in second["all_files"]}
+    assert len(second_ids) == 5
+    assert not first_ids & second_ids
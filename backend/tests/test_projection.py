@@ -0,0 +1,57 @@
+import pytest
+
+from projection import expand_fields, parse_fields, project, with_select
+
+pytestmark = pytest.mark.anyio
+
+
+def test_with_select():
+    assert with_select("https://graph/sites/root", "id,name") == "https://graph/sites/root?$select=id,name"
+    assert (with_select("https://graph/lists/l/items?$top=5", "id", "fields")
+            == "https://graph/lists/l/items?$top=5&$select=id&$expand=fields")
+    # A URL that already selects (e.g. a nextLink) is left alone
+    assert with_select("https://graph/sites?$select=id", "name") == "https://graph/sites?$select=id"
+
+
+def test_expand_fields():
+    assert expand_fields(None) == "fields"
+    assert expand_fields("*") == "fields"
+    assert expand_fields("Title,Status") == "fields($select=Title,Status)"
+
+
+def test_parse_fields():
+    assert parse_fields(None) is None
+    assert parse_fields("name, webUrl,file/mimeType") == {"name": None, "webUrl": None, "file": {"mimeType": None}}
+    # Selecting a property whole wins over selecting parts of it
+    assert parse_fields("file,file/mimeType") == {"file": None}
+    assert parse_fields(",/") is None
+
+
+def test_project_trims_resources_and_keeps_envelope():
+    body = {
+        "message": "ok",
+        "libraries": [{"id": "d1", "name": "Documents", "quota": {"used": 1}}],
+        "all_files": [{"id": "f1", "name": "a.txt", "file": {"mimeType": "text/plain", "hashes": {}}, "size": 3}],
+    }
+    projected = project(body, parse_fields("name,file/mimeType"))
+
+    assert projected == {
+        "message": "ok",
+        "libraries": [{"id": "d1", "name": "Documents"}],
+        "all_files": [{"id": "f1", "name": "a.txt", "file": {"mimeType": "text/plain"}}],
+    }
+    # Bodies may be shared with the response cache, so they are never modified
+    assert body["libraries"][0]["quota"] == {"used": 1}
+    assert project(body, None) is body
+
+
+async def test_list_items_keep_all_columns_by_default(api, api_services, api_client, auth_headers):
+    site_id = api_services.tenant.root_site_id
+    response = await api_client.get("/api/sharepoint/lists", params={"site_id": site_id}, headers=auth_headers)
+    item = next(entry["items"][0] for entry in response.json()["lists_with_items"] if entry["items"])
+    assert set(item["fields"]) == {"Title", "Status", "Owner"}
+
+    response = await api_client.get("/api/sharepoint/lists", params={"site_id": site_id, "columns": "Title"},
+                                    headers=auth_headers)
+    item = next(entry["items"][0] for entry in response.json()["lists_with_items"] if entry["items"])
+    assert set(item["fields"]) == {"Title"}
@@ -0,0 +1,65 @@
+import pytest
+
+import graph_client
+from graph_client import GRAPH_BASE_URL, make_graph_batch, make_graph_request
+from response_cache import GraphResponseCache, cache_partition
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def response_cache(monkeypatch):
+    cache = GraphResponseCache(GRAPH_BASE_URL, ttl=60)
+    monkeypatch.setattr(graph_client, "response_cache", cache)
+    return cache
+
+
+async def test_fresh_responses_are_served_from_cache(fake_services, graph_http_client, response_cache):
+    url = f"{GRAPH_BASE_URL}/sites/{fake_services.tenant.root_site_id}"
+    first = await make_graph_request(url, "token-a")
+    assert await make_graph_request(url, "token-a") == first
+    assert await make_graph_batch([url], "token-a") == [first]
+    assert fake_services.calls["graph"] == 1
+
+
+async def test_not_modified_reuses_cached_body(fake_services, graph_http_client, response_cache):
+    url = f"{GRAPH_BASE_URL}/sites/{fake_services.tenant.root_site_id}"
+    await make_graph_request(url, "token-a")
+    entry = await response_cache.lookup(cache_partition("token-a"), url)
+    assert entry.etag
+
+    # Expire the entry and mark its body, so only a 304 can return the marker
+    entry.expires_at = 0
+    entry.body = {**entry.body, "cached": True}
+    assert (await make_graph_request(url, "token-a"))["cached"] is True
+    assert fake_services.calls["graph"] == 2
+    assert response_cache.revalidations == 1
+    assert entry.fresh
+
+    # Stale entries are revalidated inside batches the same way
+    entry.expires_at = 0
+    assert (await make_graph_batch([url], "token-a"))[0]["cached"] is True
+    assert response_cache.revalidations == 2
+
+
+async def test_responses_are_partitioned_per_token(fake_services, graph_http_client, response_cache):
+    url = f"{GRAPH_BASE_URL}/me"
+    await make_graph_request(url, "token-a")
+    await make_graph_request(url, "token-b")
+    assert fake_services.calls["graph"] == 2
+
+    await make_graph_request(url, "token-a")
+    await make_graph_request(url, "token-b")
+    assert fake_services.calls["graph"] == 2
+    assert response_cache.stats()["entries"] == 2
+
+
+async def test_other_paths_bypass_the_cache(fake_services, graph_http_client, response_cache):
+    drive_id = fake_services.tenant.sites[fake_services.tenant.root_site_id]["_drives"][0]["id"]
+    url = f"{GRAPH_BASE_URL}/drives/{drive_id}/root/children"
+    assert not response_cache.is_cacheable(url)
+
+    await make_graph_request(url, "token-a")
+    await make_graph_request(url, "token-a")
+    assert fake_services.calls["graph"] == 2
+    assert response_cache.stats()["entries"] == 0
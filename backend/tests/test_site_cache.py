@@ -0,0 +1,81 @@
+import pytest
+from fastapi import HTTPException
+
+import site_cache
+from site_cache import SiteResolver
+
+pytestmark = pytest.mark.anyio
+
+HR_URL = "https://contoso.sharepoint.com/sites/hr"
+HR_SITE_ID = "contoso.sharepoint.com,hr-site,hr-web"
+
+# Sites each user's (permission-trimmed) sites?search=* returns
+VISIBLE_SITES = {
+    "token-outsider": [],
+    "token-hr": [{"id": HR_SITE_ID, "webUrl": HR_URL}],
+}
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    calls = {"search": 0}
+
+    async def make_graph_request(endpoint, graph_token):
+        if "/sites/root" in endpoint:
+            return {"id": "contoso.sharepoint.com,root-site,root-web"}
+        # Direct hostname:/path addressing fails, forcing the search index
+        raise HTTPException(status_code=404, detail="itemNotFound")
+
+    async def iter_graph_items(endpoint, graph_token, page_size=None, max_items=None):
+        calls["search"] += 1
+        for site in VISIBLE_SITES[graph_token]:
+            yield site
+
+    monkeypatch.setattr(site_cache, "make_graph_request", make_graph_request)
+    monkeypatch.setattr(site_cache, "iter_graph_items", iter_graph_items)
+    return calls
+
+
+async def test_url_resolution_is_per_user(graph):
+    resolver = SiteResolver()
+
+    # A user who cannot see the site gets the value back unresolved (and negatively cached)
+    assert await resolver.resolve(HR_URL, "token-outsider", "contoso", "contoso:outsider") == HR_URL
+    # That must not hide the site from a user whose search does return it
+    assert await resolver.resolve(HR_URL, "token-hr", "contoso", "contoso:hr") == HR_SITE_ID
+    assert graph["search"] == 2
+
+    # Both answers are cached for their own user
+    assert await resolver.resolve(HR_URL, "token-outsider", "contoso", "contoso:outsider") == HR_URL
+    assert await resolver.resolve(HR_URL, "token-hr", "contoso", "contoso:hr") == HR_SITE_ID
+    assert graph["search"] == 2
+
+
+async def test_root_site_is_shared_by_tenant(graph):
+    resolver = SiteResolver()
+    first = await resolver.resolve(None, "token-outsider", "contoso", "contoso:outsider")
+    second = await resolver.resolve("root", "token-hr", "contoso", "contoso:hr")
+    assert first == second == "contoso.sharepoint.com,root-site,root-web"
+    assert resolver.stats()["hits"] == 1
+
+
+async def test_url_indexes_are_bounded(graph):
+    resolver = SiteResolver(max_url_indexes=2)
+    for user in ("a", "b", "c"):
+        await resolver.resolve(HR_URL, "token-hr", "contoso", f"contoso:{user}")
+
+    # The least recently used index is evicted together with its build lock
+    assert list(resolver._url_indexes) == ["contoso:b", "contoso:c"]
+    assert set(resolver._index_locks) == {"contoso:b", "contoso:c"}
+    assert resolver.stats()["indexed_users"] == 2
+
+
+async def test_expired_url_indexes_are_removed(graph):
+    resolver = SiteResolver(max_url_indexes=10)
+    await resolver.resolve(HR_URL, "token-hr", "contoso", "contoso:a")
+    expires_at, url_index = resolver._url_indexes["contoso:a"]
+    resolver._url_indexes["contoso:a"] = (expires_at - resolver.ttl, url_index)
+
+    await resolver.resolve(HR_URL, "token-hr", "contoso", "contoso:b")
+    assert list(resolver._url_indexes) == ["contoso:b"]
+    assert "contoso:a" not in resolver._index_locks
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from streaming import encode_event, event_stream_response
+
+pytestmark = pytest.mark.anyio
+
+
+def parse_ndjson(body: str) -> list:
+    return [(line["event"], line["data"]) for line in map(json.loads, body.splitlines())]
+
+
+def parse_sse(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return events
+
+
+def test_encode_event():
+    assert encode_event("sse", "drive", {"id": 1}) == b'event: drive\ndata: {"id":1}\n\n'
+    assert encode_event("ndjson", "drive", {"id": 1}) == b'{"event":"drive","data":{"id":1}}\n'
+
+
+async def test_failures_after_start_are_reported_in_band():
+    async def events():
+        yield "drive", {"id": "d1", "secret": "trimmed"}
+        raise HTTPException(status_code=429, detail="Too many requests")
+
+    response = event_stream_response(events(), "ndjson", fields={"name": None})
+    body = b"".join([chunk async for chunk in response.body_iterator]).decode()
+
+    assert parse_ndjson(body) == [("drive", {"id": "d1"}), ("error", {"status_code": 429, "detail": "Too many requests"})]
+    assert response.headers["cache-control"] == "no-cache"
+
+
+async def test_libraries_stream_as_ndjson(api, api_services, api_client, auth_headers):
+    site_id = api_services.tenant.root_site_id
+    drives = api_services.tenant.sites[site_id]["_drives"]
+    response = await api_client.get("/api/sharepoint/libraries", headers=auth_headers,
+                                    params={"site_id": site_id, "stream": "ndjson", "limit": 3})
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    events = parse_ndjson(response.text)
+    assert [event for event, _ in events] == ["libraries"] + ["drive"] * len(drives) + ["summary"]
+    assert {data["drive_id"] for event, data in events if event == "drive"} == {drive["id"] for drive in drives}
+    assert all(len(data["files"]) == 3 for event, data in events if event == "drive")
+    assert events[-1][1]["files_count"] == 3 * len(drives)
+
+
+async def test_lists_stream_as_sse(api, api_services, api_client, auth_headers):
+    site_id = api_services.tenant.root_site_id
+    response = await api_client.get("/api/sharepoint/lists", headers=auth_headers,
+                                    params={"site_id": site_id, "stream": "sse", "columns": "Title"})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert events[0][0] == "lists" and events[-1][0] == "summary"
+    items = [item for event, data in events if event == "list" for item in data["items"]]
+    assert items and all(set(item["fields"]) == {"Title"} for item in items)
+    assert events[-1][1]["items_count"] == len(items)
+
+
+async def test_unknown_stream_format_is_rejected(api, api_client, auth_headers):
+    response = await api_client.get("/api/sharepoint/libraries", params={"stream": "xml"}, headers=auth_headers)
+    assert response.status_code == 422
@@ -0,0 +1,176 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from benchmarks.fake_services import CLIENT_ID, PUBLIC_ENTRA_URL, SIGNING_KEY_ID, TENANT_ID
+from token_validation import JwksCache, TokenValidator
+
+pytestmark = pytest.mark.anyio
+
+JWKS_URL = f"http://login.test/{TENANT_ID}/discovery/v2.0/keys"
+ISSUERS = [f"https://sts.windows.net/{TENANT_ID}/", f"{PUBLIC_ENTRA_URL}/{TENANT_ID}/v2.0"]
+
+
+@pytest.fixture
+def jwks_cache(graph_http_client):
+    return JwksCache(JWKS_URL, min_refetch_interval=60)
+
+
+@pytest.fixture
+def validator(jwks_cache):
+    return TokenValidator(jwks_cache, audience=f"api://{CLIENT_ID}", issuers=ISSUERS, leeway=60)
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unsigned_parts(header: dict, claims: dict) -> str:
+    return _b64(json.dumps(header).encode()) + "." + _b64(json.dumps(claims).encode())
+
+
+async def test_valid_token(fake_services, validator):
+    claims = await validator.validate(fake_services.mint_user_token(1))
+    assert claims["oid"].endswith("000000000001")
+    assert fake_services.calls["jwks"] == 1
+
+
+async def test_bad_signature(fake_services, validator):
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = jwt.encode(fake_services.user_claims(1), other_key, algorithm="RS256", headers={"kid": SIGNING_KEY_ID})
+    with pytest.raises(jwt.InvalidSignatureError):
+        await validator.validate(token)
+
+
+async def test_tampered_claims(fake_services, validator):
+    header, _, signature = fake_services.mint_user_token(1).split(".")
+    claims = {**fake_services.user_claims(1), "oid": "someone-else"}
+    token = header + "." + _b64(json.dumps(claims).encode()) + "." + signature
+    with pytest.raises(jwt.InvalidSignatureError):
+        await validator.validate(token)
+
+
+async def test_wrong_issuer(fake_services, validator):
+    token = fake_services.sign_token({**fake_services.user_claims(1), "iss": f"{PUBLIC_ENTRA_URL}/other-tenant/v2.0"})
+    with pytest.raises(jwt.InvalidIssuerError):
+        await validator.validate(token)
+
+
+async def test_wrong_audience(fake_services, validator):
+    token = fake_services.sign_token({**fake_services.user_claims(1), "aud": "api://another-app"})
+    with pytest.raises(jwt.InvalidAudienceError):
+        await validator.validate(token)
+
+
+async def test_expired_token(fake_services, validator):
+    now = int(time.time())
+    # Expired beyond the allowed clock skew
+    token = fake_services.sign_token({**fake_services.user_claims(1), "iat": now - 7200, "nbf": now - 7200, "exp": now - 120})
+    with pytest.raises(jwt.ExpiredSignatureError):
+        await validator.validate(token)
+
+
+async def test_missing_exp(fake_services, validator):
+    claims = fake_services.user_claims(1)
+    del claims["exp"]
+    with pytest.raises(jwt.MissingRequiredClaimError):
+        await validator.validate(fake_services.sign_token(claims))
+
+
+async def test_alg_none_rejected(fake_services, validator):
+    token = _unsigned_parts({"alg": "none", "typ": "JWT", "kid": SIGNING_KEY_ID}, fake_services.user_claims(1)) + "."
+    with pytest.raises(jwt.InvalidAlgorithmError):
+        await validator.validate(token)
+
+
+async def test_hs256_with_public_key_rejected(fake_services, validator, jwks_cache):
+    # Key confusion: an HMAC "signature" keyed with the published RSA public key
+    await jwks_cache.refresh()
+    public_pem = (await jwks_cache.get_signing_key(SIGNING_KEY_ID)).key.public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    signing_input = _unsigned_parts({"alg": "HS256", "typ": "JWT", "kid": SIGNING_KEY_ID}, fake_services.user_claims(1))
+    signature = hmac.new(public_pem, signing_input.encode(), hashlib.sha256).digest()
+    with pytest.raises(jwt.InvalidAlgorithmError):
+        await validator.validate(signing_input + "." + _b64(signature))
+
+
+async def test_unknown_kid_triggers_single_refetch(fake_services, validator, jwks_cache):
+    await validator.validate(fake_services.mint_user_token(1))
+    assert fake_services.calls["jwks"] == 1
+
+    # The tenant rotates to a new key some time after the set was loaded
+    fake_services.add_signing_key("rotated-key")
+    jwks_cache._last_fetch -= jwks_cache.min_refetch_interval
+    rotated = [fake_services.sign_token(fake_services.user_claims(user), key_id="rotated-key") for user in (2, 3)]
+
+    # Concurrent requests with the new kid share one refetch
+    results = await asyncio.gather(*(validator.validate(token) for token in rotated))
+    assert [claims["sub"] for claims in results] == ["bench-user-2", "bench-user-3"]
+    assert fake_services.calls["jwks"] == 2
+
+    # A kid that is still unknown is rejected without refetching again inside the interval
+    unknown_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = jwt.encode(fake_services.user_claims(4), unknown_key, algorithm="RS256", headers={"kid": "missing-key"})
+    with pytest.raises(jwt.InvalidTokenError, match="Unknown signing key"):
+        await validator.validate(token)
+    assert fake_services.calls["jwks"] == 2
+
+
+async def test_repeat_validation_skips_verification(fake_services, validator, monkeypatch):
+    decodes = []
+    decode = jwt.decode
+    monkeypatch.setattr(jwt, "decode", lambda *args, **kwargs: decodes.append(1) or decode(*args, **kwargs))
+
+    token = fake_services.mint_user_token(1)
+    first = await validator.validate(token)
+    second = await validator.validate(token)
+    assert first == second
+    assert len(decodes) == 1
+
+    # An entry past its token's expiry is dropped and the token verified again
+    token_hash = next(iter(validator._validated))
+    validator._validated[token_hash] = (first, time.time() - validator.leeway - 1)
+    await validator.validate(token)
+    assert len(decodes) == 2
+
+
+async def test_validated_tokens_are_bounded(fake_services, jwks_cache):
+    validator = TokenValidator(jwks_cache, audience=f"api://{CLIENT_ID}", issuers=ISSUERS, cache_size=2)
+    for user in range(3):
+        await validator.validate(fake_services.mint_user_token(user))
+    assert len(validator._validated) == 2
+
+
+async def test_background_refresh_reloads_keys(fake_services, jwks_cache):
+    jwks_cache.refresh_interval = 0.01
+    jwks_cache.start_background_refresh()
+    try:
+        for _ in range(100):
+            if fake_services.calls["jwks"] >= 2:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await jwks_cache.stop_background_refresh()
+
+    assert fake_services.calls["jwks"] >= 2
+    assert SIGNING_KEY_ID in jwks_cache._keys
+    assert jwks_cache._refresh_task is None
+
+
+async def test_api_rejects_forged_tokens(api, api_services, api_client):
+    forged_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    forged = jwt.encode(api_services.user_claims(1), forged_key, algorithm="RS256", headers={"kid": SIGNING_KEY_ID})
+
+    response = await api_client.get("/api/user", headers={"Authorization": f"Bearer {forged}"})
+    assert response.status_code == 401
+    response = await api_client.get("/api/user", headers={"Authorization": f"Bearer {api_services.mint_user_token(1)}"})
+    assert response.status_code == 200
@@ -0,0 +1,122 @@
+"""
+Per-user cache for Graph access tokens obtained through the OBO flow.
+
+Entries are partitioned by a hash of the incoming user assertion plus the
+requested scope set, so a token is only ever returned to the same caller for
+the same scopes. Tokens are reused until shortly before they expire and the
+cache is bounded with LRU eviction.
+
+With a shared backend configured, tokens are also written to (and looked up
+in) that far tier, encrypted, so every worker reuses a token any of them
+obtained.
+
+MSAL's own token cache is replaced by ``NonPersistentTokenCache``: OBO
+exchanges never read it, but would otherwise leave every user's tokens and
+account in it for the life of the process.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import msal
+
+from cache_backend import CacheNamespace
+
+
+def hash_assertion(user_assertion: str) -> str:
+    """Return a stable, non-reversible identifier for a user assertion"""
+    return hashlib.sha256(user_assertion.encode("utf-8")).hexdigest()
+
+
+class NonPersistentTokenCache(msal.TokenCache):
+    """MSAL token cache that discards every write, for apps whose tokens are cached elsewhere"""
+
+    def add(self, event, **kwargs):
+        pass
+
+    def modify(self, credential_type, old_entry, new_key_value_pairs=None):
+        pass
+
+
+class OboTokenCache:
+    """Bounded LRU/TTL cache of OBO access tokens with an optional shared far tier"""
+
+    def __init__(self, max_entries: int = 1000, refresh_skew: int = 300, shared: Optional[CacheNamespace] = None):
+        self.max_entries = max_entries
+        # Treat tokens as expired this many seconds early so callers never get a stale token
+        self.refresh_skew = refresh_skew
+        self.shared = shared
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(assertion_hash: str, scopes: list) -> str:
+        """Build the cache key for an assertion hash and scope set"""
+        return f"{assertion_hash}:{' '.join(sorted(set(scopes)))}"
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return a cached access token, or None if missing or about to expire"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] - self.refresh_skew <= time.time():
+            del self._entries[key]
+            self.evictions += 1
+            entry = None
+
+        if entry is None and self.shared is not None:
+            stored = await self.shared.get(key)
+            if stored is not None and stored[1] - self.refresh_skew > time.time():
+                entry = tuple(stored)
+                self._store(key, entry)
+                self.shared_hits += 1
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    async def set(self, key: str, result: dict):
+        """Store the access token from an MSAL token response"""
+        if "expires_on" in result:
+            expires_at = float(result["expires_on"])
+        else:
+            expires_at = time.time() + float(result.get("expires_in", 0))
+
+        ttl = expires_at - self.refresh_skew - time.time()
+        if ttl <= 0:
+            return
+
+        self._store(key, (result["access_token"], expires_at))
+        if self.shared is not None:
+            await self.shared.set(key, [result["access_token"], expires_at], ttl)
+
+    def _store(self, key: str, entry: tuple):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all locally cached tokens"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "shared": self.shared.stats() if self.shared is not None else None
+        }
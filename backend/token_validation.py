@@ -0,0 +1,163 @@
+"""
+Cryptographic validation of incoming access tokens.
+
+Signing keys are held in an in-process JWKS cache that is refreshed in the
+background and refetched on an unknown ``kid``, so validating a request does
+not need a network call. Successfully validated tokens are remembered in a
+small LRU keyed by token hash, making repeat validation of the same token
+near-free until it expires.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import jwt
+
+from app_logging import get_logger
+from graph_client import get_http_client
+
+logger = get_logger("auth")
+
+
+@dataclass
+class ParsedToken:
+    """Request-scoped view of a validated bearer token, parsed once per request"""
+    raw: str
+    claims: dict
+    audience: Optional[str]
+    audience_valid: bool
+    assertion_hash: str
+
+    @property
+    def tenant_id(self) -> Optional[str]:
+        return self.claims.get("tid")
+
+    @property
+    def user_key(self) -> str:
+        """Stable per-user identifier for partitioning user-scoped caches"""
+        return f"{self.tenant_id}:{self.claims.get('oid') or self.claims.get('sub')}"
+
+
+class JwksCache:
+    """In-process cache of the tenant's token signing keys"""
+
+    def __init__(self, jwks_url: str, refresh_interval: int = 3600, min_refetch_interval: int = 60):
+        self.jwks_url = jwks_url
+        self.refresh_interval = refresh_interval
+        # Rate limit refetches triggered by unknown key ids
+        self.min_refetch_interval = min_refetch_interval
+        self._keys = {}
+        self._last_fetch = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def refresh(self, min_age: float = 0):
+        """Fetch the current key set unless it was fetched less than min_age seconds ago"""
+        async with self._lock:
+            # Another caller may have refreshed while we waited for the lock
+            if min_age and time.time() - self._last_fetch < min_age:
+                return
+
+            response = await get_http_client().get(self.jwks_url)
+            response.raise_for_status()
+
+            keys = {}
+            for key_data in response.json().get("keys", []):
+                try:
+                    key = jwt.PyJWK(key_data)
+                except jwt.PyJWKError:
+                    # Skip keys with unsupported algorithms or key types
+                    continue
+                if key.key_id:
+                    keys[key.key_id] = key
+
+            self._keys = keys
+            self._last_fetch = time.time()
+            logger.info("Loaded %d signing keys from JWKS endpoint", len(keys))
+
+    async def get_signing_key(self, kid: str) -> jwt.PyJWK:
+        """Return the signing key for a key id, refetching once if it is unknown"""
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+
+        await self.refresh(min_age=self.min_refetch_interval)
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+
+        raise jwt.InvalidTokenError(f"Unknown signing key: {kid}")
+
+    def start_background_refresh(self):
+        """Start refreshing the key set periodically on the running event loop"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop_background_refresh(self):
+        """Cancel the background refresh task"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("JWKS refresh failed: %s", e)
+            await asyncio.sleep(self.refresh_interval)
+
+
+class TokenValidator:
+    """Validates signature, issuer, audience and expiry of access tokens"""
+
+    def __init__(self, jwks_cache: JwksCache, audience: str, issuers: list,
+                 leeway: int = 60, cache_size: int = 1024):
+        self.jwks_cache = jwks_cache
+        self.audience = audience
+        self.issuers = issuers
+        self.leeway = leeway
+        self.cache_size = cache_size
+        self._validated = OrderedDict()
+
+    async def validate(self, token: str, token_hash: Optional[str] = None) -> dict:
+        """Return the verified claims of a token, raising jwt.InvalidTokenError if it is not valid"""
+        if token_hash is None:
+            token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+        cached = self._validated.get(token_hash)
+        if cached is not None:
+            claims, expires_at = cached
+            if expires_at + self.leeway > time.time():
+                self._validated.move_to_end(token_hash)
+                return claims
+            del self._validated[token_hash]
+
+        header = jwt.get_unverified_header(token)
+        signing_key = await self.jwks_cache.get_signing_key(header.get("kid"))
+
+        claims = jwt.decode(
+            token,
+            signing_key.key,
+            algorithms=["RS256"],
+            audience=self.audience,
+            leeway=self.leeway,
+            options={"require": ["exp", "iss", "aud"]}
+        )
+
+        # Tenants issue v1 and v2 tokens with different issuer formats
+        if claims["iss"] not in self.issuers:
+            raise jwt.InvalidIssuerError("Invalid issuer")
+
+        self._validated[token_hash] = (claims, claims["exp"])
+        while len(self._validated) > self.cache_size:
+            self._validated.popitem(last=False)
+
+        return claims
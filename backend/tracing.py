@@ -0,0 +1,217 @@
+"""
+Lightweight request tracing compatible with OpenTelemetry / W3C Trace Context.
+
+Spans form a tree through a ``ContextVar``, so nested ``start_span`` blocks and
+tasks spawned from a request (``gather``, ``create_task``) are parented
+automatically. Trace and span IDs use the OpenTelemetry formats and an
+incoming ``traceparent`` header is continued, so spans can be correlated with
+the caller's trace.
+
+Finished spans are handed to pluggable exporters: ``LogSpanExporter`` writes
+them as structured log lines and ``InMemorySpanExporter`` keeps them for tests.
+With no exporter configured, spans are no-ops and cost almost nothing.
+"""
+import os
+import re
+import secrets
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from app_logging import get_logger
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()
+TRACE_MEMORY_MAX_SPANS = int(os.getenv("TRACE_MEMORY_MAX_SPANS", "10000"))
+
+_TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_exporters = []
+
+
+class Span:
+    """A timed operation with attributes, belonging to a trace"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Optional[dict] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1_000_000
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time_unix_nano": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+
+class _NoopSpan:
+    """Stand-in used when tracing is disabled"""
+
+    trace_id = span_id = parent_id = traceparent = None
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class InMemorySpanExporter:
+    """Keeps finished spans in memory, for tests and local debugging"""
+
+    def __init__(self, max_spans: int = 10000):
+        self._spans = deque(maxlen=max_spans)
+
+    def export(self, span: Span):
+        self._spans.append(span)
+
+    def get_finished_spans(self, trace_id: Optional[str] = None) -> list:
+        return [span for span in self._spans if trace_id is None or span.trace_id == trace_id]
+
+    def clear(self):
+        self._spans.clear()
+
+
+class LogSpanExporter:
+    """Writes each finished span as a structured log line in the "trace" category"""
+
+    def __init__(self):
+        self._logger = get_logger("trace")
+
+    def export(self, span: Span):
+        self._logger.info("span %s", span.name, extra={"span": span.to_dict()})
+
+
+def add_exporter(exporter):
+    """Register an exporter; spans are only recorded once at least one is configured"""
+    _exporters.append(exporter)
+    return exporter
+
+
+def remove_exporter(exporter):
+    if exporter in _exporters:
+        _exporters.remove(exporter)
+
+
+def current_span():
+    """Return the active span, or a no-op span outside any trace"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def parse_traceparent(header: Optional[str]) -> tuple:
+    """Return (trace_id, parent_span_id) from a W3C traceparent header, or (None, None)"""
+    match = _TRACEPARENT_PATTERN.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+@contextmanager
+def start_span(name: str, attributes: Optional[dict] = None, new_trace: bool = False,
+               trace_id: Optional[str] = None, parent_id: Optional[str] = None):
+    """
+    Run a block inside a span that is a child of the current one.
+
+    ``new_trace`` starts an unrelated trace (e.g. for background work spawned
+    by a request); ``trace_id``/``parent_id`` continue a remote trace.
+    """
+    if not _exporters:
+        yield NOOP_SPAN
+        return
+
+    parent = None if new_trace else _current_span.get()
+    if parent is not None:
+        span = Span(name, parent.trace_id, parent.span_id, attributes)
+    else:
+        span = Span(name, trace_id or secrets.token_hex(16), parent_id, attributes)
+
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end_ns = time.time_ns()
+        for exporter in _exporters:
+            try:
+                exporter.export(span)
+            except Exception:
+                pass
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _exporters:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        trace_id, parent_id = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+
+        with start_span(f"{scope['method']} {scope['path']}", trace_id=trace_id, parent_id=parent_id) as span:
+            span.set_attribute("http.method", scope["method"])
+
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status = "error"
+                    # Let clients quote the trace when reporting a slow or failed request
+                    message["headers"] = list(message.get("headers", [])) + [(b"traceparent", span.traceparent.encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    span.name = f"{scope['method']} {route.path}"
+                    span.set_attribute("http.route", route.path)
+
+
+if TRACE_EXPORTER == "log":
+    add_exporter(LogSpanExporter())
+elif TRACE_EXPORTER == "memory":
+    add_exporter(InMemorySpanExporter(TRACE_MEMORY_MAX_SPANS))
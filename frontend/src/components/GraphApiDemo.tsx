@@ -83,6 +83,26 @@ const graphServices: GraphApiService[] = [
         endpoint: '/api/sharepoint/recent',
         description: 'Get recently accessed SharePoint files',
         icon: '🕒'
+    },    {
+        name: 'SharePoint Dashboard',
+        endpoint: '/api/dashboard',
+        description: 'Get the profile, sites, libraries, lists, pages, navigation and recent files in one request with a single token exchange',
+        icon: '📊',
+        requiresParameters: false,
+        parameters: [
+            {
+                name: 'sections',
+                description: 'Comma-separated sections to include (optional - defaults to all)',
+                required: false,
+                placeholder: 'e.g., graph_user,sites,recent'
+            },
+            {
+                name: 'site_id',
+                description: 'SharePoint site ID or domain (optional - defaults to root site)',
+                required: false,
+                placeholder: 'e.g., contoso.sharepoint.com'
+            }
+        ]
     },    {
         name: 'File Content Reader',
         endpoint: '/api/sharepoint/file-content',